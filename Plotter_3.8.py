@@ -7,7 +7,6 @@ Update version 3 on Wed Oct 01 2025
 @author: Clara & Thomas
 """
 
-import numpy as np
 import matplotlib as mpl
 
 # --- Keep only Ctrl+S in Matplotlib keymaps ---
@@ -19,13 +18,35 @@ for _k in (
 ):
     mpl.rcParams[_k] = []
 
-import matplotlib.pyplot as plt
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
-import os, pandas as pd, random, json
+from tkinter import ttk, filedialog, messagebox, simpledialog
+import os, json, base64
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
 from matplotlib.figure import Figure
-from matplotlib import ticker as mticker
+from matplotlib.widgets import SpanSelector
+
+# GUI-free plotting core (plotter/ package next to this script)
+from plotter import (default_commands_text, parse_line_styles, compile_commands,
+                     compile_mapping, apply_plot_style, apply_physical_size_from_cm,
+                     draw_plot, update_data_curves, export_figure,
+                     DatasetCache, FileWatcher, FolderFollower, draw_history,
+                     format_memory_report)
+from plotter.relink import PathValidator, get_index, auto_relink, with_sheet
+from plotter.listmodel import FileListModel
+from plotter.view import ViewSlicer
+from plotter.overview import OverviewNavigator
+from plotter.panels import PanelFigure
+from plotter.commands import panel_grid
+from plotter.fonts import resolve_font, warm_fonts
+from plotter.presets import list_presets, preset_text, save_preset
+from plotter.options import SPECS
+from plotter.project import BUNDLE_EXT, is_bundle, save_bundle, load_bundle
+from plotter.convert import BatchConverter, format_report
+from plotter.export import export_many
+from plotter.thumbs import Thumbnailer, THUMB_SIZE
+from plotter.peakfit import SeriesFit, write_csv
+from plotter.readers import (DATA_FILETYPES, REF_FILETYPES, split_sheet,
+                             reference_label, excel_sheet_paths)
 
 
 def apply_style(root):
@@ -140,7 +161,52 @@ class RelinkDialog(tk.Toplevel):
         return self._lastdir
 
 
-class PrefixChangeDialog(tk.Toplevel):
+class AsyncExistsMixin:
+    """
+    Non-blocking 'Exists?' column for the relink previews.
+    Paths are checked against background folder indexes or in a thread pool;
+    rows show '…' until the answer arrives, then the preview refreshes itself.
+    """
+    def _init_validator(self, refresh):
+        self._validator = PathValidator()
+        self._refresh_cb = refresh
+        self._pending_job = None
+        self.tv.tag_configure("wait", foreground="#666666")
+
+    def _exists_cell(self, path):
+        """Return (text, tag) for the Exists? column; schedules a refresh if unknown."""
+        st = self._validator.status(path) if path else False
+        if st is None:
+            self._schedule_pending_refresh()
+            return "…", "wait"
+        return ("Yes", "ok") if st else ("No", "ko")
+
+    def _index_folder(self, folder):
+        """Index a browsed folder in the background: later checks under it are in-memory."""
+        if folder and os.path.isdir(folder):
+            self._validator.add_index(get_index(folder))
+
+    def _schedule_pending_refresh(self):
+        if self._pending_job is None:
+            self._pending_job = self.after(150, self._on_pending_tick)
+
+    def _on_pending_tick(self):
+        self._pending_job = None
+        self._refresh_cb()
+
+    def destroy(self):
+        if getattr(self, "_pending_job", None) is not None:
+            try:
+                self.after_cancel(self._pending_job)
+            except Exception:
+                pass
+            self._pending_job = None
+        if getattr(self, "_validator", None) is not None:
+            self._validator.close()
+        super().destroy()
+
+
+class PrefixChangeDialog(AsyncExistsMixin, tk.Toplevel):
     """
     Dialog to handle prefix-based path correction.
     - Displays the old common prefix (read-only)
@@ -180,6 +246,7 @@ class PrefixChangeDialog(tk.Toplevel):
                 initialdir=self._new_base_var.get() or os.path.expanduser("~")
             )
             if d:
+                self._index_folder(d)
                 self._new_base_var.set(d)
                 self._refresh_preview()
 
@@ -199,6 +266,7 @@ class PrefixChangeDialog(tk.Toplevel):
         # Color tags
         self.tv.tag_configure("ok", foreground="#0b7a00")
         self.tv.tag_configure("ko", foreground="#b00020")
+        self._init_validator(self._refresh_preview)
 
         # --- Buttons
         btns = ttk.Frame(self)
@@ -237,10 +305,9 @@ class PrefixChangeDialog(tk.Toplevel):
             oldp = row["old_path"]
             rel = self._relpath_safe(oldp, self._old_base)
             newp = os.path.normpath(os.path.join(new_base, rel)) if new_base else ""
-            exists = os.path.exists(newp) if newp else False
-            tag = "ok" if exists else "ko"
+            text, tag = self._exists_cell(newp)
             self.tv.insert("", "end",
-                           values=(("DATA" if kind == "data" else "REF"), rel, newp, ("Yes" if exists else "No")),
+                           values=(("DATA" if kind == "data" else "REF"), rel, newp, text),
                            tags=(tag,))
 
     def _apply(self):
@@ -255,7 +322,7 @@ class PrefixChangeDialog(tk.Toplevel):
             oldp = row["old_path"]
             rel = self._relpath_safe(oldp, self._old_base)
             newp = os.path.normpath(os.path.join(new_base, rel))
-            if os.path.exists(newp):
+            if self._validator.exists(newp):
                 mapping.append({"kind": kind, "old_path": oldp, "new_path": newp})
         self.result = {"mapping": mapping, "new_base": new_base}
         self.destroy()
@@ -265,7 +332,7 @@ class PrefixChangeDialog(tk.Toplevel):
         self.result = None
         self.destroy()
 
-class ReplaceSegmentDialog(tk.Toplevel):
+class ReplaceSegmentDialog(AsyncExistsMixin, tk.Toplevel):
     """
     Replace an intermediate path segment across many missing files.
     - User enters 'Old segment' (text) and 'New segment' (text or chosen folder)
@@ -293,6 +360,7 @@ class ReplaceSegmentDialog(tk.Toplevel):
             d = filedialog.askdirectory(title="Pick new segment folder", initialdir=self._initial_dir)
             if d:
                 # Use normalized path separator to embed as a segment
+                self._index_folder(d)
                 self.new_seg.set(d)
         ttk.Button(head, text="Browse…", command=_browse_dir).grid(row=1, column=2, padx=(6,0), pady=(6,0))
         head.columnconfigure(1, weight=1)
@@ -314,6 +382,7 @@ class ReplaceSegmentDialog(tk.Toplevel):
 
         self.tv.tag_configure("ok", foreground="#0b7a00")
         self.tv.tag_configure("ko", foreground="#b00020")
+        self._init_validator(self._refresh)
 
         # --- Buttons
         btns = ttk.Frame(self); btns.pack(fill="x", padx=10, pady=(0,10))
@@ -352,10 +421,9 @@ class ReplaceSegmentDialog(tk.Toplevel):
             kind = "DATA" if r["kind"] == "data" else "REF"
             oldp = r["old_path"]
             newp = self._replace_once(oldp, old_norm, new_norm)
-            exists = os.path.exists(newp) if newp else False
-            if exists: found += 1
-            tag = "ok" if exists else "ko"
-            self.tv.insert("", "end", values=(kind, oldp, newp or "", "Yes" if exists else "No"), tags=(tag,))
+            text, tag = self._exists_cell(newp)
+            if tag == "ok": found += 1
+            self.tv.insert("", "end", values=(kind, oldp, newp or "", text), tags=(tag,))
         # optional: summary row or external label (kept simple here)
 
     def _replace_once(self, original_path, old_seg_norm, new_seg_text):
@@ -402,7 +470,7 @@ class ReplaceSegmentDialog(tk.Toplevel):
         mapping = []
         for iid in self.tv.get_children():
             tp, oldp, newp, ok = self.tv.item(iid, "values")
-            if newp and os.path.exists(newp):
+            if newp and self._validator.exists(newp):
                 mapping.append({
                     "kind": "data" if tp == "DATA" else "ref",
                     "old_path": oldp,
@@ -415,7 +483,7 @@ class ReplaceSegmentDialog(tk.Toplevel):
         self.result = None
         self.destroy()
         
-class ReplaceAnyDialog(tk.Toplevel):
+class ReplaceAnyDialog(AsyncExistsMixin, tk.Toplevel):
     """
     Let user select (by text selection) the exact substring to replace in an 'Old path' entry,
     then provide a replacement string (typed or picked via directory chooser).
@@ -470,6 +538,7 @@ class ReplaceAnyDialog(tk.Toplevel):
         ys.pack(side="right", fill="y")
         self.tv.tag_configure("ok", foreground="#0b7a00")
         self.tv.tag_configure("ko", foreground="#b00020")
+        self._init_validator(self._refresh)
 
         # --- List of missing paths (to pick a sample line)
         side = ttk.LabelFrame(self, text="Missing files")
@@ -509,6 +578,7 @@ class ReplaceAnyDialog(tk.Toplevel):
     def _browse_dir(self):
         d = filedialog.askdirectory(title="Pick replacement folder", initialdir=self._last_dir)
         if d:
+            self._index_folder(d)
             self.new_var.set(d)
             try: self._last_dir = d
             except: pass
@@ -577,15 +647,14 @@ class ReplaceAnyDialog(tk.Toplevel):
             kind = "DATA" if r["kind"] == "data" else "REF"
             oldp = r["old_path"]
             newp = self._replace_once(oldp, old_sel, new_txt, case_sensitive) if old_sel and new_txt else ""
-            ok = bool(newp and os.path.exists(newp))
-            tag = "ok" if ok else "ko"
-            self.tv.insert("", "end", values=(kind, oldp, newp, "Yes" if ok else "No"), tags=(tag,))
+            text, tag = self._exists_cell(newp)
+            self.tv.insert("", "end", values=(kind, oldp, newp, text), tags=(tag,))
 
     def _apply(self):
         mapping = []
         for iid in self.tv.get_children():
             typ, oldp, newp, ok = self.tv.item(iid, "values")
-            if newp and os.path.exists(newp):
+            if newp and self._validator.exists(newp):
                 mapping.append({
                     "kind": "data" if typ == "DATA" else "ref",
                     "old_path": oldp,
@@ -609,15 +678,32 @@ class Plotter:
         self.master.geometry("980x640")
         self.files = []
         self.references = []
+        self.data_model = FileListModel("d")     # row ids of the Data list
+        self.ref_model = FileListModel("r")      # row ids of the References list
         self.commands = {}
+        self.compiled = None        # CompiledCommands of the last applied command text
         self.offset_between = 2.0
         self.default_color = 'black'
         self.custom_names = {}      # for data files
         self.custom_ref_names = {}  # for reference files
+        self.cache = DatasetCache()     # parsed files, re-read only when changed on disk
+        self._curves = []               # (path, Line2D) per data file of the last plot
+        self._view = ViewSlicer()       # zoom/pan: draw only the visible x window
+        self._watcher = None            # FileWatcher while live reload is on
+        self._watch_job = None          # Tk 'after' id of the next poll
+        self._follower = None           # FolderFollower while following a folder
+        self._history_win = None        # Toplevel showing the archived patterns heatmap
+        self._thumbs = Thumbnailer().start()    # list thumbnails, made in the background
+        self._thumb_images = {}         # (path, kind) -> PhotoImage (Tk needs a reference)
+        self._thumb_failed = set()      # (path, kind) that could not be read
+        self._thumb_job = None          # Tk 'after' ids: refresh of the visible rows, polling
+        self._thumb_poll = None
         self.build_gui()
         self._bind_shortcuts() 
         self._last_relink_dir = None   # remember last folder used for relinking
         self._error_buffer = []
+        self._font_warned = set()      # fonts already reported as missing
+        self._warm_up_fonts()
 
     # ---- Centralized error accumulator ----
     def _add_error(self, kind: str, path: str, exc: Exception):
@@ -651,7 +737,8 @@ class Plotter:
     def save_project(self):
         filename = filedialog.asksaveasfilename(
             defaultextension=".json",
-            filetypes=[("JSON files", "*.json")],
+            filetypes=[("JSON files", "*.json"),
+                       ("Project with data (single file)", "*" + BUNDLE_EXT)],
             title="Save Project As"
         )
         if not filename:
@@ -667,8 +754,16 @@ class Plotter:
         }
 
         try:
-            with open(filename, "w") as f:
-                json.dump(project_data, f, indent=2)
+            if filename.lower().endswith(BUNDLE_EXT):
+                # Self-contained: parsed arrays go in the file with the settings
+                cc = compile_commands(project_data["commands"], self.offset_between)
+                self._error_buffer = []
+                save_bundle(filename, project_data, cache=self.cache,
+                            float32=cc.options.project_float32, on_error=self._add_error)
+                self._flush_errors(title="Files not included in the project")
+            else:
+                with open(filename, "w") as f:
+                    json.dump(project_data, f, indent=2)
             #messagebox.showinfo("Project Saved", f"Project saved to:\n{filename}")
         except Exception as e:
             messagebox.showerror("Error", f"Could not save project:\n{e}")            
@@ -774,12 +869,18 @@ class Plotter:
         ttk.Button(row_data, text="Reverse", command=lambda: self._tree_reverse(self.data_list, self.files)).pack(side='left', padx=3)
         ttk.Button(row_data, text="Remove All", command=self.remove_all_data).pack(side='left', padx=3)
         
-        self.data_list = ttk.Treeview(data_frame, columns=("Name","Path"), show="headings", height=10, selectmode="extended")
+        self.data_filter_var = tk.StringVar()
+        self._build_filter_row(data_frame, self.data_filter_var, lambda: self.data_list)
+
+        self.data_list = ttk.Treeview(data_frame, columns=("Name","Path"), show="tree headings", height=10, selectmode="extended",
+                                     yscrollcommand=self._schedule_thumbs)
+        self.data_list.column("#0", width=THUMB_SIZE[0] + 12, stretch=False)   # sparkline thumbnail
         self.data_list.heading("Name", text="Name")
         self.data_list.heading("Path", text="Path")
         self.data_list.column("Name", width=320, anchor='w', stretch=True)
         self.data_list.column("Path", width=220, anchor='w', stretch=True)
         self.data_list.pack(fill='both', expand=True, padx=2, pady=2)
+        self.data_list.tag_configure("dup", foreground="#b36b00")
         self.data_list.bind("<Delete>",      self._delete_selected_data)
         self.data_list.bind("<Double-1>",    lambda e: self._start_inline_rename(self.data_list, self.custom_names, e))
         self.data_list.bind("<Control-r>",   lambda e: self._start_inline_rename(self.data_list, self.custom_names, e))
@@ -804,12 +905,18 @@ class Plotter:
         ttk.Button(row_ref, text="Reverse", command=lambda: self._tree_reverse(self.ref_list, self.references)).pack(side='left', padx=3)
         ttk.Button(row_ref, text="Remove All", command=self.remove_all_references).pack(side='left', padx=3)
         
-        self.ref_list = ttk.Treeview(ref_frame, columns=("Name","Path"), show="headings", height=10, selectmode="extended")
+        self.ref_filter_var = tk.StringVar()
+        self._build_filter_row(ref_frame, self.ref_filter_var, lambda: self.ref_list)
+
+        self.ref_list = ttk.Treeview(ref_frame, columns=("Name","Path"), show="tree headings", height=10, selectmode="extended",
+                                     yscrollcommand=self._schedule_thumbs)
+        self.ref_list.column("#0", width=THUMB_SIZE[0] + 12, stretch=False)   # sparkline thumbnail
         self.ref_list.heading("Name", text="Name")
         self.ref_list.heading("Path", text="Path")
         self.ref_list.column("Name", width=320, anchor='w', stretch=True)
         self.ref_list.column("Path", width=220, anchor='w', stretch=True)
         self.ref_list.pack(fill='both', expand=True, padx=2, pady=2)
+        self.ref_list.tag_configure("dup", foreground="#b36b00")
         self.ref_list.bind("<Delete>",       self._delete_selected_refs)  # <-- fix: call the correct handler
         self.ref_list.bind("<Double-1>",     lambda e: self._start_inline_rename(self.ref_list, self.custom_ref_names, e))
         self.ref_list.bind("<Control-r>",    lambda e: self._start_inline_rename(self.ref_list, self.custom_ref_names, e))
@@ -852,6 +959,8 @@ class Plotter:
         # Build a fresh Figure/Canvas/Toolbar using current settings
         self.fig = Figure(figsize=self.current_figsize, dpi=self.current_dpi)
         self.ax  = self.fig.add_subplot(111)
+        self._overview = OverviewNavigator(self.fig, self.ax)   # minimap under the plot (optional)
+        self._panels = PanelFigure(self.fig)                    # subplot grid ('panels' command)
         self.canvas = FigureCanvasTkAgg(self.fig, master=self.preview_frame)
         self.canvas_widget = self.canvas.get_tk_widget()
         self.canvas_widget.pack(fill='both', expand=True)
@@ -873,6 +982,7 @@ class Plotter:
         self._cursor_x = None                   # current x position of the cursor
         self._cursor_vline = None               # matplotlib Line2D object for the vertical line
         self._cursor_cid_click = None           # mpl connection id for click callback
+        self._fit_span = None                   # SpanSelector while the fit range is picked
         
         # Enable/disable button
         self.cursor_btn = ttk.Button(cursor_panel, text="Enable cursor", command=self._toggle_cursor)
@@ -895,6 +1005,28 @@ class Plotter:
         ttk.Button(row, text="Apply & Plot",  command=self.apply_commands_and_plot).pack(side='left', padx=3)
         ttk.Button(row, text="Save Image",    command=self.save_plot).pack(side='left', padx=3)
         ttk.Button(row, text="Save Project",  command=self.save_project).pack(side='left', padx=3)
+        row2 = ttk.Frame(actions_frame); row2.pack(fill='x', pady=2)
+        self.watch_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(row2, text="Live reload", variable=self.watch_var,
+                        command=self._toggle_watch).pack(side='left', padx=3)
+        ttk.Button(row2, text="Watch folder…", command=self._watch_folder).pack(side='left', padx=3)
+        self.follow_btn = ttk.Button(row2, text="Follow folder…", command=self._toggle_follow)
+        self.follow_btn.pack(side='left', padx=3)
+        self.overview_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(row2, text="Overview", variable=self.overview_var,
+                        command=self._toggle_overview).pack(side='left', padx=3)
+        row3 = ttk.Frame(actions_frame); row3.pack(fill='x', pady=2)
+        ttk.Label(row3, text="Preset:").pack(side='left', padx=(3, 0))
+        self.preset_var = tk.StringVar()
+        self.preset_box = ttk.Combobox(row3, textvariable=self.preset_var, width=14,
+                                       values=list_presets(), postcommand=self._refresh_presets)
+        self.preset_box.pack(side='left', padx=3)
+        ttk.Button(row3, text="Use", command=self._use_preset).pack(side='left', padx=3)
+        ttk.Button(row3, text="Save as preset…", command=self._save_preset).pack(side='left', padx=3)
+        ttk.Button(row3, text="Convert files…", command=self._convert_files).pack(side='left', padx=3)
+        self.fit_btn = ttk.Button(row3, text="Fit peaks…", command=self._fit_peaks)
+        self.fit_btn.pack(side='left', padx=3)
+        ttk.Button(row3, text="Memory", command=self._show_memory).pack(side='left', padx=3)
         
         cmd_frame = ttk.LabelFrame(right_ctrl, text="Commands")
         cmd_frame.pack(fill='both', expand=True, padx=4, pady=(2,4))
@@ -920,60 +1052,7 @@ class Plotter:
         
     def default_commands_text(self):
         """Return the default text block for the Commands tab."""
-        return (
-            "--- Normalize & stacking ---\n"
-            "normalize = off\n"
-            "offset = 0\n"
-            "refbase = -1\n"
-            "refoffset = 0\n\n"
-            
-            "--- Title & labels ---\n"
-            "title = \n"
-            "xlabel = (°, Cu Kα)\n"
-            "#xlim = 10,80\n"
-            "ylabel = Intensity (a.u.)\n"
-            "#ylim = 0,10\n"
-            "#figsize_cm = 9,7\n"
-            "axes_size_cm = 7.2,7.2\n"  
-            "margins_cm = 0.6,0.1,0.1,1.2\n"
-            "# Left, Right, Top, Bottom\n\n"
-
-            "--- Legend & Colors ---\n"
-            "legend = on\n"
-            "#legendpos = outside\n"
-            "colormap = rainbow\n"
-            "legend_labelspacing = 0.1\n\n"
-            
-            "--- Font and linewidth Settings ---\n"
-            "font = Times New Roman\n"
-            "textcolor = black\n"
-            "linewidth = 0.5\n"
-            "reflinewidth = 2\n"
-            "label_size = 10\n"
-            "tick_size = 10\n"
-            "title_size = 12\n"
-            "legend_size = 9\n\n"
-            "square_color = black\n"
-            "data_bg = white\n"
-            "legendlinewidth = 1\n"
-            "legendlinewidthref = 1\n\n"
-            
-            "--- Ticks ---\n"
-            "xtick_major = auto\n"
-            "ytick_major = off\n"
-            "xtick_minor = off\n"
-            "ytick_minor = off\n"
-        )
-
-    def _axes_size_is_square(self, tol_cm: float = 1e-2) -> bool:
-        """
-        Return True if axes_size_cm is defined and width ≈ height (within tol_cm, in cm).
-        """
-        pair = self._parse_pair_cm("axes_size_cm")
-        if not pair:
-            return False
-        w_cm, h_cm = pair
-        return abs(w_cm - h_cm) <= tol_cm
+        return default_commands_text()
 
     def _center_canvas_for_fixed_size(self):
         """Place the canvas widget at the center of the preview frame (fixed cm size)."""
@@ -1097,22 +1176,153 @@ class Plotter:
         self._update_cursor_slider_from_axes()
 
     def refresh_file_lists(self):
-        """Refresh the Treeviews in the Data/References tabs, if present."""
+        """Refresh the Treeviews in the Data/References tabs, if present.
+        Only rows that were added, removed, renamed or moved are touched."""
         # Data
         if hasattr(self, 'data_list'):
-            self.data_list.delete(*self.data_list.get_children())
-            for f in self.files:
-                base = os.path.basename(f)
-                shown = self.custom_names.get(f, os.path.splitext(base)[0])
-                self.data_list.insert("", "end", values=(shown, f))
+            self._sync_tree(self.data_list, self.data_model, self.files, self.custom_names)
         # References
         if hasattr(self, 'ref_list'):
-            self.ref_list.delete(*self.ref_list.get_children())
-            for f in self.references:
-                base = os.path.basename(f)
-                shown = self.custom_ref_names.get(f, os.path.splitext(base)[0])
-                self.ref_list.insert("", "end", values=(shown, f))
-                
+            self._sync_tree(self.ref_list, self.ref_model, self.references, self.custom_ref_names)
+        self._mark_duplicates()
+
+    def _mark_duplicates(self):
+        """Flag rows whose file has the same content as an earlier one (data first, then references)."""
+        dups = self.cache.duplicates(self.files + self.references)
+        marked = getattr(self, "_dup_marked", {})
+        now = {}
+        for tv, model in ((getattr(self, 'data_list', None), self.data_model),
+                          (getattr(self, 'ref_list', None), self.ref_model)):
+            if tv is None:
+                continue
+            for iid in model.order:
+                other = dups.get(model.path(iid))
+                if other is not None:
+                    now[iid] = (tv, other)
+            for iid, (t, _) in marked.items():
+                if t is tv and iid not in now and tv.exists(iid):
+                    tv.item(iid, tags=(), values=(model.label(iid), model.path(iid)))
+        for iid, (tv, other) in now.items():
+            model = self._list_model(tv)
+            tv.item(iid, tags=("dup",),
+                    values=(model.label(iid),
+                            f"{model.path(iid)}   ⧉ same content as {os.path.basename(other)}"))
+        self._dup_marked = now
+
+    def _sync_tree(self, tv: ttk.Treeview, model, paths: list, name_dict: dict):
+        """Apply the model's diff of `paths` to the Treeview."""
+        def label_of(f):
+            return name_dict.get(f, reference_label(f))
+
+        diff = model.sync(paths, label_of)
+        if diff.removed:
+            tv.delete(*diff.removed)
+        for iid, f, shown in diff.added:
+            tv.insert("", "end", iid=iid, values=(shown, f))
+        for iid, shown in diff.relabelled:
+            tv.item(iid, values=(shown, model.path(iid)))
+        if diff.reordered or model.filtered:
+            # One call reorders (and hides filtered-out rows) without re-inserting
+            tv.set_children("", *model.visible)
+
+    def _append_rows(self, tv, model, backing, new_paths, name_dict):
+        """
+        Append paths to a list (files/references) and its Treeview: only
+        the new rows are inserted, the rest of the list is not diffed.
+        """
+        if tv is None or len(model) != len(backing):
+            backing.extend(new_paths)       # list changed behind the model: full sync
+            self.refresh_file_lists()
+            return
+        backing.extend(new_paths)
+        for iid, f, label, shown in model.add(new_paths,
+                                              lambda f: name_dict.get(f, reference_label(f))):
+            tv.insert("", "end", iid=iid, values=(label, f))
+            if not shown:
+                tv.detach(iid)          # hidden by the filter
+        self._mark_duplicates()
+
+    def _list_model(self, tv: ttk.Treeview):
+        return self.data_model if tv is self.data_list else self.ref_model
+
+    # -------------------- Thumbnails --------------------
+    def _schedule_thumbs(self, *args):
+        """The lists scrolled or changed: update the thumbnails of the visible rows soon."""
+        if self._thumb_job is None:
+            self._thumb_job = self.master.after(60, self._refresh_thumbs)
+
+    @staticmethod
+    def _visible_rows(tv: ttk.Treeview):
+        rows = tv.get_children()
+        first = tv.identify_row(2)
+        if not rows or not first:
+            return ()
+        last = tv.identify_row(max(2, tv.winfo_height() - 3))
+        return rows[rows.index(first):(rows.index(last) + 1 if last else len(rows))]
+
+    def _refresh_thumbs(self):
+        """Show the thumbnails already made; ask the background thread for the missing ones."""
+        self._thumb_job = None
+        wanted = []
+        for tv, model, kind in ((getattr(self, 'data_list', None), self.data_model, "data"),
+                                (getattr(self, 'ref_list', None), self.ref_model, "ref")):
+            if tv is None:
+                continue
+            for iid in reversed(self._visible_rows(tv)):    # the top rows come out first
+                key = (model.path(iid), kind)
+                img = self._thumb_images.get(key)
+                if img is not None:
+                    tv.item(iid, image=img)
+                elif key not in self._thumb_failed:
+                    wanted.append(key)
+                    self._thumbs.request(*key)
+        self._thumbs.retain(wanted)     # rows scrolled away are not made
+        if wanted and self._thumb_poll is None:
+            self._thumb_poll = self.master.after(50, self._poll_thumbs)
+
+    def _poll_thumbs(self):
+        self._thumb_poll = None
+        for path, kind, png in self._thumbs.take():
+            if png is None:
+                self._thumb_failed.add((path, kind))
+                continue
+            img = tk.PhotoImage(data=base64.b64encode(png).decode("ascii"))
+            self._thumb_images[(path, kind)] = img
+            tv, model = ((self.data_list, self.data_model) if kind == "data"
+                         else (self.ref_list, self.ref_model))
+            for iid in model.iids_for(path):
+                if tv.exists(iid):
+                    tv.item(iid, image=img)
+        if self._thumbs.pending:
+            self._thumb_poll = self.master.after(50, self._poll_thumbs)
+
+    def _forget_thumbs(self, paths):
+        """Files changed on disk: their thumbnails are made again when shown."""
+        for p in paths:
+            for kind in ("data", "ref"):
+                self._thumb_images.pop((p, kind), None)
+                self._thumb_failed.discard((p, kind))
+        self._schedule_thumbs()
+
+    # -------------------- List filter --------------------
+    def _build_filter_row(self, parent, var: tk.StringVar, get_tv):
+        """'Filter:' entry above a list; rows are hidden/shown as you type."""
+        row = ttk.Frame(parent)
+        row.pack(fill='x', padx=2)
+        ttk.Label(row, text="Filter:").pack(side='left')
+        entry = ttk.Entry(row, textvariable=var)
+        entry.pack(side='left', fill='x', expand=True, padx=(4, 2))
+        ttk.Button(row, text="×", width=2, command=lambda: var.set("")).pack(side='left')
+        entry.bind("<Escape>", lambda e: var.set(""))
+        var.trace_add("write", lambda *a: self._apply_filter(get_tv(), var.get()))
+
+    def _apply_filter(self, tv: ttk.Treeview, query: str):
+        model = self._list_model(tv)
+        tv.set_children("", *model.set_filter(query))
+        sel = tv.selection()
+        if sel:
+            tv.see(sel[0])
+
     def _move_selection(self, tv: ttk.Treeview, delta: int):
         """Move selection/focus up or down by `delta` rows and keep item visible."""
         items = tv.get_children()
@@ -1162,7 +1372,8 @@ class Plotter:
         if not values:
             return "break"
         old_name = values[0]
-        path = values[1] if len(values) > 1 else None
+        # The Path cell may carry a duplicate note: take the path from the model
+        path = self._list_model(tv).path(item_id) or (values[1] if len(values) > 1 else None)
     
         # 4) Create inline Entry overlay
         entry = tk.Entry(tv, borderwidth=1)
@@ -1178,6 +1389,7 @@ class Plotter:
             new_name = entry.get().strip() or old_name
             values[0] = new_name
             tv.item(item_id, values=values)
+            self._list_model(tv).set_label(item_id, new_name)
         
             if path:
                 name_dict[path] = new_name
@@ -1226,104 +1438,85 @@ class Plotter:
         return "break"
     
     def _sync_backing_from_tv(self, tv: ttk.Treeview, backing_list: list):
-        """Rebuild the Python list (files/references) from the Treeview's visual order."""
-        new_order = []
-        for iid in tv.get_children():
-            vals = tv.item(iid, "values")
-            if len(vals) >= 2:
-                new_order.append(vals[1])  # Path column
-        backing_list[:] = new_order
+        """Write the model's row order back into the Python list (files/references).
+        The Treeview is not read: its rows are already in the model's order."""
+        backing_list[:] = self._list_model(tv).paths()
         
     def _tree_reverse(self, tv: ttk.Treeview, backing_list: list):
-        """Reverse the Treeview visual order and synchronize the corresponding Python list.
+        """Reverse the visible rows and synchronize the corresponding Python list.
         Keep the focus on a valid row after reversal."""
-        items = list(tv.get_children())
+        model = self._list_model(tv)
+        items = list(model.visible)
         if not items:
             return "break"
     
-        # Option: remember current index to restore focus
+        # Remember current index to restore focus
         cur = tv.focus()
         cur_idx = items.index(cur) if cur in items else 0
-        new_idx = len(items) - 1 - cur_idx
     
-        # Move items in reversed order
-        for i, iid in enumerate(reversed(items)):
-            tv.move(iid, "", i)
+        model.reverse()
+        tv.set_children("", *model.visible)
     
         # Reselect/refocus
-        new_items = tv.get_children()
-        target = new_items[new_idx] if new_items else ""
-        if target:
-            tv.selection_set(target)
-            tv.focus(target)
-            tv.see(target)
+        target = model.visible[len(items) - 1 - cur_idx]
+        tv.selection_set(target)
+        tv.focus(target)
+        tv.see(target)
     
         # Sync the Python list
         self._sync_backing_from_tv(tv, backing_list)
         return "break"
     
     def _tree_move_selected(self, tv: ttk.Treeview, backing_list: list, delta: int):
-        """Move the selected item by delta (+1/-1) rows in the Treeview
+        """Move the selected items by delta (+1/-1) rows in the Treeview
         and update the corresponding Python list."""
         sel = tv.selection()
         if not sel:
             return "break"
-        iid = sel[0]
-        idx = tv.index(iid)
-        children = tv.get_children()
-        new_idx = max(0, min(len(children) - 1, idx + delta))
-        if new_idx != idx:
-            tv.move(iid, "", new_idx)
-            tv.selection_set(iid)
-            tv.focus(iid)
-            tv.see(iid)
+        model = self._list_model(tv)
+        moves = model.move(sel, delta)
+        if moves:
+            for iid, index in moves:        # only the rows that changed place
+                tv.move(iid, "", index)
+            tv.selection_set(sel)
+            tv.focus(sel[0])
+            tv.see(sel[0])
             self._sync_backing_from_tv(tv, backing_list)
         return "break"
     
     def _delete_selected_data(self, event=None):
         """Delete selected rows from the Data tree and underlying self.files."""
         # Confirm deletion (optional)
-        if not self.data_list.selection():
+        sel = self.data_list.selection()
+        if not sel:
             return
         if not messagebox.askyesno("Delete data", "Remove selected data files from the list?"):
             return
     
-        # Collect selected paths from the 'Path' column (index 1)
-        selected_paths = []
-        for iid in self.data_list.selection():
-            vals = self.data_list.item(iid, 'values')
-            if len(vals) >= 2:
-                selected_paths.append(vals[1])
-    
-        # Filter out selected paths from self.files
-        self.files = [p for p in self.files if p not in selected_paths]
-        self.refresh_file_lists()
+        # Drop exactly the selected rows (by row id, no tree read-back)
+        self.data_list.delete(*sel)
+        self.files = self.data_model.remove(sel)
         self.data_list.focus_set() 
         
     def _delete_selected_refs(self, event=None):
         """Delete selected rows from the Reference tree and underlying self.references."""
-        if not self.ref_list.selection():
+        sel = self.ref_list.selection()
+        if not sel:
             return
         if not messagebox.askyesno("Delete references", "Remove selected reference files from the list?"):
             return
     
-        selected_paths = []
-        for iid in self.ref_list.selection():
-            vals = self.ref_list.item(iid, 'values')
-            if len(vals) >= 2:
-                selected_paths.append(vals[1])
-    
-        self.references = [p for p in self.references if p not in selected_paths]
-        self.refresh_file_lists()
+        self.ref_list.delete(*sel)
+        self.references = self.ref_model.remove(sel)
         self.ref_list.focus_set() 
             
     # -------------------- Placeholder methods --------------------
     def load_files(self):
         """Open a file dialog and append selected data files."""
-        new_files = filedialog.askopenfilenames(filetypes=[("Files","*.xy *.csv *.dat *.txt *.gr")])
+        new_files = filedialog.askopenfilenames(filetypes=DATA_FILETYPES)
         if new_files:
-            self.files.extend(new_files)
-            self.refresh_file_lists()
+            self._append_rows(getattr(self, 'data_list', None), self.data_model, self.files,
+                              list(new_files), self.custom_names)
     
     def remove_all_data(self):
         """Remove all loaded data files."""
@@ -1333,10 +1526,22 @@ class Plotter:
     
     def load_refs(self):
         """Open a file dialog and append selected reference files."""
-        new_refs = filedialog.askopenfilenames(filetypes=[("Reference Files","*.csv *.xy *.txt *.xlsx")])
+        new_refs = filedialog.askopenfilenames(filetypes=REF_FILETYPES)
         if new_refs:
-            self.references.extend(new_refs)
-            self.refresh_file_lists()
+            self._error_buffer = []
+            added = []
+            for p in new_refs:
+                if p.lower().endswith(".xlsx"):
+                    try:
+                        added.extend(excel_sheet_paths(p))   # one entry per phase sheet
+                        continue
+                    except Exception as e:
+                        self._add_error("REF", p, e)
+                        continue
+                added.append(p)
+            self._append_rows(getattr(self, 'ref_list', None), self.ref_model, self.references,
+                              added, self.custom_ref_names)
+            self._flush_errors()
     
     def remove_all_references(self):
         """Remove all loaded reference files."""
@@ -1356,64 +1561,18 @@ class Plotter:
             return os.path.dirname(project_json_path)
         # 2) try first existing sibling of paths
         for p in paths:
+            p = split_sheet(p)[0]
             if os.path.exists(p):
                 return os.path.dirname(p)
         # 3) fallback: user's home
         return os.path.expanduser("~")
     
-    def _relink_missing_entries(self, paths: list[str], name_dict: dict, dlg_title: str,
-                                project_json_path: str, filetypes):
-        """
-        For each missing path, prompt the user to select a new location.
-        Keeps custom names by remapping dict keys from old path to the new one.
-        """
-        unresolved = []
-        initialdir = self._guess_initialdir(project_json_path, paths)
-    
-        for idx, old_path in enumerate(list(paths)):
-            if os.path.exists(old_path):
-                continue
-            base = os.path.basename(old_path)
-            # Ask user to relink this file
-            if not messagebox.askyesno(
-                "Relink missing file",
-                f"{dlg_title}\n\nOriginal path:\n{old_path}\n\nDo you want to locate it now?"
-            ):
-                unresolved.append(old_path)
-                continue
-    
-            new_path = filedialog.askopenfilename(
-                title=f"{dlg_title} — select new location\n(Original: {base})",
-                initialdir=initialdir,
-                filetypes=filetypes
-            )
-            if new_path:
-                # Replace path in the backing list
-                try:
-                    pos = paths.index(old_path)
-                    paths[pos] = new_path
-                except ValueError:
-                    # Might have been already modified; append as fallback
-                    paths.append(new_path)
-                # Remap custom name key if present
-                self._remap_dict_key(name_dict, old_path, new_path)
-                # Update initialdir to the folder just used (quality of life)
-                initialdir = os.path.dirname(new_path)
-            else:
-                unresolved.append(old_path)
-    
-        if unresolved:
-            messagebox.showwarning(
-                "Unresolved files",
-                "Some files could not be relinked:\n\n" + "\n".join(unresolved)
-            )
-    
     def _apply_relink_mapping(self, mapping):
         """Apply a list of {'kind','old_path','new_path'} mappings to lists and custom dicts."""
         for m in mapping:
             kind = m["kind"]
             oldp = m["old_path"]
-            newp = m["new_path"]
+            newp = with_sheet(m["new_path"], oldp)     # keep the phase of a moved workbook
             if kind == "data":
                 try:
                     i = self.files.index(oldp)
@@ -1525,18 +1684,74 @@ class Plotter:
             return dlg.result
         return []
 
+    def _auto_relink_by_name(self, missing_rows, project_json_path):
+        """Index a chosen folder in the background and relink missing files by name."""
+        root = filedialog.askdirectory(
+            title="Folder to search for the missing files",
+            initialdir=self._last_relink_dir or self._guess_initialdir(
+                project_json_path, [r["old_path"] for r in missing_rows])
+        )
+        if not root:
+            return []
+        index = get_index(root)
+        if not self._wait_for_index(index):
+            return []
+        mapping, unresolved = auto_relink(missing_rows, index)
+        if mapping:
+            self._last_relink_dir = root
+        messagebox.showinfo(
+            "Search by file name",
+            f"{len(mapping)} file(s) relinked, {len(unresolved)} not found (or ambiguous)."
+        )
+        return mapping
+
+    def _wait_for_index(self, index):
+        """Modal 'Scanning…' window while a FileIndex is built; False if cancelled."""
+        if index.done:
+            return not index.cancelled
+        win = tk.Toplevel(self.master)
+        win.title("Scanning folder"); win.resizable(False, False)
+        msg = tk.StringVar(value=f"Scanning {index.root}…")
+        ttk.Label(win, textvariable=msg, wraplength=420).pack(padx=12, pady=(12, 6))
+
+        def _cancel():
+            index.cancel()
+            win.destroy()
+
+        ttk.Button(win, text="Cancel", command=_cancel).pack(pady=(0, 12))
+
+        def _poll():
+            if not win.winfo_exists():
+                return
+            if index.done:
+                win.destroy()
+                return
+            msg.set(f"Scanning {index.root}…\n{index.count} files indexed")
+            win.after(100, _poll)
+
+        win.transient(self.master); win.grab_set()
+        win.after(100, _poll)
+        self.master.wait_window(win)
+        return index.done and not index.cancelled
+
     def load_project(self):
         """Load a project JSON and restore state (with batch relink UX)."""
         filename = filedialog.askopenfilename(
             defaultextension=".json",
-            filetypes=[("JSON files", "*.json")],
+            filetypes=[("Projects", "*.json *" + BUNDLE_EXT), ("JSON files", "*.json"),
+                       ("Project with data", "*" + BUNDLE_EXT)],
             title="Open Project"
         )
         if not filename:
             return
         try:
-            with open(filename) as f:
-                project_data = json.load(f)
+            self.cache.unpin()          # the snapshots of a previously opened bundle
+            if is_bundle(filename):
+                # One sequential read; the arrays are served from the cache
+                project_data = load_bundle(filename, cache=self.cache)
+            else:
+                with open(filename) as f:
+                    project_data = json.load(f)
     
             self.files = project_data.get("data_files", [])
             self.references = project_data.get("ref_files", [])
@@ -1550,10 +1765,10 @@ class Plotter:
             # --- Detect missing files (both kinds) ---
             missing_rows = []
             for p in self.files:
-                if not os.path.exists(p):
+                if not self.cache.is_pinned(p, "data") and not os.path.exists(p):
                     missing_rows.append({"kind": "data", "old_path": p})
             for p in self.references:
-                if not os.path.exists(p):
+                if not self.cache.is_pinned(p, "ref") and not os.path.exists(split_sheet(p)[0]):
                     missing_rows.append({"kind": "ref", "old_path": p})
         
             # --- If any missing, guide the user once ---
@@ -1564,8 +1779,20 @@ class Plotter:
                     "Do you want to relink them now?"
                 )
                 if do_relink:
+                    # 0) One pass by file name over a background index of a folder
+                    if messagebox.askyesno(
+                        "Search by file name",
+                        "Search a folder (and its subfolders) for the missing files by name?\n\n"
+                        "Choose 'No' to edit the paths instead."
+                    ):
+                        mapping = self._auto_relink_by_name(missing_rows, filename)
+                        if mapping:
+                            self._apply_relink_mapping(mapping)
+
                     # 1) Unified selection-based dialog (prefix or segment via selection)
-                    mapping = self._replace_any_relink(missing_rows)
+                    still_missing = [r for r in missing_rows
+                                     if r["old_path"] in (self.files if r["kind"] == "data" else self.references)]
+                    mapping = self._replace_any_relink(still_missing) if still_missing else []
                     if mapping:
                         self._apply_relink_mapping(mapping)
             
@@ -1574,7 +1801,7 @@ class Plotter:
                     for row in missing_rows:
                         newlist = self.files if row["kind"] == "data" else self.references
                         # If the old_path is still there and still missing on disk, it's unresolved
-                        if row["old_path"] in newlist and (not os.path.exists(row["old_path"])):
+                        if row["old_path"] in newlist and (not os.path.exists(split_sheet(row["old_path"])[0])):
                             remaining.append(row)
             
                     if remaining:
@@ -1610,6 +1837,10 @@ class Plotter:
         if not (self.files or self.references):
             messagebox.showwarning("Warning", "No data or reference files loaded.")
             return
+        cc = self.compiled or compile_mapping(self.commands, self.offset_between)
+        if cc.options.export_formats:
+            self._export_all_formats()
+            return
     
         file_path = filedialog.asksaveasfilename(
             defaultextension=".png",
@@ -1622,281 +1853,207 @@ class Plotter:
         if not file_path:
             return
     
-        # Apply cm-based sizing for its side-effects; we don't need the return value here.
-        self._apply_physical_size_from_cm(self.fig)
-    
-        # DPI for raster formats; ignored by vector (PDF/SVG).
-        dpi = 300
         try:
-            dpi = int(float(self.commands.get("export_dpi", dpi)))
-        except Exception:
-            pass
-        dpi = max(72, min(1200, dpi))
-    
-        # IMPORTANT: keep bbox_inches=None to preserve margins set in centimeters.
-        # Using 'tight' would alter margins and break your cm layout.
+            with self._view.full_data(), self._overview.hidden():
+                export_figure(self.fig, file_path, self.commands)
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not save the figure:\n{e}")
+
+    def _export_all_formats(self):
+        """'export_formats = png:300, pdf, svg': one file name, every format written at once."""
+        base = filedialog.asksaveasfilename(
+            title="Save Figure (every format of export_formats)",
+            filetypes=[("All Files", "*.*")])
+        if not base:
+            return
         try:
-            self.fig.savefig(file_path, dpi=dpi, facecolor='white', bbox_inches=None)
-            #messagebox.showinfo("Image Saved", f"Saved to:\n{file_path}")
+            with self._view.full_data(), self._overview.hidden():
+                paths = export_many(self.fig, base, self.commands)
         except Exception as e:
             messagebox.showerror("Error", f"Could not save the figure:\n{e}")
+            return
+        messagebox.showinfo("Save Figure", "Saved:\n" + "\n".join(paths))
 
     def apply_commands_and_plot(self):
-        self.commands = self.parse_commands(self.cmd_entry.get("1.0", tk.END))
+        # Memoized on the text: an unchanged command box is not parsed again
+        self.compiled = compile_commands(self.cmd_entry.get("1.0", tk.END), self.offset_between)
+        self.commands = dict(self.compiled.commands)
+        preset = self.compiled.get("preset")
+        if preset and preset_text(preset) is None:
+            messagebox.showwarning("Preset", f"Unknown preset '{preset}' (ignored).")
         self.plot_all()
 
-    def parse_commands(self, text):
-        cmd_dict = {}
-        for line in text.strip().split("\n"):
-            if '=' in line:
-                key, value = line.split('=', 1)
-                cmd_dict[key.strip().lower()] = value.strip()
-        return cmd_dict
-
-    def normalize(self, y):
-        y_min = np.min(y)
-        y_max = np.max(y)
-        if y_max - y_min == 0:
-            return y
-        return (y - y_min) / (y_max - y_min)
-
-    def robust_read_csv(self, filepath, max_header_lines=5):
-        """
-        Tries to read a reference file (csv, xy, xls) with unknown delimiter and variable header lines.
-        - Tries common delimiters.
-        - Tries to skip up to max_header_lines lines until data parses correctly.
-        - Supports CSV-like and Excel files.
-        Returns a DataFrame with at least two columns (angle, intensity).
-        """
-        ext = os.path.splitext(filepath)[1].lower()
-        
-        # For Excel files
-        if ext in ['.xls', '.xlsx']:
-            try:
-                df = pd.read_excel(filepath)
-                if df.shape[1] >= 2:
-                    return df
-            except Exception as e:
-                raise ValueError(f"Cannot read Excel file: {e}")
-        
-        # For text files
-        delimiters = [',', '\t', ';', ' ']
-        
-        # Try skipping 0 to max_header_lines lines
-        for skip in range(max_header_lines + 1):
-            for delim in delimiters:
-                try:
-                    df = pd.read_csv(filepath, delimiter=delim, skiprows=skip, engine='python', header=None)
-                    # Check at least 2 numeric columns in data
-                    if df.shape[1] >= 2:
-                        # Check if first two columns are numeric (floats or ints)
-                        try:
-                            #df_check = df.iloc[:, :2].apply(pd.to_numeric)
-                            return df.iloc[:, :2].copy()  # Return first 2 columns only
-                        except:
-                            continue
-                except:
-                    continue
-        raise ValueError(f"Cannot parse reference file {filepath} with common delimiters and header skips.")
-           
-    def read_gr_file(self, filepath):
+    # -------------------- Style presets --------------------
+    def _refresh_presets(self):
+        self.preset_box.configure(values=list_presets())
+
+    def _use_preset(self):
+        """Put 'preset = <name>' at the top of the command box and replot."""
+        name = self.preset_var.get().strip()
+        if not name:
+            return
+        lines = self.cmd_entry.get("1.0", "end-1c").split("\n")
+        lines = [ln for ln in lines if ln.split("=", 1)[0].strip().lower() != "preset"]
+        self.cmd_entry.delete("1.0", tk.END)
+        self.cmd_entry.insert("1.0", "\n".join([f"preset = {name}"] + lines))
+        if self.files or self.references:
+            self.apply_commands_and_plot()
+
+    def _save_preset(self):
+        """Save the option lines of the command box (not colorN/nameN/...) as a preset."""
+        name = simpledialog.askstring("Save preset", "Preset name:",
+                                      initialvalue=self.preset_var.get(), parent=self.master)
+        if not name:
+            return
+        keep = []
+        for ln in self.cmd_entry.get("1.0", "end-1c").split("\n"):
+            key = ln.split("=", 1)[0].strip().lower()
+            if "=" in ln and key in SPECS:
+                keep.append(ln.strip())
+        try:
+            save_preset(name, "\n".join(keep))
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not save the preset:\n{e}")
+            return
+        self.preset_var.set(name.strip())
+        self._refresh_presets()
+
+    def _convert_files(self):
+        """Convert data/reference files to clean two-column .xy files in a chosen folder."""
+        files = filedialog.askopenfilenames(
+            title="Files to convert",
+            filetypes=DATA_FILETYPES + REF_FILETYPES + [("All files", "*.*")])
+        if not files:
+            return
+        out_dir = filedialog.askdirectory(title="Write the .xy files to")
+        if not out_dir:
+            return
+        try:
+            job = BatchConverter(files, out_dir).start()
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not start the conversion:\n{e}")
+            return
+
+        if not self._wait_for_job(job, "Converting", f"Converting {len(job.files)} files…"):
+            return
+        self._error_buffer = []
+        for r in job.failures:
+            self._add_error("REF" if r.kind == "ref" else "DATA", r.src, r.error)
+        if self._error_buffer:
+            self._flush_errors(title="Conversion errors")
+        messagebox.showinfo("Convert files", format_report(job.results, job.seconds, job.skipped,
+                                                               failures=False))
+
+    def _wait_for_job(self, job, title, text):
+        """Modal progress window for a background job (done/count/cancel); False if cancelled."""
+        win = tk.Toplevel(self.master)
+        win.title(title); win.resizable(False, False)
+        msg = tk.StringVar(value=text)
+        ttk.Label(win, textvariable=msg, wraplength=420).pack(padx=12, pady=(12, 6))
+
+        def _cancel():
+            job.cancel()
+            win.destroy()
+
+        ttk.Button(win, text="Cancel", command=_cancel).pack(pady=(0, 12))
+
+        def _poll():
+            if not win.winfo_exists():
+                return
+            if job.done:
+                win.destroy()
+                return
+            msg.set(f"{text}\n{job.count} done")
+            win.after(100, _poll)
+
+        win.transient(self.master); win.grab_set()
+        win.after(100, _poll)
+        self.master.wait_window(win)
+        return job.done and not job.cancelled
+
+    def _fit_peaks(self):
         """
-        Custom reader for .gr files from PDFgetX3 which contain a config header.
-        It skips lines until it finds the data block (starting with #L ...).
+        Fit fit_peaks peaks in every data file and save a CSV. The range is
+        fit_range, or one dragged on the plot (a second click cancels).
         """
-        with open(filepath, 'r') as f:
-            lines = f.readlines()
-    
-        # Find the line starting with '#L' which defines the data columns
-        for idx, line in enumerate(lines):
-            if line.strip().startswith("#L"):
-                data_start = idx + 1
-                break
-        else:
-            raise ValueError(f"Could not find '#L' header in {filepath}")
-    
-        # Now parse the data from that point onward
-        from io import StringIO
-        data_str = ''.join(lines[data_start:])
-        df = pd.read_csv(StringIO(data_str), delim_whitespace=True, header=None)
-        
-        if df.shape[1] < 2:
-            raise ValueError(f"Data section in {filepath} does not have two columns.")
-        
-        return df.iloc[:, :2].copy()
-
-    def get_distinct_colors(self, n):
-        colors = []
-        for _ in range(n):
-            r, g, b = [random.uniform(0.1, 0.9) for _ in range(3)]
-            colors.append((r, g, b))
-        return colors
-    
+        if self._fit_span is not None:
+            self._cancel_fit_pick()
+            return
+        if not self.files:
+            messagebox.showinfo("Fit peaks", "Load data files first.")
+            return
+        cc = self.compiled or compile_mapping(self.commands, self.offset_between)
+        if cc.options.fit_range:
+            self._run_peak_fit(cc.options.fit_range)
+            return
+        self._fit_span = SpanSelector(self.ax, self._on_fit_span, "horizontal", useblit=True,
+                                      props=dict(facecolor="tab:orange", alpha=0.25))
+        self.fit_btn.config(text="Drag the fit range (click to cancel)")
+
+    def _cancel_fit_pick(self):
+        if self._fit_span is not None:
+            self._fit_span.disconnect_events()
+            self._fit_span = None
+            self.fit_btn.config(text="Fit peaks…")
+            self.canvas.draw_idle()
+
+    def _on_fit_span(self, lo, hi):
+        """Range dragged on the plot: fit it (after the mouse callback returns)."""
+        self._cancel_fit_pick()
+        if hi > lo:
+            self.master.after_idle(self._run_peak_fit, (lo, hi))
+
+    def _run_peak_fit(self, region):
+        cc = self.compiled or compile_mapping(self.commands, self.offset_between)
+        opts = cc.options
+        try:
+            job = SeriesFit(self.files, region, peaks=int(opts.fit_peaks), model=opts.fit_model,
+                            stages=[cc.pipeline(i) for i in range(len(self.files))],
+                            cache=self.cache).start()
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not start the fit:\n{e}")
+            return
+        lo, hi = job.region
+        if not self._wait_for_job(job, "Fitting peaks",
+                                  f"Fitting {job.peaks} peak(s) in {lo:.4g}–{hi:.4g} "
+                                  f"in {len(job.files)} files…"):
+            return
+        self._error_buffer = []
+        for r in job.failures:
+            self._add_error("DATA", r.path, r.error)
+        self._flush_errors(title="Fit errors")
+        if len(job.failures) == len(job.results):
+            return
+        filename = filedialog.asksaveasfilename(
+            title="Save the fit results", defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv")])
+        if not filename:
+            return
+        try:
+            rows = write_csv(filename, job.results)
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not save the results:\n{e}")
+            return
+        messagebox.showinfo("Fit peaks", f"{len(job.results) - len(job.failures)} files fitted "
+                                         f"in {job.seconds:.1f} s\n{rows} rows saved to:\n{filename}")
+
+    def _show_memory(self):
+        """Bytes used by every loaded file (largest first) and in total."""
+        rows, total = self.cache.memory_report(self.files + self.references)
+        win = tk.Toplevel(self.master)
+        win.title("Memory used by the loaded files")
+        text = tk.Text(win, width=80, height=24, font=("Courier", 9), wrap="none")
+        bar = ttk.Scrollbar(win, orient="vertical", command=text.yview)
+        text.configure(yscrollcommand=bar.set)
+        bar.pack(side="right", fill="y")
+        text.pack(side="left", fill="both", expand=True)
+        text.insert("1.0", format_memory_report(rows, total) if rows else
+                    "Nothing loaded yet (files are read when plotted).")
+        text.configure(state="disabled")
+
     def parse_line_styles(self):
         """Parse line styles from the command box."""
-        lines = self.cmd_entry.get("1.0", tk.END).splitlines()
-        line_styles = {}
-        for line in lines:
-            line = line.strip()
-            if line.startswith("line"):
-                try:
-                    key, value = line.split("=")
-                    key = key.strip()   # line1
-                    value = value.strip()  # solid/dashed/etc
-                    line_styles[key] = value
-                except:
-                    pass
-        return line_styles
-
-    def prepare_options(self):
-        def get_bool(key, default):
-            return self.commands.get(key, str(default)).strip().lower() in ("on", "yes", "true")
-    
-        def get_opt_float(key):
-            """Return float(value) if possible, else None (for 'auto' / empty / invalid)."""
-            try:
-                return float(str(self.commands.get(key)).strip())
-            except Exception:
-                return None
-            
-        def parse_tick_value(val):
-            """Return ('off'|'auto'|float)."""
-            if val is None:
-                return "auto"
-            v = str(val).strip().lower()
-            if v in ("off", "none"):
-                return "off"
-            if v in ("on", "auto", ""):
-                return "auto"
-            try:
-                return float(v)
-            except:
-                return "auto"
-      
-        def get_float(key, default):
-            try:
-                return float(self.commands.get(key, default))
-            except Exception:
-                return default
-    
-        opts = {
-            "normalize": self.commands.get("normalize", "on").strip().lower(),
-            "normalizeref": self.commands.get("normalizeref", "on").strip().lower(),
-            "refbase":    get_float("refbase", -1.0),
-            "refoffset":  get_float("refoffset", 1.0),
-            "offset": get_float("offset", self.offset_between),
-            "colormap": self.commands.get("colormap", None),
-            "linewidth": get_float("linewidth", 1.5),
-            "legendlinewidth": get_float("legendlinewidth", 2),
-            "reflinewidth": get_float("reflinewidth", 2),
-            "legendlinewidthref": get_float("legendlinewidthref", 2),
-            "legend": get_bool("legend", True),
-            "xlabel": self.commands.get("xlabel", ""),
-            "ylabel": self.commands.get("ylabel", "Intensity (a.u.)"),
-            "title": self.commands.get("title", ""),
-            "legendpos": self.commands.get("legendpos", "best").strip().lower(),
-            "default_size": get_float("default_size", 10),
-            "label_size": get_float("label_size", 12),
-            "title_size": get_float("title_size", 12),
-            "tick_size": get_float("tick_size", 10),
-            "legend_size": get_float("legend_size", 10),
-            "xticks": get_bool("xticks", True),
-            "yticks": get_bool("yticks", True),            
-            "font": self.commands.get("font", "serif"),
-            "legend_labelspacing": get_float("legend_labelspacing", 0.5),
-            "square_color": self.commands.get("square_color", "black"),
-            "textcolor": self.commands.get("textcolor", "black"),
-            "data_bg": self.commands.get("data_bg", "white"),  # default white
-            "xtick_major": parse_tick_value(self.commands.get("xtick_major", "auto")),
-            "ytick_major": parse_tick_value(self.commands.get("ytick_major", "auto")),
-            "xtick_minor": parse_tick_value(self.commands.get("xtick_minor", "off")),
-            "ytick_minor": parse_tick_value(self.commands.get("ytick_minor", "off")),
-            "square_width": get_opt_float("square_width") or 1.0,
-        }
-        return opts
-        
-    def _cm_to_in(self, cm: float) -> float:
-        """Convert centimeters to inches."""
-        return float(cm) / 2.54
-    
-    def _parse_pair_cm(self, key: str):
-        """
-        Parse 'w,h' in centimeters for a given command key.
-        Accepts separators: ',', ';', ' ', 'x', '×'. Returns (w_cm, h_cm) or None.
-        """
-        raw = self.commands.get(key, "").strip()
-        if not raw:
-            return None
-        txt = raw.replace("cm", "").replace("×", "x").strip()
-        for sep in (",", ";", " ", "x"):
-            if sep in txt:
-                a, b = [p.strip() for p in txt.split(sep, 1)]
-                break
-        else:
-            return None
-        a = a.replace(",", "."); b = b.replace(",", ".")
-        return (float(a), float(b))
-    
-    def _parse_margins_cm(self):
-        """
-        Parse margins_cm = left,right,top,bottom in cm.
-        Defaults are publication-friendly: 1.5,1.0,1.0,1.2 cm.
-        """
-        raw = self.commands.get("margins_cm", "").strip()
-        if not raw:
-            return (1.5, 1.0, 1.0, 1.2)
-        txt = raw.replace("cm", " ")
-        for sep in (",", ";", " "):
-            if sep in txt:
-                parts = [p.strip().replace(",", ".") for p in txt.split(sep) if p.strip()]
-                break
-        else:
-            parts = [txt.replace(",", ".")]
-        if len(parts) != 4:
-            return (1.5, 1.0, 1.0, 1.2)
-        L, R, T, B = map(float, parts)
-        return (L, R, T, B)
-    
-    def _apply_physical_size_from_cm(self, fig):
-        """
-        Apply physical sizing using centimeters.
-        Priority:
-          1) axes_size_cm (width,height) + margins_cm (L,R,T,B)  -> exact plotting area in cm
-          2) figsize_cm (W,H) total figure size in cm
-          3) figsize in inches (legacy)
-        Returns True if a fixed size was applied (auto-fit must be OFF), else False.
-        """
-        axes_cm = self._parse_pair_cm("axes_size_cm")
-        if axes_cm:
-            L_cm, R_cm, T_cm, B_cm = self._parse_margins_cm()
-            ax_w_cm, ax_h_cm = axes_cm
-            fig_w_cm = ax_w_cm + L_cm + R_cm
-            fig_h_cm = ax_h_cm + T_cm + B_cm
-            fig.set_size_inches(self._cm_to_in(fig_w_cm), self._cm_to_in(fig_h_cm), forward=True)
-            # Convert margins in cm to figure fractions for subplots_adjust:
-            left   = L_cm / fig_w_cm
-            right  = 1.0 - (R_cm / fig_w_cm)
-            bottom = B_cm / fig_h_cm
-            top    = 1.0 - (T_cm / fig_h_cm)
-            fig.subplots_adjust(left=left, right=right, top=top, bottom=bottom)
-            return True
-    
-        fig_cm = self._parse_pair_cm("figsize_cm")
-        if fig_cm:
-            fig.set_size_inches(self._cm_to_in(fig_cm[0]), self._cm_to_in(fig_cm[1]), forward=True)
-            return True
-    
-        raw_fs = self.commands.get("figsize", "").strip().lower()
-        if raw_fs and raw_fs != "auto":
-            try:
-                txt = raw_fs.replace(";", ",").replace(" ", ",")
-                w_in, h_in = map(float, txt.split(",")[:2])
-                fig.set_size_inches(w_in, h_in, forward=True)
-                return True
-            except:
-                pass
-    
-        return False
+        return parse_line_styles(self.cmd_entry.get("1.0", tk.END))
 
     def _on_preview_resize(self, event):
         """Auto-fit: resize the figure to match the preview frame size."""
@@ -1924,64 +2081,231 @@ class Plotter:
                     pass
                 self._cfg_binding = None
 
+    # -------------------- Live reload (watch mode) --------------------
+    WATCH_INTERVAL_MS = 500     # poll period; changes are batched by FileWatcher.settle
+
+    def _toggle_watch(self):
+        """Start/stop polling the loaded files (Live reload checkbox)."""
+        if self.watch_var.get():
+            if self._watcher is None:
+                self._watcher = FileWatcher(self.files + self.references)
+            self._schedule_watch()
+        else:
+            self._watcher = None
+            if self._follower is None:
+                self._cancel_watch()
+
+    def _schedule_watch(self):
+        if self._watch_job is None:
+            self._watch_job = self.master.after(self.WATCH_INTERVAL_MS, self._watch_tick)
+
+    def _cancel_watch(self):
+        if self._watch_job is not None:
+            try:
+                self.master.after_cancel(self._watch_job)
+            except Exception:
+                pass
+        self._watch_job = None
+
+    def _watch_folder(self):
+        """Pick a folder whose new data files are appended and plotted automatically."""
+        d = filedialog.askdirectory(title="Watch folder for new data files",
+                                    initialdir=self._last_relink_dir or os.path.expanduser("~"))
+        if not d:
+            return
+        self.watch_var.set(True)
+        self._toggle_watch()
+        self._watcher.add_directory(d)
+
+    def _watch_tick(self):
+        """Poll once, handle a settled batch, then reschedule."""
+        self._watch_job = None
+        try:
+            if self._follower is not None:
+                update = self._follower.poll()
+                if update:
+                    self._on_follow_update(update)
+            if self._watcher is not None:
+                self._watcher.set_files(self.files + self.references)
+                batch = self._watcher.poll()
+                if batch:
+                    self._on_watch_batch(batch)
+        finally:
+            if self._watcher is not None or self._follower is not None:
+                self._schedule_watch()
+
+    def _on_watch_batch(self, batch):
+        """
+        New files: append and replot everything (offsets/colors depend on count).
+        Changed files only: update their curves in place through the cache.
+        """
+        if batch.changed:
+            self._forget_thumbs(batch.changed)
+            for p in batch.changed:
+                self.cache.unpin(p)     # a bundle snapshot gives way to the new file
+        new_files = [p for p in batch.added if p not in self.files]
+        if new_files:
+            self._append_rows(getattr(self, 'data_list', None), self.data_model, self.files,
+                              new_files, self.custom_names)
+
+        if not (self.files or self.references):
+            return
+        if self._panels.active:
+            self.plot_all()          # only the panels showing a changed file are redrawn
+            return
+        plotted = {p for p, line in self._curves if line is not None}
+        changed = set(batch.changed)
+        if new_files or not changed <= plotted or (changed & set(self.references)):
+            self.plot_all()
+            return
+        cc = self.compiled or compile_mapping(self.commands, self.offset_between)
+        self._error_buffer = []
+        self._view.restore()     # autoscale on full data, not on the sliced view
+        updated = update_data_curves(self.ax, self._curves, changed, cc,
+                                     offset_between=self.offset_between,
+                                     on_error=self._add_error, cache=self.cache)
+        if updated and self._overview.active:
+            self._overview.attach(self._curves)
+        self._view.attach(self.ax, self._curves)
+        if updated:
+            if self._cursor_enabled:
+                self._update_cursor_slider_from_axes()
+            self.canvas.draw_idle()
+        self._flush_errors()
+
+    # -------------------- Follow folder (in-situ runs) --------------------
+    def _toggle_follow(self):
+        """Start following a folder (pattern/keep from the command box), or stop."""
+        if self._follower is not None:
+            self._follower = None
+            self.follow_btn.config(text="Follow folder…")
+            if self._watcher is None:
+                self._cancel_watch()
+            return
+
+        d = filedialog.askdirectory(title="Follow folder (time-resolved run)",
+                                    initialdir=self._last_relink_dir or os.path.expanduser("~"))
+        if not d:
+            return
+        opts = compile_commands(self.cmd_entry.get("1.0", tk.END), self.offset_between).options
+        self._follower = FolderFollower(d, pattern=opts.follow_pattern, keep=int(opts.follow_keep))
+        kept = self._follower.start()
+        self.files.extend(p for p in kept if p not in self.files)
+        self.follow_btn.config(text="Stop following")
+
+        # Kept curves are still being written: track their content too
+        self.watch_var.set(True)
+        self._toggle_watch()
+        self.refresh_file_lists()
+        if self.files or self.references:
+            self.apply_commands_and_plot()
+        self._show_history()
+
+    def _on_follow_update(self, update):
+        """
+        New files settled: drop evicted curves (archived in the background),
+        add the new ones. Archived patterns: update the history.
+        """
+        if update.evicted:
+            gone = set(update.evicted)
+            self.files = [p for p in self.files if p not in gone]
+            for p in gone:
+                self.cache.invalidate(p)
+            self.prune_custom_names()
+        if update.added or update.evicted:
+            self.files.extend(p for p in update.added if p not in self.files)
+            self.refresh_file_lists()
+            self.plot_all()
+        if update.archived:
+            self._show_history()
+
+    def _show_history(self):
+        """Show/update the heatmap of archived (compacted) patterns."""
+        archive = self._follower.history() if self._follower is not None else None
+        if archive is None or not len(archive):
+            return
+        if self._history_win is None or not self._history_win.winfo_exists():
+            win = tk.Toplevel(self.master)
+            win.title("Follow history (archived patterns)")
+            fig = Figure(figsize=(5, 3), dpi=100)
+            canvas = FigureCanvasTkAgg(fig, master=win)
+            canvas.get_tk_widget().pack(fill='both', expand=True)
+            win.protocol("WM_DELETE_WINDOW", self._close_history)
+            self._history_win, self._history_fig, self._history_canvas = win, fig, canvas
+        fig = self._history_fig
+        ax = fig.axes[0] if fig.axes else fig.add_subplot(111)
+        draw_history(ax, archive, xlabel=(self.compiled.options.xlabel if self.compiled else None))
+        ax.set_title(f"{archive.count} archived patterns", fontsize=9)
+        self._history_canvas.draw_idle()
+
+    def _close_history(self):
+        try:
+            self._history_win.destroy()
+        except Exception:
+            pass
+        self._history_win = None
+
+    def _toggle_overview(self):
+        """Show/hide the overview minimap (a span selector driving the x range)."""
+        if self.files or self.references:
+            self.plot_all()
+
+    # -------------------- Fonts --------------------
+    def _warm_up_fonts(self):
+        """Resolve the command box font and lay out a sample text, in the background."""
+        try:
+            opts = compile_commands(self.cmd_entry.get("1.0", tk.END), self.offset_between).options
+        except Exception:
+            return
+        sizes = (opts.default_size, opts.label_size, opts.title_size, opts.tick_size, opts.legend_size)
+        warm_fonts([opts.font], sizes)
+
+    def _check_font(self, font):
+        """Tell once per font when it is not installed (a generic font is used instead)."""
+        family, found = resolve_font(font)
+        if found or font in self._font_warned:
+            return
+        self._font_warned.add(font)
+        messagebox.showwarning("Font not found",
+                               f"The font '{font}' is not installed; '{family}' is used instead.")
+
+    def _use_single_axes(self):
+        """Leave panel mode: one axes again, with its own overview navigator."""
+        self._cancel_fit_pick()
+        self._panels.reset()
+        for ax in list(self.fig.axes):
+            ax.remove()
+        self.ax = self.fig.add_subplot(111)
+        self._overview = OverviewNavigator(self.fig, self.ax)
+        self._cursor_vline = None
+
     def plot_all(self):
         if not self.files and not self.references:
             messagebox.showwarning("Warning", "No data or reference files loaded.")
             return
     
-        options = self.prepare_options()
+        cc = self.compiled or compile_mapping(self.commands, self.offset_between)
         # Reset error buffer for this plotting session
         self._error_buffer = []        
+        self.cache.set_float32(cc.options.data_float32)   # files are read again if it changed
+        self._overview.detach()     # main axes back to its full area before sizing
+        grid = panel_grid(cc)
+        if grid is None and self._panels.active:
+            self._use_single_axes()
     
-        # Update global style
-        plt.rcParams.update({
-            "xtick.major.width": 1,
-            "ytick.major.width": 1,
-            "pdf.fonttype": 42,
-            "ps.fonttype": 42,
-            "font.size": options["default_size"],
-            "axes.labelsize": options["label_size"],
-            "axes.titlesize": options["title_size"],
-            "xtick.labelsize": options["tick_size"],
-            "ytick.labelsize": options["tick_size"],
-            "legend.fontsize": options["legend_size"],
-            "font.family": options["font"],
-            "axes.labelcolor": options["textcolor"],
-            "axes.titlecolor": options["textcolor"],
-            "axes.edgecolor": options["square_color"],
-            "xtick.color": options["square_color"],
-            "ytick.color": options["square_color"],
-            "xtick.labelcolor": options["textcolor"],
-            "ytick.labelcolor": options["textcolor"],
-            "text.color": options["textcolor"],
-        })
+        # Update global style (skipped when fonts/sizes/colors did not change)
+        if apply_plot_style(cc.options):
+            self._check_font(cc.options.font)
     
         # ---- Use the embedded Figure/Axes
-        ax = self.ax
         fig = self.fig
         
         # Compute once: apply cm-based sizing; then toggle auto-fit and center if needed.
-        fixed_applied = self._apply_physical_size_from_cm(fig)
+        fixed_applied = apply_physical_size_from_cm(fig, cc)
         self._set_autosize(not fixed_applied)
         if fixed_applied:
             self._center_canvas_for_fixed_size()
         
-        ax.clear()
-
-        # --- Apply axes border ("square") color to spines ---
-        # Use direct spine styling because rcParams won't retroactively recolor existing axes.
-        for sp in ax.spines.values():
-            sp.set_edgecolor(options["square_color"])   # set border color
-              
-        # Enforce square plotting area only when axes_size_cm is square.
-        if self._axes_size_is_square():
-            ax.set_box_aspect(1)           # force exact square plotting area
-        else:
-            try:
-                ax.set_box_aspect(None)    # release any previous square lock
-            except Exception:
-                pass
-        
         # Make sure previous callbacks are disconnected, avoid stacking.
         try:
             for cid in getattr(self, "_mpl_cids", []):
@@ -1989,263 +2313,42 @@ class Plotter:
         except Exception:
             pass
         self._mpl_cids = []
-    
-        # Axes background
-        if options["data_bg"].lower() in ("transparent", "none"):
-            ax.set_facecolor("none")
-        else:
-            ax.set_facecolor(options["data_bg"])
         fig.patch.set_alpha(0)
     
-        offset = options["offset"]
-        n = len(self.files)
-    
-        pattern_handles, pattern_labels = [], []
-        ref_handles, ref_labels = [], []
-    
-        if not options["yticks"]:
-            ax.set_yticks([])
-        if not options["xticks"]:
-            ax.set_xticks([])
-    
-        # Colors for data curves
-        if options["colormap"]:
-            try:
-                cmap = plt.get_cmap(options["colormap"])
-                col_colors = [cmap(i / max(1, len(self.files) - 1)) for i in range(len(self.files))]
-            except Exception:
-                col_colors = [self.default_color] * len(self.files)
+        if grid is not None:
+            # Panel grid: only panels whose files/options changed are redrawn
+            self._view.detach()
+            self._curves = []
+            if not self._panels.active:
+                self._cursor_vline = None
+            self._panels.draw(self.files, self.references, cc,
+                              custom_names=self.custom_names,
+                              custom_ref_names=self.custom_ref_names,
+                              offset_between=self.offset_between,
+                              default_color=self.default_color,
+                              on_error=self._add_error,
+                              cache=self.cache)
+            if self._fit_span is not None and self._fit_span.ax is not self._panels.axes[0]:
+                self._cancel_fit_pick()         # its axes are gone
+            self.ax = self._panels.axes[0]     # cursor works on the first panel
         else:
-            col_colors = [self.default_color] * len(self.files)
-    
-        line_styles = self.parse_line_styles()
-    
-        # === Plot DATA files ===
-        for i, file_path in enumerate(self.files):
-            try:
-                ext = os.path.splitext(file_path)[1].lower()
-                if ext == '.csv':
-                    df = self.robust_read_csv(file_path)
-                    r = df.iloc[:, 0].values
-                    intensity = df.iloc[:, 1].values
-                else:
-                    if ext == '.gr':
-                        df = self.read_gr_file(file_path)
-                        r = df.iloc[:, 0].values
-                        intensity = df.iloc[:, 1].values
-                    else:
-                        data = np.loadtxt(file_path, comments="#", skiprows=1)
-                        r, intensity = data[:, 0], data[:, 1]
-    
-                intensity_norm = intensity if options["normalize"] == "off" else self.normalize(intensity)
-                shifted = intensity_norm + (offset * (n - i - 1))
-    
-                base_name = os.path.splitext(os.path.basename(file_path))[0]
-                custom_label = self.custom_names.get(file_path, base_name)
-                custom_label = self.commands.get(f"name{i+1}", custom_label)
-    
-                color = self.commands.get(f"color{i+1}", col_colors[i])
-                linewidth = options["linewidth"]
-                legend_lw = options["legendlinewidth"]
-                linestyle = line_styles.get(f"line{i+1}", "solid")
-    
-                # plot on embedded axes
-                ax.plot(r, shifted, label=custom_label, color=color,
-                        linewidth=linewidth, linestyle=linestyle)
-    
-                # invisible legend line (pattern) for consistent legend thickness
-                legend_line, = ax.plot([], [], color=color, label=custom_label,
-                                       linewidth=legend_lw, linestyle=linestyle)
-                pattern_handles.append(legend_line)
-                pattern_labels.append(custom_label)
-    
-            except Exception as e:
-                # Instead of showing one popup per file, collect errors
-                self._add_error("DATA", file_path, e)
-                continue
-    
-        # === Plot REFERENCE files ===
-        ref_color_list = self.get_distinct_colors(len(self.references))
-        for idx, ref_path in enumerate(self.references):
-            try:
-                ext = os.path.splitext(ref_path)[1].lower()
-                color = self.commands.get(f"refcolor{idx+1}", ref_color_list[idx])
-                is_peak_list = False
-        
-                # -- lecture x, y --
-                if ext in [".csv", ".xy", ".txt", ".dat"]:
-                    df = pd.read_csv(ref_path, sep=r"[,\t; ]+", engine="python", header=None, comment="#")
-                elif ext == ".xlsx":
-                    df = pd.read_excel(ref_path)
-                else:
-                    raw = np.loadtxt(ref_path)
-                    if raw.ndim == 1:
-                        x = raw
-                        y = np.ones_like(raw)
-                        is_peak_list = True
-                    else:
-                        x = raw[:, 0]; y = raw[:, 1]
-                        is_peak_list = False
-                    df = None
-        
-                if df is not None:
-                    if '2Theta (°)' in df.columns:
-                        if 'I var' in df.columns:
-                            intensity_col = 'I var'
-                        elif 'I fix' in df.columns:
-                            intensity_col = 'I fix'
-                        else:
-                            intensity_col = df.columns[1]
-                
-                        x = df['2Theta (°)'].astype(str).str.replace(',', '.').astype(float).values
-                        y = df[intensity_col].astype(str).str.replace(',', '.').astype(float).values
-                        is_peak_list = True
-                    else:
-                        x = df.iloc[:, 0].astype(str).str.replace(',', '.').astype(float).values
-                        y = df.iloc[:, 1].astype(str).str.replace(',', '.').astype(float).values
-                        is_peak_list = True
-        
-                y_norm   = y if options["normalizeref"] == "off" else self.normalize(y)
-                base_ref = options["refbase"]
-                step_ref = options["refoffset"]
-                legacy = (self.commands.get("stackrefs", "") or "").strip().lower()
-                if legacy in ("off", "no", "false"):
-                    step_ref = 0.0
-                base_y = base_ref - idx * step_ref
-                span_factor = float(self.commands.get("refspan", 0.95))
-                direction = 1.0 if step_ref >= 0 else -1.0
-                span = (abs(step_ref) * span_factor) if step_ref != 0 else 1.0
-                jitter_cmd = (self.commands.get("refxjitter", "auto") or "auto").strip().lower()
-                if jitter_cmd == "auto":
-                    try:
-                        xmin, xmax = ax.get_xlim()
-                        xjitter = 0.003 * (xmax - xmin)
-                    except Exception:
-                        xjitter = 0.5
-                else:
-                    try:
-                        xjitter = float(jitter_cmd.replace(",", "."))
-                    except Exception:
-                        xjitter = 0.0
-        
-                if is_peak_list:
-                    seen = set()
-                    y_max = float(y.max()) if len(y) else 1.0
-                    for px, py in zip(x, y):
-                        py_norm = (py / y_max)
-                        if py_norm > 0:
-                            k = round(float(px), 3)
-                            if k not in seen:
-                                x_shift = (idx - (len(self.references) - 1) / 2.0) * xjitter
-                                height = py_norm * span
-                                ax.vlines(px + x_shift, base_y, base_y + direction * height,
-                                          color=color, linewidth=options["reflinewidth"])
-                                seen.add(k)
-                else:
-                    try:
-                        from scipy.signal import find_peaks
-                        peaks, _ = find_peaks(y_norm)
-                    except Exception:
-                        peaks = [i for i in range(1, len(y_norm)-1) if y_norm[i] > y_norm[i-1] and y_norm[i] > y_norm[i+1]]
-                    for p in peaks:
-                        x_shift = (idx - (len(self.references) - 1) / 2.0) * xjitter
-                        height = py_norm * span
-                        ax.vlines(px + x_shift, base_y, base_y + direction * height,
-                                  color=color, linewidth=options["reflinewidth"])
-        
-                # -- LÉGENDE REF  --
-                base_ref_name = os.path.splitext(os.path.basename(ref_path))[0]
-                label = self.custom_ref_names.get(ref_path, base_ref_name)
-                label = self.commands.get(f"refname{idx+1}", label)
-                ref_line, = ax.plot([], [], color=color, label=label, linewidth=options["legendlinewidthref"])
-                ref_handles.append(ref_line)
-                ref_labels.append(label)
-        
-            except Exception as e:
-                self._add_error("REF", ref_path, e)
-                continue
-
-    
-        # Labels / title
-        ax.set_xlabel(options["xlabel"])
-        ax.set_ylabel(options["ylabel"])
-        ax.set_title(options["title"])
-    
-        # Legend
-        if options["legend"]:
-            handles = pattern_handles + ref_handles
-            labels = pattern_labels + ref_labels
-            if options["legendpos"] == "outside":
-                legend = ax.legend(
-                    handles=handles, labels=labels,
-                    loc='upper left', bbox_to_anchor=(1.05, 1),
-                    borderaxespad=0., frameon=False,
-                    labelspacing=options["legend_labelspacing"]
-                )
-            else:
-                legend = ax.legend(
-                    handles=handles, labels=labels,
-                    loc=options["legendpos"], frameon=False,
-                    labelspacing=options["legend_labelspacing"]
-                )
-            for text in legend.get_texts():
-                text.set_color(options["textcolor"])
-    
-        # Limits
-        if "xlim" in self.commands:
-            try:
-                x1, x2 = map(float, self.commands["xlim"].split(','))
-                ax.set_xlim(x1, x2)
-            except Exception:
-                pass
-        if "ylim" in self.commands:
-            try:
-                y1, y2 = map(float, self.commands["ylim"].split(','))
-                ax.set_ylim(y1, y2)
-            except Exception:
-                pass
-
-        # --- New tick system (major/minor unified) ---
-        def apply_major(axis, val):
-            if val == "off":
-                axis.set_major_locator(mticker.NullLocator())
-            elif val == "auto":
-                axis.set_major_locator(mticker.AutoLocator())
-            else:  # numeric
-                axis.set_major_locator(mticker.MultipleLocator(val))
-        
-        def apply_minor(axis, val):
-            if val == "off":
-                axis.set_minor_locator(mticker.NullLocator())
-                axis.set_minor_formatter(mticker.NullFormatter())
-            elif val == "auto":
-                axis.set_minor_locator(mticker.AutoMinorLocator())
-                axis.set_minor_formatter(mticker.NullFormatter())
-            else:
-                axis.set_minor_locator(mticker.MultipleLocator(val))
-                axis.set_minor_formatter(mticker.NullFormatter())
-        
-        apply_major(ax.xaxis, options["xtick_major"])
-        apply_major(ax.yaxis, options["ytick_major"])
-        apply_minor(ax.xaxis, options["xtick_minor"])
-        apply_minor(ax.yaxis, options["ytick_minor"])
-        
-        # --- Tick mark style (major/minor) ---
-        # Use the same color as square_color; minor are shorter and slightly thinner.
-        ax.tick_params(axis='both', which='major',
-                       color=options["square_color"],
-                       width=options["square_width"],
-                       length=6)
-        
-        ax.tick_params(axis='both', which='minor',
-                       color=options["square_color"],
-                       width=max(0.8, options["square_width"] * 0.8),
-                       length=3)
+            draw_plot(self.ax, self.files, self.references, cc,
+                      custom_names=self.custom_names,
+                      custom_ref_names=self.custom_ref_names,
+                      offset_between=self.offset_between,
+                      default_color=self.default_color,
+                      on_error=self._add_error,
+                      cache=self.cache,
+                      curves=self._curves)
+            if self.overview_var.get():
+                self._overview.attach(self._curves)    # from full-resolution lines
+            self._view.attach(self.ax, self._curves)
 
         # After limits are set, remount the cursor if enabled and sync slider range
         self._remount_cursor_after_clear()
         self._kill_mpl_keys()
         self._flush_errors()
+        self._mark_duplicates()     # content hashes are known once the files were read
         self.canvas.draw()        
 
 if __name__ == "__main__":
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+GUI-free plotting core of the Plotter macro.
+
+Usable from Jupyter or scripts without starting Tk:
+
+    from plotter import build_figure, export_figure, parse_commands
+    cmds = parse_commands(open("my_commands.txt").read())
+    fig = build_figure(["a.xy", "b.xy"], ["ref.csv"], cmds)
+    export_figure(fig, "out.pdf", cmds)
+
+The Tk application (Plotter_3.8.py) is a thin shell over these functions.
+"""
+
+from .commands import (default_commands_text, parse_commands, parse_line_styles,
+                       prepare_options)
+from .options import (PlotOptions, CompiledCommands, compile_commands, compile_mapping,
+                      SCHEMA)
+from .readers import (read_data_file, read_reference_file, read_reference_table,
+                      robust_read_csv, read_gr_file)
+from .render import (normalize, style_rc, compiled_style, style_context, apply_plot_style,
+                     apply_physical_size_from_cm, draw_plot, update_data_curves,
+                     build_figure, export_figure)
+from .export import export_many, parse_export_profile
+from .cache import DatasetCache, default_cache, file_signature
+from .dataset import Dataset, format_memory_report
+from .watch import FileWatcher, WatchBatch
+from .follow import FolderFollower, PatternArchive, draw_history, natural_sorted
+from .relink import FileIndex, PathValidator, get_index, auto_relink
+from .listmodel import FileListModel
+from .view import ViewSlicer, minmax_decimate
+from .fonts import resolve_font, warm_fonts
+from .presets import list_presets, preset_text, save_preset, delete_preset
+
+# Short aliases for the public "load datasets" entry points
+load_dataset = read_data_file
+load_reference = read_reference_file
+
+__all__ = [
+    "default_commands_text", "parse_commands", "parse_line_styles", "prepare_options",
+    "PlotOptions", "CompiledCommands", "compile_commands", "compile_mapping", "SCHEMA",
+    "read_data_file", "read_reference_file", "read_reference_table", "robust_read_csv",
+    "read_gr_file",
+    "load_dataset", "load_reference",
+    "normalize", "style_rc", "compiled_style", "style_context", "apply_plot_style",
+    "apply_physical_size_from_cm",
+    "draw_plot", "update_data_curves", "build_figure", "export_figure",
+    "export_many", "parse_export_profile",
+    "DatasetCache", "default_cache", "file_signature", "Dataset", "format_memory_report",
+    "FileWatcher", "WatchBatch",
+    "FolderFollower", "PatternArchive", "draw_history", "natural_sorted",
+    "FileIndex", "PathValidator", "get_index", "auto_relink",
+    "FileListModel", "ViewSlicer", "minmax_decimate", "resolve_font", "warm_fonts",
+    "list_presets", "preset_text", "save_preset", "delete_preset",
+]
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Background estimation for the 'background = ...' processing stage.
+
+    linear              straight line through the first and last points
+    min                 constant (the minimum)
+    poly:3              least-squares polynomial of degree 3
+    asls:1e5,0.01       asymmetric least squares (Eilers): smoothness, asymmetry
+    arpls:1e5           asymmetrically reweighted penalized least squares (Baek)
+    snip:40             SNIP clipping over 40 points (half width of the widest peak)
+    rollingball:50      rolling ball of radius 50 points
+
+AsLS/arPLS solve a symmetric pentadiagonal system per iteration: with
+SciPy it is LAPACK's banded Cholesky (solveh_banded), without it a
+banded LDLᵀ written for this case. SNIP and the rolling ball are
+vectorized NumPy (van Herk running min/max, O(n) whatever the radius).
+"""
+
+import re
+
+import numpy as np
+
+try:
+    from scipy.linalg import solveh_banded
+except Exception:          # SciPy is optional
+    solveh_banded = None
+
+
+# -------------------- penalized least squares --------------------
+def _second_difference_bands(n, lam):
+    """Upper bands of lam * D'D (D = second differences), LAPACK layout (3, n)."""
+    d0 = np.full(n, 6.0)
+    d0[[0, -1]] = 1.0
+    d0[[1, -2]] = 5.0
+    d1 = np.full(n, -4.0)
+    d1[[1, -1]] = -2.0
+    d1[0] = 0.0
+    d2 = np.ones(n)
+    d2[:2] = 0.0
+    return np.vstack((d2, d1, d0)) * lam
+
+
+def _solve_pentadiagonal(ab, b):
+    """Solve the symmetric banded system `ab` (upper form, 2 bands) with LDL' (no SciPy)."""
+    n = len(b)
+    e2, e1, d0 = ab[0].tolist(), ab[1].tolist(), ab[2].tolist()
+    d = [0.0] * n            # D
+    l1 = [0.0] * n           # L[i, i-1]
+    l2 = [0.0] * n           # L[i, i-2]
+    z = b.tolist()
+    for i in range(n):
+        a2 = e2[i] if i >= 2 else 0.0
+        a1 = e1[i] if i >= 1 else 0.0
+        if i >= 2:
+            l2[i] = a2 / d[i - 2]
+        if i >= 1:
+            l1[i] = (a1 - (l2[i] * l1[i - 1] * d[i - 2] if i >= 2 else 0.0)) / d[i - 1]
+        di = d0[i] - l1[i] * l1[i] * (d[i - 1] if i >= 1 else 0.0) \
+            - l2[i] * l2[i] * (d[i - 2] if i >= 2 else 0.0)
+        d[i] = di
+        z[i] -= (l1[i] * z[i - 1] if i >= 1 else 0.0) + (l2[i] * z[i - 2] if i >= 2 else 0.0)
+    for i in range(n):
+        z[i] /= d[i]
+    for i in range(n - 1, -1, -1):
+        if i + 1 < n:
+            z[i] -= l1[i + 1] * z[i + 1]
+        if i + 2 < n:
+            z[i] -= l2[i + 2] * z[i + 2]
+    return np.asarray(z)
+
+
+def _solve(ab, b):
+    if solveh_banded is not None:
+        return solveh_banded(ab, b, check_finite=False)
+    return _solve_pentadiagonal(ab, b)
+
+
+def asls(y, lam=1e5, p=0.01, iterations=10):
+    """Asymmetric least squares baseline (Eilers & Boelens 2005)."""
+    y = np.asarray(y, dtype=float)
+    if len(y) < 4:
+        return np.full_like(y, y.min() if len(y) else 0.0)
+    penalty = _second_difference_bands(len(y), lam)
+    w = np.ones_like(y)
+    z = y
+    for _ in range(int(iterations)):
+        ab = penalty.copy()
+        ab[2] += w
+        z = _solve(ab, w * y)
+        w_new = np.where(y > z, p, 1.0 - p)
+        if np.array_equal(w_new, w):
+            break
+        w = w_new
+    return z
+
+
+def arpls(y, lam=1e5, ratio=1e-3, iterations=50):
+    """Asymmetrically reweighted penalized least squares (Baek et al. 2015)."""
+    y = np.asarray(y, dtype=float)
+    if len(y) < 4:
+        return np.full_like(y, y.min() if len(y) else 0.0)
+    penalty = _second_difference_bands(len(y), lam)
+    w = np.ones_like(y)
+    z = y
+    for _ in range(int(iterations)):
+        ab = penalty.copy()
+        ab[2] += w
+        z = _solve(ab, w * y)
+        d = y - z
+        dn = d[d < 0]
+        if len(dn) < 2:
+            break
+        m, s = dn.mean(), dn.std() or 1e-12
+        w_new = 1.0 / (1.0 + np.exp(np.clip(2.0 * (d - (2.0 * s - m)) / s, -50, 50)))
+        if np.linalg.norm(w - w_new) / (np.linalg.norm(w) or 1.0) < ratio:
+            break
+        w = w_new
+    return z
+
+
+# -------------------- clipping / morphology --------------------
+def snip(y, half_width=40):
+    """SNIP (Morháč): iterative clipping on the LLS-transformed signal."""
+    y = np.asarray(y, dtype=float)
+    offset = y.min()
+    v = np.log(np.log(np.sqrt(y - offset + 1.0) + 1.0) + 1.0)
+    n = len(v)
+    for k in range(1, min(int(half_width), (n - 1) // 2) + 1):
+        mean = 0.5 * (v[:-2 * k] + v[2 * k:])
+        np.minimum(v[k:-k], mean, out=v[k:-k])
+    return (np.exp(np.exp(v) - 1.0) - 1.0) ** 2 - 1.0 + offset
+
+
+def _running(y, width, op):
+    """Centered running min/max over `width` points (van Herk / Gil-Werman, O(n))."""
+    n = len(y)
+    half = width // 2
+    fill = np.inf if op is np.minimum else -np.inf
+    padded = np.concatenate((np.full(half, fill), y, np.full(half + width, fill)))
+    blocks = -(-len(padded) // width)
+    padded = np.concatenate((padded, np.full(blocks * width - len(padded), fill)))
+    b = padded.reshape(blocks, width)
+    prefix = op.accumulate(b, axis=1).ravel()
+    suffix = op.accumulate(b[:, ::-1], axis=1)[:, ::-1].ravel()
+    i = np.arange(n)
+    return op(suffix[i], prefix[i + width - 1])
+
+
+def rolling_ball(y, radius=50):
+    """
+    Rolling ball of `radius` points: grey opening (running min, then
+    running max) followed by a running mean that rounds the corners.
+    """
+    y = np.asarray(y, dtype=float)
+    width = 2 * max(1, int(radius)) + 1
+    if len(y) < width:
+        return np.full_like(y, y.min() if len(y) else 0.0)
+    opened = _running(_running(y, width, np.minimum), width, np.maximum)
+    kernel = np.full(width, 1.0 / width)
+    half = width // 2
+    padded = np.concatenate((np.full(half, opened[0]), opened, np.full(half, opened[-1])))
+    return np.minimum(np.convolve(padded, kernel, mode="valid"), y)
+
+
+# -------------------- simple shapes --------------------
+def linear(x, y):
+    slope = (y[-1] - y[0]) / ((x[-1] - x[0]) or 1.0)
+    return y[0] + slope * (x - x[0])
+
+
+def polynomial(x, y, degree):
+    xc = (x - x.mean()) / (np.ptp(x) or 1.0)     # centred x for conditioning
+    return np.polyval(np.polyfit(xc, y, min(int(degree), len(x) - 1)), xc)
+
+
+# -------------------- command parsing / dispatch --------------------
+# name -> (default arguments, estimate(x, y, *args))
+METHODS = {
+    "linear": ((), lambda x, y: linear(x, y)),
+    "min": ((), lambda x, y: np.full_like(y, y.min())),
+    "poly": ((2,), lambda x, y, deg: polynomial(x, y, deg)),
+    "asls": ((1e5, 0.01), lambda x, y, lam, p: asls(y, lam, p)),
+    "arpls": ((1e5,), lambda x, y, lam: arpls(y, lam)),
+    "snip": ((40,), lambda x, y, hw: snip(y, hw)),
+    "rollingball": ((50,), lambda x, y, r: rolling_ball(y, r)),
+}
+
+
+def parse_background(value):
+    """'asls:1e6,0.001' -> ('asls', 1e6, 0.001); None when not understood."""
+    v = str(value).strip().lower().replace(" ", "").replace("_", "")
+    m = re.match(r"^([a-z]+):?([0-9eE.+\-,]*)$", v)
+    if not m or m.group(1) not in METHODS:
+        return None
+    defaults = METHODS[m.group(1)][0]
+    try:
+        args = [float(a) for a in m.group(2).split(",") if a]
+    except ValueError:
+        return None
+    if len(args) > len(defaults):
+        return None
+    return (m.group(1),) + tuple(args) + defaults[len(args):]
+
+
+def estimate_background(x, y, params):
+    """Background of (x, y) for parsed `params` (see parse_background)."""
+    if len(y) < 2:
+        return np.zeros_like(y)
+    return METHODS[params[0]][1](x, y, *params[1:])
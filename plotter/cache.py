@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Parsed-file cache. Entries are validated by the file signature
+(mtime_ns, size), so a file is parsed again only when it changed on disk.
+Values are compact Dataset records (dataset.py). Files with identical
+content (copies in other folders) are recognised by their size and CRC-32,
+computed on the bytes the reader parses (the file is read once), and
+share one parsed array. Data and reference readers give different results
+for the same bytes (a data file's first row is a header, a reference is a
+peak list), so a file loaded as both is parsed once per kind;
+duplicates() still reports it.
+"""
+
+import os
+import zlib
+import threading
+import weakref
+from collections import OrderedDict
+
+from .readers import read_data_file, read_reference_file, split_sheet
+from .dataset import Dataset, GridPool, make_dataset, memory_usage
+
+
+def file_signature(path):
+    """(mtime_ns, size) of a file; raises OSError if it does not exist."""
+    st = os.stat(split_sheet(path)[0])      # 'book.xlsx::Sheet' -> the workbook
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _sheet_hash(chash, sheet):
+    """Content hash of one sheet of a workbook hashed as `chash` (the hash itself for a file)."""
+    if sheet is None:
+        return chash
+    return (chash[0], zlib.crc32(sheet.encode("utf-8"), chash[1]))
+
+
+def content_hash(path, chunk_size=1 << 20):
+    """
+    (size, crc32) of a file's bytes, read in chunks (constant memory).
+    For a workbook sheet ('book.xlsx::Sheet') the sheet name is hashed too.
+    """
+    base, sheet = split_sheet(path)
+    crc, size = 0, 0
+    with open(base, "rb") as f:
+        while True:
+            block = f.read(chunk_size)
+            if not block:
+                break
+            crc = zlib.crc32(block, crc)
+            size += len(block)
+    return _sheet_hash((size, crc), sheet)
+
+
+class DatasetCache:
+    """
+    Thread-safe LRU cache of parsed data/reference files.
+    Keys are (kind, path); values are Dataset records, which unpack like
+    what the readers return. With float32=True the arrays are stored in
+    single precision; identical x grids are stored once, and a file whose
+    content matches one already read is not parsed again (duplicates()).
+    Pinned entries (pin(), e.g. from a project bundle) are served without
+    looking at the disk and are never evicted.
+    """
+    READERS = {"data": read_data_file, "ref": read_reference_file}
+
+    def __init__(self, max_entries=4096, float32=False):
+        self.max_entries = max_entries
+        self.float32 = bool(float32)
+        self.grids = GridPool()
+        self._entries = OrderedDict()   # (kind, path) -> (signature, Dataset)
+        self._pinned = {}               # (kind, path) -> Dataset
+        self._hashes = {}               # file path (workbook for sheets) -> (signature, (size, crc))
+        self._by_content = weakref.WeakValueDictionary()   # (kind, ext, hash, float32) -> Dataset
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path, kind="data", sig=None):
+        """
+        Return the parsed content of `path`, re-reading it only if its
+        signature changed. Pass `sig` when the caller already stat'ed the file.
+        """
+        key = (kind, path)
+        pinned = self._pinned.get(key)
+        if pinned is not None:
+            self.hits += 1
+            return pinned
+        if sig is None:
+            sig = file_signature(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == sig:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # same bytes are only the same data for the same reader (chosen by kind and extension)
+        base, sheet = split_sheet(path)
+        ext = os.path.splitext(base)[1].lower()
+        chash, raw = self._content_hash(base, sig)
+        ckey = (kind, ext, _sheet_hash(chash, sheet), self.float32)
+        with self._lock:
+            twin = self._by_content.get(ckey)
+        if twin is not None:
+            value = Dataset(path, kind, twin.x, twin.y, twin.is_peak_list)
+        else:
+            value = make_dataset(path, kind, self.READERS[kind](path, raw), ckey[3], self.grids)
+
+        with self._lock:
+            if twin is None:
+                self._by_content[ckey] = value
+            self._entries[key] = (sig, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def _content_hash(self, base, sig):
+        """
+        ((size, crc32), bytes) of a file. The bytes are read (once, and then
+        handed to the reader) only when the file changed since it was last
+        hashed; otherwise they are None and the reader opens the file.
+        """
+        with self._lock:
+            entry = self._hashes.get(base)
+        if entry is not None and entry[0] == sig:
+            return entry[1], None
+        with open(base, "rb") as f:
+            raw = f.read()
+        chash = (len(raw), zlib.crc32(raw))
+        with self._lock:
+            self._hashes[base] = (sig, chash)
+        return chash, raw
+
+    def duplicates(self, paths):
+        """
+        {path: first path with the same content} for the `paths` read so far
+        (files not read yet are not known). Works across data and references.
+        """
+        with self._lock:
+            hashes = dict(self._hashes)
+        first, out = {}, {}
+        for p in paths:
+            base, sheet = split_sheet(p)
+            entry = hashes.get(base)
+            if entry is None:
+                continue
+            other = first.setdefault(_sheet_hash(entry[1], sheet), p)
+            if other != p:
+                out[p] = other
+        return out
+
+    def load_data(self, path, sig=None):
+        """(x, y) for a data file."""
+        return self.get(path, "data", sig)
+
+    def load_reference(self, path, sig=None):
+        """(x, y, is_peak_list) for a reference file."""
+        return self.get(path, "ref", sig)
+
+    def pin(self, path, kind, value):
+        """Serve `value` for (kind, path) whatever the file on disk (snapshot)."""
+        value = make_dataset(path, kind, value, self.float32, self.grids)
+        with self._lock:
+            self._pinned[(kind, path)] = value
+
+    def unpin(self, path=None):
+        """Drop the pins of one path (both kinds) or all of them when path is None."""
+        with self._lock:
+            if path is None:
+                self._pinned.clear()
+                return
+            for kind in self.READERS:
+                self._pinned.pop((kind, path), None)
+
+    def is_pinned(self, path, kind=None):
+        kinds = self.READERS if kind is None else (kind,)
+        return any((k, path) in self._pinned for k in kinds)
+
+    def invalidate(self, path=None):
+        """Drop one path (both kinds, pins included) or everything when path is None."""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                self._pinned.clear()
+                self._hashes.clear()
+                return
+            self._hashes.pop(split_sheet(path)[0], None)
+            for kind in self.READERS:
+                self._entries.pop((kind, path), None)
+                self._pinned.pop((kind, path), None)
+
+    def set_float32(self, flag):
+        """Switch the storage precision; files read before are read again when next used."""
+        flag = bool(flag)
+        if flag == self.float32:
+            return False
+        with self._lock:
+            self.float32 = flag
+            self._entries.clear()
+        return True
+
+    def datasets(self, paths=None):
+        """Cached datasets (pins included), optionally only those of `paths`."""
+        with self._lock:
+            values = [v for _, v in self._entries.values()] + list(self._pinned.values())
+        if paths is not None:
+            wanted = set(paths)
+            values = [v for v in values if v.path in wanted]
+        return values
+
+    def memory_report(self, paths=None):
+        """(rows, total bytes) for the cached datasets; see dataset.memory_usage."""
+        return memory_usage(self.datasets(paths))
+
+    def __len__(self):
+        return len(self._entries) + len(self._pinned)
+
+
+# Shared cache used when no explicit cache is given
+default_cache = DatasetCache()
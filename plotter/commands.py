@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Command box parsing: turn the 'key = value' text into a dict and into the
+plotting options used by the renderer. No Tk, no pyplot.
+"""
+
+from .options import compile_mapping
+
+
+def default_commands_text():
+    """Return the default text block for the Commands tab."""
+    return (
+        "--- Normalize & stacking ---\n"
+        "normalize = off\n"
+        "offset = 0\n"
+        "refbase = -1\n"
+        "refoffset = 0\n\n"
+
+        "--- Title & labels ---\n"
+        "title = \n"
+        "xlabel = (°, Cu Kα)\n"
+        "#xlim = 10,80\n"
+        "ylabel = Intensity (a.u.)\n"
+        "#ylim = 0,10\n"
+        "#figsize_cm = 9,7\n"
+        "axes_size_cm = 7.2,7.2\n"
+        "margins_cm = 0.6,0.1,0.1,1.2\n"
+        "# Left, Right, Top, Bottom\n\n"
+
+        "--- Legend & Colors ---\n"
+        "legend = on\n"
+        "#legendpos = outside\n"
+        "colormap = rainbow\n"
+        "legend_labelspacing = 0.1\n\n"
+
+        "--- Font and linewidth Settings ---\n"
+        "font = Times New Roman\n"
+        "textcolor = black\n"
+        "linewidth = 0.5\n"
+        "reflinewidth = 2\n"
+        "label_size = 10\n"
+        "tick_size = 10\n"
+        "title_size = 12\n"
+        "legend_size = 9\n\n"
+        "square_color = black\n"
+        "data_bg = white\n"
+        "legendlinewidth = 1\n"
+        "legendlinewidthref = 1\n\n"
+
+        "--- Ticks ---\n"
+        "xtick_major = auto\n"
+        "ytick_major = off\n"
+        "xtick_minor = off\n"
+        "ytick_minor = off\n"
+    )
+
+
+def parse_commands(text):
+    """Parse 'key = value' lines into a dict (keys lowercased)."""
+    cmd_dict = {}
+    for line in text.strip().split("\n"):
+        if '=' in line:
+            key, value = line.split('=', 1)
+            cmd_dict[key.strip().lower()] = value.strip()
+    return cmd_dict
+
+
+def parse_line_styles(text):
+    """Parse line styles ('line1 = dashed', ...) from the command text."""
+    line_styles = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("line"):
+            try:
+                key, value = line.split("=")
+                key = key.strip()   # line1
+                value = value.strip()  # solid/dashed/etc
+                line_styles[key] = value
+            except:
+                pass
+    return line_styles
+
+
+def prepare_options(commands, offset_between=2.0):
+    """
+    Coerce the raw command dict into typed plotting options (as a dict).
+    Kept for older callers; see options.compile_mapping for the typed object.
+    """
+    return compile_mapping(commands, offset_between).options.as_dict()
+
+
+# -------------------- Physical sizes (cm) --------------------
+def cm_to_in(cm: float) -> float:
+    """Convert centimeters to inches."""
+    return float(cm) / 2.54
+
+
+def parse_pair_cm(commands, key: str):
+    """
+    Parse 'w,h' in centimeters for a given command key.
+    Accepts separators: ',', ';', ' ', 'x', '×'. Returns (w_cm, h_cm) or None.
+    """
+    raw = commands.get(key, "").strip()
+    if not raw:
+        return None
+    txt = raw.replace("cm", "").replace("×", "x").strip()
+    for sep in (",", ";", " ", "x"):
+        if sep in txt:
+            a, b = [p.strip() for p in txt.split(sep, 1)]
+            break
+    else:
+        return None
+    a = a.replace(",", "."); b = b.replace(",", ".")
+    return (float(a), float(b))
+
+
+def parse_margins_cm(commands):
+    """
+    Parse margins_cm = left,right,top,bottom in cm.
+    Defaults are publication-friendly: 1.5,1.0,1.0,1.2 cm.
+    """
+    raw = commands.get("margins_cm", "").strip()
+    if not raw:
+        return (1.5, 1.0, 1.0, 1.2)
+    txt = raw.replace("cm", " ")
+    for sep in (",", ";", " "):
+        if sep in txt:
+            parts = [p.strip().replace(",", ".") for p in txt.split(sep) if p.strip()]
+            break
+    else:
+        parts = [txt.replace(",", ".")]
+    if len(parts) != 4:
+        return (1.5, 1.0, 1.0, 1.2)
+    L, R, T, B = map(float, parts)
+    return (L, R, T, B)
+
+
+def axes_size_is_square(commands, tol_cm: float = 1e-2) -> bool:
+    """
+    Return True if axes_size_cm is defined and width ≈ height (within tol_cm, in cm).
+    """
+    pair = parse_pair_cm(commands, "axes_size_cm")
+    if not pair:
+        return False
+    w_cm, h_cm = pair
+    return abs(w_cm - h_cm) <= tol_cm
+
+
+def panel_grid(commands):
+    """(rows, cols) from 'panels', or None for a single plot."""
+    try:
+        rows, cols = (int(v) for v in parse_pair_cm(commands, "panels"))
+    except Exception:
+        return None
+    if rows < 1 or cols < 1 or rows * cols == 1:
+        return None
+    return rows, cols
@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+"""
+Batch conversion of instrument files to clean two-column files.
+
+Everything the readers understand (headered .xy, .dat/.txt, .gr with a
+PDFgetX3 header, semicolon/decimal-comma CSV, Excel peak lists) is written
+back as a plain "x y" .xy file or as a binary .npy array (2 x N), with
+optional resampling on a regular x grid and an x unit change (2θ, Q or
+d, as in units.py). Files are
+converted in a process pool, so a folder of thousands of patterns uses
+every core:
+
+    python -m plotter.convert raw_folder -o clean --step 0.01 --workers 4
+    python -m plotter.convert *.csv -o clean --format npy --x-units 2theta:q --wavelength Mo
+
+From Python:
+
+    results = convert_files(["a.csv", "b.gr"], "clean", step=0.01)
+    print(format_report(results))
+"""
+
+import os
+import sys
+import time
+import fnmatch
+import argparse
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .readers import read_data_file, read_reference_file
+from .units import XUNITS, DEFAULT_WAVELENGTH, parse_xunit, parse_wavelength, convert_x, to_two_theta
+
+
+FORMATS = ("xy", "npy")
+KINDS = ("auto", "data", "ref")
+PATTERNS = ("*.xy", "*.csv", "*.dat", "*.txt", "*.gr", "*.xlsx")
+
+ConvertResult = namedtuple("ConvertResult", "src dst kind points seconds error")
+
+
+# -------------------- one file (runs in a worker process) --------------------
+def parse_units(x_units):
+    """(from, to) x units (2theta, q, d; any alias units.parse_xunit knows) -> canonical names."""
+    try:
+        src, dst = (parse_xunit(u) for u in x_units)
+    except (TypeError, ValueError):
+        raise ValueError(f"x units must be a (from, to) pair, not {x_units!r}")
+    if src is None or dst is None:
+        raise ValueError(f"Unknown x unit in {x_units[0]!r} -> {x_units[1]!r} "
+                         f"(use {', '.join(XUNITS)})")
+    return src, dst
+
+
+def _read(path, kind):
+    """
+    (x, y, kind actually used); 'auto' tries the data reader, then the
+    reference reader when the data reader fails or gives non-numeric
+    columns (a headered semicolon / decimal-comma CSV read as text).
+    """
+    if kind == "data":
+        return (*read_data_file(path), "data")
+    if kind == "ref":
+        return (*read_reference_file(path)[:2], "ref")
+    data = None
+    try:
+        x, y = read_data_file(path)
+        data = np.asarray(x, dtype=float).ravel(), np.asarray(y, dtype=float).ravel()
+    except Exception:
+        pass
+    if data is not None and len(data[0]) and np.isfinite(data[0]).all() and np.isfinite(data[1]).all():
+        return (*data, "data")
+    try:
+        return (*read_reference_file(path)[:2], "ref")
+    except Exception:
+        if data is None or not len(data[0]):
+            raise
+        return (*data, "data")      # a few non-numeric rows: dropped by convert_file
+
+
+def resample(x, y, step=None, points=None):
+    """Linear interpolation of y on a regular grid (given `step` or number of `points`)."""
+    if len(x) < 2:
+        raise ValueError("not enough points to resample")
+    lo, hi = float(x[0]), float(x[-1])
+    if step:
+        grid = np.arange(lo, hi + float(step) * 0.5, float(step))
+    else:
+        grid = np.linspace(lo, hi, int(points))
+    return grid, np.interp(grid, x, y)
+
+
+def convert_file(src, dst, kind="auto", step=None, points=None, x_units=None,
+                 wavelength=DEFAULT_WAVELENGTH, float32=False):
+    """
+    Read `src`, clean it up and write `dst` (.xy text or .npy by extension).
+    x_units: (from, to) canonical units (parse_units), converted at
+    `wavelength` (Å). Returns a ConvertResult; errors are returned, not
+    raised, so one bad file does not stop a batch.
+    """
+    t0 = time.perf_counter()
+    try:
+        x, y, used = _read(src, kind)
+        x = np.asarray(x, dtype=float).ravel()
+        y = np.asarray(y, dtype=float).ravel()
+        n = min(len(x), len(y))
+        x, y = x[:n], y[:n]
+        if x_units and x_units[0] != x_units[1]:
+            x = convert_x(to_two_theta(x, x_units[0], wavelength), x_units[1], wavelength)
+        ok = np.isfinite(x) & np.isfinite(y)       # also points without a value in the new unit
+        if not ok.all():
+            x, y = x[ok], y[ok]
+        if len(x) == 0:
+            raise ValueError("no numeric data")
+        if len(x) > 1 and np.any(np.diff(x) < 0):
+            order = np.argsort(x, kind="stable")
+            x, y = x[order], y[order]
+        if step or points:
+            x, y = resample(x, y, step, points)
+
+        dtype = np.float32 if float32 else np.float64
+        if dst.lower().endswith(".npy"):
+            np.save(dst, np.vstack((x, y)).astype(dtype), allow_pickle=False)
+        else:
+            fmt = "%.7g" if float32 else "%.10g"
+            np.savetxt(dst, np.column_stack((x, y)), fmt=fmt, delimiter=" ",
+                       header=f"x y  (from {os.path.basename(src)})", comments="# ")
+        return ConvertResult(src, dst, used, len(x), time.perf_counter() - t0, None)
+    except Exception as e:
+        return ConvertResult(src, dst, kind, 0, time.perf_counter() - t0,
+                             str(e) or type(e).__name__)
+
+
+def _convert_task(args):
+    return convert_file(*args)
+
+
+# -------------------- batches --------------------
+def collect_files(sources, patterns=PATTERNS, recursive=False):
+    """Expand files and folders into a list of input files (folders filtered by `patterns`)."""
+    out = []
+    for src in sources:
+        if not os.path.isdir(src):
+            out.append(src)
+            continue
+        for dirpath, dirnames, filenames in os.walk(src):
+            out.extend(os.path.join(dirpath, f) for f in sorted(filenames)
+                       if any(fnmatch.fnmatch(f.lower(), p) for p in patterns))
+            if not recursive:
+                break
+            dirnames.sort()
+    return out
+
+
+def plan_outputs(files, out_dir, fmt="xy"):
+    """Output path for each input: out_dir/<stem>.<fmt>, numbered when two stems collide."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r} (use one of {', '.join(FORMATS)})")
+    used = set()
+    out = []
+    for f in files:
+        stem = os.path.splitext(os.path.basename(f))[0]
+        name, k = stem, 2
+        while os.path.normcase(name) in used:
+            name = f"{stem}_{k}"
+            k += 1
+        used.add(os.path.normcase(name))
+        out.append(os.path.join(out_dir, f"{name}.{fmt}"))
+    return out
+
+
+class BatchConverter:
+    """
+    Convert many files with a process pool (workers=0: in this process).
+    start() runs the batch in a background thread; done/count/results can
+    be polled (e.g. from Tk 'after') and cancel() stops the pending files.
+    """
+    def __init__(self, files, out_dir, fmt="xy", kind="auto", step=None, points=None,
+                 x_units=None, wavelength=None, float32=False, workers=None, only_changed=False):
+        if kind not in KINDS:
+            raise ValueError(f"Unknown kind {kind!r} (use one of {', '.join(KINDS)})")
+        self.files = list(files)
+        self.out_dir = out_dir
+        self.outputs = plan_outputs(self.files, out_dir, fmt)
+        x_units = parse_units(x_units) if x_units else None
+        wl = DEFAULT_WAVELENGTH if wavelength is None else parse_wavelength(wavelength)
+        if wl is None:
+            raise ValueError(f"Unknown wavelength {wavelength!r} (Å or an anode: Cu, Mo, ...)")
+        self._options = (kind, step, points, x_units, wl, bool(float32))
+        self.workers = (os.cpu_count() or 1) if workers is None else max(0, int(workers))
+        self.only_changed = only_changed
+        self.results = []
+        self.skipped = 0
+        self.seconds = 0.0
+        self._done = threading.Event()
+        self._cancel = threading.Event()
+        self._thread = None
+
+    # ---------- state ----------
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def count(self):
+        return len(self.results) + self.skipped
+
+    @property
+    def failures(self):
+        return [r for r in self.results if r.error]
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="plotter-convert", daemon=True)
+            self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def cancel(self):
+        self._cancel.set()
+
+    # ---------- work ----------
+    def _pending(self):
+        for src, dst in zip(self.files, self.outputs):
+            if self.only_changed:
+                try:
+                    if os.stat(dst).st_mtime_ns >= os.stat(src).st_mtime_ns:
+                        self.skipped += 1
+                        continue
+                except OSError:
+                    pass
+            yield (src, dst) + self._options
+
+    def run(self):
+        """Convert every file (blocking); returns the list of ConvertResult."""
+        t0 = time.perf_counter()
+        try:
+            os.makedirs(self.out_dir, exist_ok=True)
+            tasks = list(self._pending())
+            if self.workers == 0 or len(tasks) < 2:
+                for task in tasks:
+                    if self._cancel.is_set():
+                        break
+                    self.results.append(_convert_task(task))
+            else:
+                workers = min(self.workers, len(tasks))
+                chunk = max(1, min(32, len(tasks) // (workers * 8)))
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    for res in pool.map(_convert_task, tasks, chunksize=chunk):
+                        self.results.append(res)
+                        if self._cancel.is_set():
+                            pool.shutdown(wait=False, cancel_futures=True)
+                            break
+        finally:
+            self.seconds = time.perf_counter() - t0
+            self._done.set()
+        return self.results
+
+
+def convert_files(sources, out_dir, fmt="xy", recursive=False, **options):
+    """Convert files and/or folders into `out_dir`; returns the list of ConvertResult."""
+    files = collect_files(sources, recursive=recursive)
+    return BatchConverter(files, out_dir, fmt=fmt, **options).run()
+
+
+def format_report(results, seconds=None, skipped=0, slowest=5, failures=True):
+    """
+    Text summary: counts, total and per-file times, the slowest files and
+    (failures=True) one '[KIND] name — error' line per failure, as in the
+    Plotter error box.
+    """
+    ok = [r for r in results if not r.error]
+    bad = [r for r in results if r.error]
+    total = sum(r.seconds for r in results)
+    lines = [f"{len(ok)} converted, {len(bad)} failed"
+             + (f", {skipped} unchanged" if skipped else "")
+             + (f" in {seconds:.2f} s" if seconds is not None else "")
+             + (f" ({total / len(results) * 1000:.1f} ms per file)" if results else "")]
+    if ok and slowest:
+        lines.append("")
+        lines.append("Slowest files:")
+        for r in sorted(ok, key=lambda r: r.seconds, reverse=True)[:slowest]:
+            lines.append(f"  {r.seconds * 1000:8.1f} ms  {os.path.basename(r.src)} ({r.points} points)")
+    if bad and failures:
+        lines.append("")
+        lines.append("Failed:")
+        for r in bad:
+            label = "REF" if r.kind == "ref" else "DATA"
+            lines.append(f"[{label}] {os.path.basename(r.src)} — {r.error}")
+    return "\n".join(lines)
+
+
+# -------------------- command line --------------------
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Convert instrument files to clean two-column files")
+    ap.add_argument("sources", nargs="+", help="files and/or folders")
+    ap.add_argument("-o", "--out", required=True, help="output folder")
+    ap.add_argument("--format", choices=FORMATS, default="xy",
+                    help="xy = text 'x y' columns, npy = binary 2 x N array")
+    ap.add_argument("--kind", choices=KINDS, default="auto",
+                    help="reader to use (auto: data reader, then reference reader)")
+    ap.add_argument("--step", type=float, help="resample on a regular x grid with this step")
+    ap.add_argument("--points", type=int, help="resample on this many regular x points")
+    ap.add_argument("--x-units", metavar="FROM:TO",
+                    help=f"convert x units ({', '.join(XUNITS)}), e.g. 2theta:q or q:d")
+    ap.add_argument("--wavelength", help="wavelength for --x-units, in Å or an anode "
+                                         "(Cu, Mo, ...; default Cu Kα1)")
+    ap.add_argument("--float32", action="store_true", help="single precision output")
+    ap.add_argument("--workers", type=int, default=None,
+                    help="worker processes (default: one per core, 0 = no pool)")
+    ap.add_argument("-r", "--recursive", action="store_true", help="also convert sub-folders")
+    ap.add_argument("--only-changed", action="store_true",
+                    help="skip files whose output is newer than the input")
+    ap.add_argument("-v", "--verbose", action="store_true", help="one line per file")
+    args = ap.parse_args(argv)
+
+    units = tuple(args.x_units.split(":", 1)) if args.x_units else None
+    if units is not None and len(units) != 2:
+        ap.error("--x-units must look like FROM:TO")
+    files = collect_files(args.sources, recursive=args.recursive)
+    if not files:
+        ap.error("no input files")
+    try:
+        job = BatchConverter(files, args.out, fmt=args.format, kind=args.kind, step=args.step,
+                             points=args.points, x_units=units, wavelength=args.wavelength,
+                             float32=args.float32,
+                             workers=args.workers, only_changed=args.only_changed)
+    except ValueError as e:
+        ap.error(str(e))
+    job.run()
+    if args.verbose:
+        for r in job.results:
+            state = r.error or f"{r.points} points"
+            print(f"{r.seconds * 1000:8.1f} ms  {r.src} -> {r.dst}  ({state})")
+    print(format_report(job.results, job.seconds, job.skipped))
+    return 1 if job.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Compact in-memory record of a loaded file.
+
+A Dataset keeps x and y as contiguous read-only arrays (float64, or
+float32 with 'data_float32 = on': half the memory, ~7 significant
+digits), in a __slots__ object without a per-instance dict. Files that
+share the same x grid (every pattern of an in-situ series, usually) share
+a single x array through a GridPool, and identical y arrays (the same
+pattern loaded twice) are shared the same way.
+
+A Dataset unpacks like the tuples the readers return, so existing code
+keeps working:
+
+    x, y = cache.load_data(path)
+    x, y, is_peak_list = cache.load_reference(path)
+"""
+
+import os
+import zlib
+import weakref
+import threading
+
+import numpy as np
+
+
+class Dataset:
+    """Parsed content of one data ('data') or reference ('ref') file."""
+    __slots__ = ("path", "kind", "x", "y", "is_peak_list", "__weakref__")
+
+    def __init__(self, path, kind, x, y, is_peak_list=False):
+        self.path = path
+        self.kind = kind
+        self.x = x
+        self.y = y
+        self.is_peak_list = bool(is_peak_list)
+
+    def __iter__(self):
+        yield self.x
+        yield self.y
+        if self.kind == "ref":
+            yield self.is_peak_list
+
+    def __getitem__(self, i):
+        return tuple(self)[i]
+
+    @property
+    def points(self):
+        return len(self.y)
+
+    @property
+    def nbytes(self):
+        """Bytes of the arrays (a shared x grid is counted in full here)."""
+        return self.x.nbytes + self.y.nbytes
+
+    def __repr__(self):
+        return (f"Dataset({os.path.basename(str(self.path))!r}, {self.kind}, "
+                f"{self.points} points, {self.y.dtype})")
+
+
+def _compact(a, dtype):
+    """Contiguous 1-D copy (or view when already right) in `dtype`."""
+    return np.ascontiguousarray(np.asarray(a).ravel(), dtype=dtype)
+
+
+class GridPool:
+    """
+    Interns arrays: an array identical to one already held (same length,
+    dtype and values) is replaced by that array. Only weak references are
+    kept, so an array disappears with the last dataset using it.
+    """
+    def __init__(self):
+        self._grids = weakref.WeakValueDictionary()    # (n, dtype, crc, x0, x1) -> array
+        self._lock = threading.Lock()
+        self.shared = 0
+
+    def intern(self, x):
+        if len(x) == 0:
+            return x
+        key = (len(x), x.dtype.str, zlib.crc32(x), float(x[0]), float(x[-1]))
+        with self._lock:
+            held = self._grids.get(key)
+            if held is not None and np.array_equal(held, x):
+                self.shared += 1
+                return held
+            self._grids[key] = x
+        return x
+
+
+def make_dataset(path, kind, value, float32=False, grids=None):
+    """
+    Dataset from a reader result ((x, y) or (x, y, is_peak_list)):
+    compact arrays, shared through `grids` when given, frozen.
+    """
+    dtype = np.float32 if float32 else np.float64
+    x, y = _compact(value[0], dtype), _compact(value[1], dtype)
+    if grids is not None:
+        x, y = grids.intern(x), grids.intern(y)
+    for a in (x, y):
+        try:
+            a.setflags(write=False)
+        except ValueError:      # a view on someone else's buffer
+            pass
+    is_peak_list = value[2] if kind == "ref" and len(value) > 2 else False
+    return Dataset(path, kind, x, y, is_peak_list)
+
+
+# -------------------- memory report --------------------
+def memory_usage(datasets):
+    """
+    Rows (path, kind, points, dtype, x bytes, y bytes, shared) and the
+    total bytes, every shared array counted once. `shared` is '', 'x'
+    (grid of another file) or 'all' (same data as another file).
+    """
+    rows, seen, total = [], set(), 0
+    for ds in datasets:
+        sizes = []
+        for a in (ds.x, ds.y):
+            if id(a) in seen:
+                sizes.append(0)
+            else:
+                seen.add(id(a))
+                sizes.append(a.nbytes)
+        total += sum(sizes)
+        shared = "all" if sizes[1] == 0 and ds.y.nbytes else "x" if sizes[0] == 0 and ds.x.nbytes else ""
+        rows.append((ds.path, ds.kind, ds.points, ds.y.dtype.name, sizes[0], sizes[1], shared))
+    return rows, total
+
+
+def _size(n):
+    for unit in ("B", "kB", "MB"):
+        if n < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024.0
+    return f"{n:.2f} GB"
+
+
+def format_memory_report(rows, total, limit=None):
+    """Text table of memory_usage() (largest first, `limit` rows at most)."""
+    rows = sorted(rows, key=lambda r: r[4] + r[5], reverse=True)
+    lines = [f"{len(rows)} files in memory, {_size(total)} in total"]
+    grids = sum(1 for r in rows if r[6] == "x")
+    if grids:
+        lines.append(f"{grids} files share the x grid of another file")
+    copies = sum(1 for r in rows if r[6] == "all")
+    if copies:
+        lines.append(f"{copies} files are identical to another one (stored once)")
+    lines.append("")
+    notes = {"": "", "x": "  (x shared)", "all": "  (duplicate)"}
+    for path, kind, points, dtype, xb, yb, shared in rows[:limit]:
+        note = notes[shared]
+        lines.append(f"{_size(xb + yb):>10}  {kind:<4} {points:>8} pts {dtype:<7} "
+                     f"{os.path.basename(str(path))}{note}")
+    if limit is not None and len(rows) > limit:
+        lines.append(f"… and {len(rows) - limit} more")
+    return "\n".join(lines)
@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-format export: one figure, several files, one action.
+
+    export_formats = png:300, pdf, svg, png:600
+
+The cm sizing and the style are applied once. Raster outputs at the same
+DPI share one Agg render (the RGBA buffer is encoded to PNG / TIFF / JPEG
+with Pillow); vector formats are rendered one after the other (a figure
+cannot be drawn by two threads at once), and encoding/compressing and
+writing the files run in a thread pool while the next format renders.
+
+Tiled raster export (export_tiled): very large PNG/TIFF images are drawn
+in horizontal strips (savefig restricted to a strip's bounding box) and
+each strip is appended to a streaming PNG/TIFF writer, so memory stays
+bounded by the strip size whatever the DPI and the figure size.
+"""
+
+import io
+import os
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+import numpy as np
+from PIL import Image
+from matplotlib.transforms import Bbox
+
+from .render import apply_physical_size_from_cm, export_dpi, style_context
+from .options import compile_mapping
+
+RASTER_FORMATS = {"png": "PNG", "tif": "TIFF", "tiff": "TIFF", "jpg": "JPEG", "jpeg": "JPEG"}
+VECTOR_FORMATS = ("pdf", "svg", "eps", "ps")
+TILED_FORMATS = ("png", "tif", "tiff")
+MAX_DPI = 1200              # one Agg buffer for the whole image
+TILED_MAX_DPI = 4800        # strips: memory does not grow with the DPI
+TILE_THRESHOLD = 256 * 1024 * 1024      # 'export_tiled = auto': tile above this RGBA size
+STRIP_BYTES = 32 * 1024 * 1024          # RGBA bytes drawn per strip
+
+
+def parse_export_profile(value, default_dpi=300):
+    """
+    'png:300, pdf, svg' -> [('png', 300), ('pdf', None), ('svg', None)]
+    (dpi None for vector formats; raster formats without dpi use default_dpi).
+    Unknown formats raise ValueError.
+    """
+    profile = []
+    for token in str(value or "").replace(";", ",").split(","):
+        token = token.strip().lower().lstrip(".")
+        if not token:
+            continue
+        fmt, _, dpi = token.partition(":")
+        fmt = fmt.strip()
+        if fmt in RASTER_FORMATS:
+            dpi = int(float(dpi)) if dpi.strip() else int(default_dpi)
+            entry = (fmt, max(72, min(TILED_MAX_DPI if fmt in TILED_FORMATS else MAX_DPI, dpi)))
+        elif fmt in VECTOR_FORMATS:
+            entry = (fmt, None)
+        else:
+            raise ValueError(f"Unknown export format {fmt!r} "
+                             f"(use {', '.join(list(RASTER_FORMATS) + list(VECTOR_FORMATS))})")
+        if entry not in profile:
+            profile.append(entry)
+    return profile
+
+
+def output_paths(base, profile):
+    """File name for each profile entry: base.ext, base_600dpi.png when an extension repeats."""
+    base = os.path.splitext(base)[0]
+    counts = {}
+    for fmt, _ in profile:
+        counts[fmt] = counts.get(fmt, 0) + 1
+    return [f"{base}_{dpi}dpi.{fmt}" if counts[fmt] > 1 else f"{base}.{fmt}"
+            for fmt, dpi in profile]
+
+
+def _write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def _encode_raster(path, size, rgba, fmt, dpi):
+    """Encode a raw RGBA buffer from savefig(format='rgba') and write it."""
+    img = Image.frombuffer("RGBA", size, rgba, "raw", "RGBA", 0, 1)
+    kind = RASTER_FORMATS[fmt]
+    if kind == "JPEG":
+        background = Image.new("RGB", img.size, "white")
+        background.paste(img, mask=img.getchannel("A"))
+        img = background
+    options = {"dpi": (dpi, dpi)}
+    if kind == "JPEG":
+        options["quality"] = 95
+    img.save(path, kind, **options)
+    return path
+
+
+def export_many(fig, base, commands=None, profile=None, workers=4):
+    """
+    Write `fig` in every format of `profile` (list from parse_export_profile;
+    default: the 'export_formats' command). `base` is the output path
+    without (or with any) extension. Returns the written paths in profile order.
+    """
+    commands = commands or {}
+    cc = compile_mapping(commands) if commands else None
+    if profile is None:
+        profile = parse_export_profile(cc.options.export_formats if cc else "",
+                                       export_dpi(commands, TILED_MAX_DPI) if commands else 300)
+    if not profile:
+        raise ValueError("No export format given (e.g. export_formats = png:300, pdf, svg)")
+    paths = output_paths(base, profile)
+    apply_physical_size_from_cm(fig, commands)
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=max(1, int(workers))) as pool, \
+            (style_context(commands) if commands else nullcontext()):
+        # Raster: one Agg render per DPI, shared by every raster format at that DPI
+        renders = {}
+        for path, (fmt, dpi) in zip(paths, profile):
+            if fmt not in RASTER_FORMATS:
+                continue
+            if fmt in TILED_FORMATS and use_tiles(fig, dpi, commands):
+                export_tiled(fig, path, dpi=dpi)      # strip by strip, written as it goes
+                continue
+            dpi = min(dpi, MAX_DPI)
+            if dpi not in renders:
+                buf = io.BytesIO()
+                fig.savefig(buf, format="rgba", dpi=dpi, facecolor="white", bbox_inches=None)
+                rgba = buf.getvalue()
+                h = int(fig.get_size_inches()[1] * dpi)     # Agg truncates the pixel size
+                renders[dpi] = ((len(rgba) // (4 * h), h), rgba)
+            size, rgba = renders[dpi]
+            futures.append(pool.submit(_encode_raster, path, size, rgba, fmt, dpi))
+        renders = None
+        # Vector: rendered in turn, written in the background
+        for path, (fmt, dpi) in zip(paths, profile):
+            if fmt in RASTER_FORMATS:
+                continue
+            buf = io.BytesIO()
+            fig.savefig(buf, format=fmt, facecolor="white", bbox_inches=None)
+            futures.append(pool.submit(_write, path, buf.getvalue()))
+        for f in futures:
+            f.result()          # re-raise the first write error
+    return paths
+
+
+# -------------------- tiled raster export --------------------
+def pixel_size(fig, dpi):
+    """(width, height) in pixels of `fig` at `dpi`, as Agg allocates it."""
+    w, h = fig.get_size_inches() * dpi
+    return int(w), int(h)
+
+
+def use_tiles(fig, dpi, commands=None):
+    """Whether a PNG/TIFF at `dpi` is drawn in strips ('export_tiled = auto/on/off')."""
+    mode = compile_mapping(commands).options.export_tiled if commands else "auto"
+    if mode in ("on", "yes", "true", "1"):
+        return True
+    if mode in ("off", "no", "false", "0"):
+        return False
+    w, h = pixel_size(fig, dpi)
+    return dpi > MAX_DPI or 4 * w * h > TILE_THRESHOLD
+
+
+class _PngStream:
+    """PNG writer fed with RGBA rows (filter 'Sub', one zlib stream over every IDAT)."""
+    def __init__(self, f, width, height, dpi):
+        self.f, self.width = f, width
+        self._z = zlib.compressobj(6)
+        f.write(b"\x89PNG\r\n\x1a\n")
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+        ppm = int(round(dpi / 0.0254))
+        self._chunk(b"pHYs", struct.pack(">IIB", ppm, ppm, 1))
+
+    def _chunk(self, kind, data):
+        self.f.write(struct.pack(">I", len(data)) + kind + data)
+        self.f.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind))))
+
+    def write(self, rgba):
+        rows = rgba.reshape(-1, self.width * 4)
+        out = np.empty((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+        out[:, 0] = 1                                   # 'Sub': difference with the pixel on the left
+        out[:, 1:5] = rows[:, :4]
+        np.subtract(rows[:, 4:], rows[:, :-4], out=out[:, 5:])
+        data = self._z.compress(out.tobytes())
+        if data:
+            self._chunk(b"IDAT", data)
+
+    def close(self):
+        self._chunk(b"IDAT", self._z.flush())
+        self._chunk(b"IEND", b"")
+
+
+class _TiffStream:
+    """
+    Uncompressed RGBA TIFF written strip by strip; the directory (strip
+    offsets) goes at the end. BigTIFF (64-bit offsets) above 4 GB.
+    """
+    def __init__(self, f, width, height, dpi, rows_per_strip):
+        self.f, self.width, self.height = f, width, height
+        self.dpi, self.rows_per_strip = dpi, rows_per_strip
+        self.big = width * height * 4 > 0xFFFFFFFF - (1 << 24)
+        self._offsets, self._counts = [], []
+        self._start = f.tell()
+        if self.big:
+            f.write(b"II" + struct.pack("<HHHQ", 43, 8, 0, 0))
+        else:
+            f.write(b"II" + struct.pack("<HI", 42, 0))
+
+    def write(self, rgba):
+        data = np.ascontiguousarray(rgba).tobytes()
+        self._offsets.append(self.f.tell() - self._start)
+        self._counts.append(len(data))
+        self.f.write(data)
+
+    def close(self):
+        f, big = self.f, self.big
+        SHORT, LONG, RATIONAL, LONG8 = 3, 4, 5, 16
+        off_type = LONG8 if big else LONG
+        res = (int(round(self.dpi * 1000)), 1000)
+        tags = [
+            (256, LONG, [self.width]),
+            (257, LONG, [self.height]),
+            (258, SHORT, [8, 8, 8, 8]),
+            (259, SHORT, [1]),                  # no compression
+            (262, SHORT, [2]),                  # RGB
+            (273, off_type, self._offsets),
+            (277, SHORT, [4]),
+            (278, LONG, [self.rows_per_strip]),
+            (279, off_type, self._counts),
+            (282, RATIONAL, [res]),
+            (283, RATIONAL, [res]),
+            (284, SHORT, [1]),                  # chunky RGBA
+            (296, SHORT, [2]),                  # resolution in inches
+            (338, SHORT, [2]),                  # 4th sample = unassociated alpha
+        ]
+        fmt = {SHORT: "H", LONG: "I", LONG8: "Q", RATIONAL: "II"}
+        inline = 8 if big else 4
+        if f.tell() % 2:
+            f.write(b"\0")
+        ifd = f.tell() - self._start
+        entry_size = 20 if big else 12
+        head = struct.calcsize("<Q" if big else "<H")
+        extra = ifd + head + len(tags) * entry_size + (8 if big else 4)
+        entries, blobs = [], []
+        for tag, typ, values in tags:
+            flat = [v for val in values for v in (val if isinstance(val, tuple) else (val,))]
+            data = struct.pack("<" + fmt[typ] * len(values), *flat)
+            if len(data) <= inline:
+                field = data.ljust(inline, b"\0")
+            else:
+                field = struct.pack("<Q" if big else "<I", extra)
+                blobs.append(data)
+                extra += len(data) + len(data) % 2
+                blobs.append(b"\0" * (len(data) % 2))
+            count = struct.pack("<Q" if big else "<I", len(values))
+            entries.append(struct.pack("<HH", tag, typ) + count + field)
+        f.write(struct.pack("<Q" if big else "<H", len(tags)))
+        f.write(b"".join(entries))
+        f.write(struct.pack("<Q" if big else "<I", 0))      # no next directory
+        f.write(b"".join(blobs))
+        end = f.tell()
+        f.seek(self._start + (8 if big else 4))
+        f.write(struct.pack("<Q" if big else "<I", ifd))
+        f.seek(end)
+
+
+def export_tiled(fig, file_path, commands=None, dpi=None, fmt=None, strip_bytes=STRIP_BYTES):
+    """
+    Save `fig` as PNG or TIFF drawn in horizontal strips of about
+    `strip_bytes` each (peak memory bounded, whatever the DPI). Sizes in cm
+    are kept exactly as in export_figure. `file_path` may be a binary file.
+    """
+    commands = commands or {}
+    apply_physical_size_from_cm(fig, commands)
+    if dpi is None:
+        dpi = export_dpi(commands, TILED_MAX_DPI)
+    if fmt is None:
+        fmt = os.path.splitext(str(file_path))[1]
+    fmt = fmt.lower().lstrip(".")
+    if fmt not in TILED_FORMATS:
+        raise ValueError(f"Tiled export writes png or tiff, not {fmt!r}")
+    width, height = pixel_size(fig, dpi)
+    fig_w = fig.get_size_inches()[0]
+    rows = max(1, min(height, int(strip_bytes // (4 * width))))
+
+    own = not hasattr(file_path, "write")
+    f = open(file_path, "wb") if own else file_path
+    try:
+        if fmt == "png":
+            writer = _PngStream(f, width, height, dpi)
+        else:
+            writer = _TiffStream(f, width, height, dpi, rows)
+        with style_context(commands) if commands else nullcontext():
+            for r0 in range(0, height, rows):
+                r1 = min(height, r0 + rows)
+                # Strip = pixel rows r0..r1 from the top; the bbox is in inches from the bottom
+                strip = Bbox.from_extents(0, (height - r1) / dpi, fig_w, (height - r0) / dpi)
+                buf = io.BytesIO()
+                fig.savefig(buf, format="rgba", dpi=dpi, facecolor="white", bbox_inches=strip)
+                rgba = np.frombuffer(buf.getbuffer(), dtype=np.uint8)
+                rgba = _fit_strip(rgba, r1 - r0, width)
+                writer.write(rgba)
+                del rgba, buf
+        writer.close()
+    finally:
+        if own:
+            f.close()
+    return file_path
+
+
+def _fit_strip(rgba, rows, width):
+    """
+    The strip as (rows, width, 4): Agg sizes it from the bbox in inches, so
+    it can come out one pixel short or long; pad/crop to the exact size.
+    """
+    got_w = width if len(rgba) % (4 * width) == 0 else None
+    if got_w is None:
+        for w in (width + 1, width - 1):
+            if w > 0 and len(rgba) % (4 * w) == 0:
+                got_w = w
+                break
+    got_h = len(rgba) // (4 * got_w)
+    img = rgba.reshape(got_h, got_w, 4)[:rows, :width]
+    if img.shape[0] < rows or img.shape[1] < width:
+        full = np.full((rows, width, 4), (255, 255, 255, 0), dtype=np.uint8)
+        full[:img.shape[0], :img.shape[1]] = img
+        img = full
+    return img
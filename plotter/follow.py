@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+Follow-folder ingestion for in-situ / time-resolved runs.
+
+New files matching a glob are picked up in natural sort order. Only the
+last `keep` patterns stay as full curves; older ones are compacted into a
+PatternArchive (one float32 row per pattern on a common x grid, rows
+merged pairwise when full), so memory and draw time stay bounded.
+Evicted files are read and archived in a background thread (a folder
+with a long backlog does not hold up start()); poll() reports how many
+were archived since the last call.
+"""
+
+import os
+import re
+import copy
+import threading
+from collections import namedtuple, deque
+
+import numpy as np
+
+from .readers import read_data_file
+from .watch import FileWatcher, matches
+
+
+FollowUpdate = namedtuple("FollowUpdate", "added evicted archived", defaults=(0,))
+
+_DIGITS = re.compile(r"(\d+)")
+
+
+def natural_key(path):
+    """Sort key so that 'scan_2' < 'scan_10' (case-insensitive)."""
+    name = os.path.basename(path).lower()
+    return [int(t) if t.isdigit() else t for t in _DIGITS.split(name)]
+
+
+def natural_sorted(paths):
+    return sorted(paths, key=natural_key)
+
+
+class PatternArchive:
+    """
+    Downsampled history of evicted patterns (heatmap rows).
+
+    bins:     x resolution of the common grid (set from the first pattern)
+    max_rows: when reached, adjacent rows are averaged pairwise, so the
+              array never grows past max_rows x bins float32
+    """
+    def __init__(self, bins=1024, max_rows=2048):
+        self.bins = int(bins)
+        self.max_rows = max(2, int(max_rows) // 2 * 2)
+        self.x = None
+        self._rows = np.empty((0, self.bins), dtype=np.float32)
+        self._n = 0
+        self.weights = []        # number of patterns merged in each row
+        self.names = []          # (first, last) file name covered by each row
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def rows(self):
+        return self._rows[:self._n]
+
+    @property
+    def count(self):
+        """Total number of patterns archived."""
+        return int(sum(self.weights))
+
+    @property
+    def nbytes(self):
+        return self._rows.nbytes + (self.x.nbytes if self.x is not None else 0)
+
+    def _resample(self, x, y):
+        """Bin-average (x, y) onto the grid; empty bins are interpolated."""
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        x0, x1 = self.x[0], self.x[-1]
+        inside = (x >= x0) & (x <= x1)
+        idx = np.clip(((x[inside] - x0) / (x1 - x0) * (self.bins - 1)).round().astype(int),
+                      0, self.bins - 1)
+        sums = np.bincount(idx, weights=y[inside], minlength=self.bins)
+        counts = np.bincount(idx, minlength=self.bins)
+        out = np.full(self.bins, np.nan)
+        filled = counts > 0
+        out[filled] = sums[filled] / counts[filled]
+        if not filled.all() and len(x) > 1:
+            order = np.argsort(x)
+            out[~filled] = np.interp(self.x[~filled], x[order], y[order],
+                                     left=np.nan, right=np.nan)
+        return out.astype(np.float32)
+
+    def add(self, name, x, y):
+        """Append one pattern as a new heatmap row."""
+        if self.x is None:
+            lo, hi = float(np.nanmin(x)), float(np.nanmax(x))
+            if hi <= lo:
+                hi = lo + 1.0
+            self.x = np.linspace(lo, hi, self.bins)
+        row = self._resample(x, y)
+
+        if self._n == self.max_rows:
+            self._compact()
+        if self._n == len(self._rows):
+            grow = min(self.max_rows, max(16, 2 * len(self._rows)))
+            rows = np.empty((grow, self.bins), dtype=np.float32)
+            rows[:self._n] = self._rows[:self._n]
+            self._rows = rows
+        self._rows[self._n] = row
+        self._n += 1
+        self.weights.append(1)
+        self.names.append((name, name))
+
+    def copy(self):
+        """Independent snapshot (rows are compacted in place)."""
+        other = copy.copy(self)
+        other._rows = self._rows[:self._n].copy()
+        other.weights = list(self.weights)
+        other.names = list(self.names)
+        return other
+
+    def _compact(self):
+        """Average rows pairwise (weighted), halving the time resolution."""
+        n = self._n
+        w = np.asarray(self.weights, dtype=np.float32)[:, None]
+        a, b = self._rows[0:n:2], self._rows[1:n:2]
+        wa, wb = w[0::2], w[1::2]
+        with np.errstate(invalid="ignore"):
+            merged = np.where(np.isnan(a), b, np.where(np.isnan(b), a, (a * wa + b * wb) / (wa + wb)))
+        half = n // 2
+        self._rows[:half] = merged
+        self._n = half
+        self.weights = [self.weights[i] + self.weights[i + 1] for i in range(0, n, 2)]
+        self.names = [(self.names[i][0], self.names[i + 1][1]) for i in range(0, n, 2)]
+
+
+def draw_history(ax, archive, cmap="viridis", xlabel=None):
+    """Draw a PatternArchive as a heatmap (x vs pattern number) on `ax`."""
+    ax.clear()
+    if not len(archive):
+        ax.set_axis_off()
+        return None
+    # Rows may cover different numbers of patterns after compaction: use
+    # their cumulative weights as row edges so the y axis stays in pattern #
+    x = archive.x
+    half = (x[1] - x[0]) / 2.0 if len(x) > 1 else 0.5
+    x_edges = np.concatenate(([x[0] - half], (x[:-1] + x[1:]) / 2.0, [x[-1] + half]))
+    y_edges = np.concatenate(([0], np.cumsum(archive.weights)))
+    im = ax.pcolormesh(x_edges, y_edges, np.ma.masked_invalid(archive.rows),
+                       cmap=cmap, shading="flat")
+    ax.set_ylabel("Pattern #")
+    if xlabel:
+        ax.set_xlabel(xlabel)
+    return im
+
+
+class FolderFollower:
+    """
+    Follow `directory` for files matching `pattern`.
+
+    files:   the last `keep` files, natural order (the curves to plot)
+    archive: PatternArchive with every older pattern (filled in a
+             background thread: read it through history())
+    """
+    def __init__(self, directory, pattern="*.xy", keep=50, bins=1024, max_rows=2048,
+                 settle=0.5, reader=read_data_file):
+        self.directory = os.path.normpath(directory)
+        self.patterns = tuple(p.strip() for p in pattern.split(";") if p.strip()) or ("*",)
+        self.keep = max(1, int(keep))
+        self.reader = reader
+        self.archive = PatternArchive(bins=bins, max_rows=max_rows)
+        self.files = []
+        self.errors = []         # (path, exception) for patterns that could not be archived
+        self._watcher = FileWatcher(settle=settle)
+        self._to_archive = deque()
+        self._archived = 0       # archived since the last poll()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """
+        Take the files already present: keep the newest, archive the rest
+        (in the background). Returns the kept files.
+        """
+        self._watcher.add_directory(self.directory, self.patterns, track=False)
+        existing = [p for p in self._list() if p not in self.files]
+        self.files = natural_sorted(self.files + existing)
+        self._evict()
+        return list(self.files)
+
+    @property
+    def archiving(self):
+        """Number of evicted files not archived yet."""
+        with self._lock:
+            return len(self._to_archive)
+
+    def history(self):
+        """Snapshot of the archive, safe to draw while the background thread adds to it."""
+        with self._lock:
+            return self.archive.copy()
+
+    def poll(self, now=None):
+        """
+        Return FollowUpdate(added, evicted, archived) when new files settled
+        or evicted files were archived, else None.
+        """
+        batch = self._watcher.poll(now)
+        added = [p for p in natural_sorted(batch.added) if p not in self.files] if batch else []
+        evicted = []
+        if added:
+            self.files = natural_sorted(self.files + added)
+            evicted = self._evict()
+        with self._lock:
+            archived, self._archived = self._archived, 0
+        if not (added or archived):
+            return None
+        return FollowUpdate(added=tuple(p for p in added if p in self.files),
+                            evicted=tuple(evicted), archived=archived)
+
+    def _list(self):
+        try:
+            with os.scandir(self.directory) as it:
+                return [os.path.join(self.directory, e.name) for e in it
+                        if matches(e.name, self.patterns) and e.is_file()]
+        except OSError:
+            return []
+
+    def _evict(self):
+        """Move everything but the last `keep` files into the archive."""
+        extra = len(self.files) - self.keep
+        if extra <= 0:
+            return []
+        evicted, self.files = self.files[:extra], self.files[extra:]
+        with self._lock:
+            self._to_archive.extend(evicted)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._archive_queued,
+                                                name="plotter-follow-archive", daemon=True)
+                self._thread.start()
+        return evicted
+
+    def _archive_queued(self):
+        """Background thread: read and archive evicted files in order, until none is left."""
+        while True:
+            with self._lock:
+                if not self._to_archive:
+                    self._thread = None
+                    return
+                path = self._to_archive[0]
+            try:
+                x, y = self.reader(path)
+                error = None
+            except Exception as e:
+                error = e
+            with self._lock:
+                self._to_archive.popleft()
+                if error is None:
+                    try:
+                        self.archive.add(os.path.basename(path), x, y)
+                        self._archived += 1
+                    except Exception as e:
+                        error = e
+                if error is not None:
+                    self.errors.append((path, error))
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Font resolution and text warm-up.
+
+The first draw with a new 'font' makes matplotlib score every installed
+font (findfont) and load the font file; a missing font additionally logs
+a warning for every text drawn. resolve_font() checks a family once
+(memoized) and substitutes a generic family when it is not installed;
+warm_fonts() does the lookups and lays out a sample text with an Agg
+renderer in a background thread at startup, so the font file is read
+and parsed before the first draw without blocking the GUI thread.
+"""
+
+import threading
+from functools import lru_cache
+
+from matplotlib import font_manager
+from matplotlib.font_manager import FontProperties
+
+
+GENERIC_FAMILIES = ("serif", "sans-serif", "monospace", "cursive", "fantasy")
+FALLBACK_FAMILY = "serif"
+
+# Characters met in axis labels, ticks and legends
+_SAMPLE = "0123456789.,−-+() abcdefghijklmnopqrstuvwxyz ABCDEFGHIJKLMNOPQRSTUVWXYZ 2θ° Å⁻¹"
+
+
+@lru_cache(maxsize=64)
+def resolve_font(name):
+    """
+    Return (family to use, found). Generic families are always found;
+    an unknown family is replaced by FALLBACK_FAMILY.
+    """
+    name = (name or "").strip() or FALLBACK_FAMILY
+    if name.lower() in GENERIC_FAMILIES:
+        return name.lower(), True
+    try:
+        font_manager.fontManager.findfont(FontProperties(family=name), fallback_to_default=False)
+        return name, True
+    except Exception:
+        return FALLBACK_FAMILY, False
+
+
+def warm_text(family, sizes=(10.0,)):
+    """Measure a sample text so the font file and glyphs are loaded (calling thread)."""
+    from matplotlib.backends.backend_agg import RendererAgg
+    family = resolve_font(family)[0]
+    renderer = RendererAgg(8, 8, 72)
+    for size in sorted(set(sizes)):
+        try:
+            renderer.get_text_width_height_descent(
+                _SAMPLE, FontProperties(family=family, size=size), ismath=False)
+        except Exception:
+            pass
+
+
+def warm_fonts(families, sizes=(10.0,), background=True):
+    """
+    Resolve `families`, pre-compute the font lookups for `sizes` and
+    measure a sample text in each (warm_text). In the background by
+    default; returns the thread (or None).
+    """
+    families = tuple(dict.fromkeys(f for f in families if f))
+    sizes = tuple(sizes)
+
+    def _run():
+        for fam in families:
+            family = resolve_font(fam)[0]
+            for size in sizes:
+                try:
+                    font_manager.findfont(FontProperties(family=family, size=size))
+                except Exception:
+                    pass
+            warm_text(family, sizes)
+
+    if not background:
+        _run()
+        return None
+    t = threading.Thread(target=_run, name="plotter-font-warmup", daemon=True)
+    t.start()
+    return t
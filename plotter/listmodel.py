@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Row bookkeeping for the Data/References lists.
+
+The Python list of paths stays the source of truth. FileListModel keeps a
+stable row id (Treeview iid) per entry plus a path -> iids index. The
+edits (add, remove, move) return just the rows the view has to touch;
+sync() diffs a whole new list (after a bulk replacement: project opened,
+relink...) and tells the view which rows to delete, insert or relabel
+instead of rebuilding the whole tree. Moves/reversals are done on the
+model and written back to the list without reading the Treeview.
+"""
+
+from collections import namedtuple
+
+
+ListDiff = namedtuple("ListDiff", "removed added relabelled reordered")
+
+
+class FileListModel:
+    """
+    order:   row ids in the same order as the backing list
+    visible: row ids shown with the current filter (== order when no filter)
+    """
+    def __init__(self, prefix="row"):
+        self.prefix = prefix
+        self._next = 0
+        self.order = []
+        self.visible = []
+        self.query = ""
+        self._path = {}          # iid -> path
+        self._label = {}         # iid -> label currently shown
+        self._by_path = {}       # path -> [iid, ...] (a path may be listed twice)
+
+    def __len__(self):
+        return len(self.order)
+
+    def _new_iid(self):
+        self._next += 1
+        return "%s%d" % (self.prefix, self._next)
+
+    # ---------- lookups ----------
+    def path(self, iid):
+        return self._path.get(iid)
+
+    def label(self, iid):
+        return self._label.get(iid)
+
+    def set_label(self, iid, label):
+        """Record a label changed directly in the view (inline rename)."""
+        if iid in self._path:
+            self._label[iid] = label
+
+    def iids_for(self, path):
+        return list(self._by_path.get(path, ()))
+
+    def paths(self, iids=None):
+        """Paths of `iids` (default: every row, in list order)."""
+        return [self._path[i] for i in (self.order if iids is None else iids) if i in self._path]
+
+    # ---------- diff against the backing list ----------
+    def sync(self, paths, label_of=str):
+        """
+        Match rows to `paths` (the backing list) and return a ListDiff:
+        removed [iid], added [(iid, path, label)], relabelled [(iid, label)]
+        and whether the surviving rows changed order. Unchanged rows keep
+        their iid, so the view only touches what actually changed.
+        """
+        pool = {p: ids[::-1] for p, ids in self._by_path.items()}   # pop() from the end = first row
+        order, added, by_path = [], [], {}
+        for p in paths:
+            ids = pool.get(p)
+            if ids:
+                iid = ids.pop()
+            else:
+                iid = self._new_iid()
+                added.append(iid)
+                self._path[iid] = p
+            order.append(iid)
+            by_path.setdefault(p, []).append(iid)
+
+        removed = [iid for ids in pool.values() for iid in ids]
+        gone = set(removed)
+        for iid in removed:
+            self._path.pop(iid, None)
+            self._label.pop(iid, None)
+
+        new = set(added)
+        expected = [i for i in self.order if i not in gone] + added
+        reordered = order != expected
+
+        relabelled, added_rows = [], []
+        for iid in order:
+            lab = label_of(self._path[iid])
+            if iid in new:
+                added_rows.append((iid, self._path[iid], lab))
+            elif self._label.get(iid) != lab:
+                relabelled.append((iid, lab))
+            self._label[iid] = lab
+
+        self.order, self._by_path = order, by_path
+        self._refilter()
+        return ListDiff(removed, added_rows, relabelled, reordered)
+
+    def _match(self, iid):
+        q = self.query
+        return not q or q in self._label.get(iid, "").lower() or q in self._path[iid].lower()
+
+    # ---------- filter ----------
+    def set_filter(self, query):
+        """Show only rows whose label or path contains `query` (case-insensitive)."""
+        self.query = (query or "").strip().lower()
+        self._refilter()
+        return self.visible
+
+    def _refilter(self):
+        if not self.query:
+            self.visible = list(self.order)
+            return
+        self.visible = [i for i in self.order if self._match(i)]
+
+    @property
+    def filtered(self):
+        return bool(self.query)
+
+    # ---------- edits (write the result back with paths()) ----------
+    def _place_visible(self, new_visible):
+        """Put a permutation of the visible rows back into their slots of `order`."""
+        slots = set(self.visible)
+        it = iter(new_visible)
+        self.order = [next(it) if i in slots else i for i in self.order]
+        self.visible = list(new_visible)
+
+    def add(self, paths, label_of=str):
+        """
+        Append rows for `paths` (appended to the backing list by the
+        caller). Returns [(iid, path, label, shown)], shown False for rows
+        the filter hides.
+        """
+        rows = []
+        for p in paths:
+            iid = self._new_iid()
+            self._path[iid] = p
+            self._label[iid] = label_of(p)
+            self._by_path.setdefault(p, []).append(iid)
+            self.order.append(iid)
+            shown = self._match(iid)
+            if shown:
+                self.visible.append(iid)
+            rows.append((iid, p, self._label[iid], shown))
+        return rows
+
+    def move(self, iids, delta):
+        """
+        Move the given rows one step up (delta < 0) or down among the
+        visible rows; adjacent selected rows move as a block.
+        Returns the view moves [(iid, new visible index)], to apply in
+        order (empty if nothing moved).
+        """
+        sel = set(iids)
+        rows = list(self.visible)
+        if not sel or not rows:
+            return False
+        step = -1 if delta < 0 else 1
+        idx = range(1, len(rows)) if step < 0 else range(len(rows) - 2, -1, -1)
+        moves = []
+        for i in idx:
+            j = i + step
+            if rows[i] in sel and rows[j] not in sel:
+                rows[i], rows[j] = rows[j], rows[i]
+                moves.append((rows[j], j))
+        if moves:
+            self._place_visible(rows)
+        return moves
+
+    def reverse(self):
+        """Reverse the visible rows (all rows when no filter is set)."""
+        self._place_visible(self.visible[::-1])
+
+    def remove(self, iids):
+        """Drop rows by id; returns the remaining paths in order."""
+        gone = set(iids)
+        self.order = [i for i in self.order if i not in gone]
+        self.visible = [i for i in self.visible if i not in gone]
+        for iid in gone:
+            p = self._path.pop(iid, None)
+            self._label.pop(iid, None)
+            ids = self._by_path.get(p)
+            if ids is not None and iid in ids:
+                ids.remove(iid)
+                if not ids:
+                    del self._by_path[p]
+        return self.paths()
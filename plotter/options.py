@@ -0,0 +1,398 @@
+# -*- coding: utf-8 -*-
+"""
+Typed option schema and compiled command box.
+
+The command text is parsed in a single pass into a frozen, hashable
+CompiledCommands object: typed plotting options (PlotOptions) plus
+per-index tuples for colorN / nameN / lineN / refcolorN / refnameN and
+the processing stages (see pipeline.py).
+Compilation is memoized on the text, so an unchanged command box is
+never parsed twice.
+"""
+
+import re
+from dataclasses import dataclass, asdict
+from functools import lru_cache
+from types import MappingProxyType
+
+from .presets import preset_text
+from .pipeline import compile_pipelines
+
+
+# -------------------- Coercion helpers --------------------
+def _to_lower(v, default):
+    return str(v).strip().lower()
+
+
+def _to_str(v, default):
+    return v
+
+
+def _to_float(v, default):
+    try:
+        return float(v)
+    except Exception:
+        return default
+
+
+def _to_opt_float(v, default):
+    """float(value) if possible, else default (for 'auto' / empty / invalid)."""
+    try:
+        return float(str(v).strip()) or default
+    except Exception:
+        return default
+
+
+def _to_bool(v, default):
+    return str(v).strip().lower() in ("on", "yes", "true")
+
+
+def _to_tick(v, default):
+    """Return ('off'|'auto'|float)."""
+    v = str(v).strip().lower()
+    if v in ("off", "none"):
+        return "off"
+    if v in ("on", "auto", ""):
+        return "auto"
+    try:
+        return float(v)
+    except Exception:
+        return "auto"
+
+
+def _to_limits(v, default):
+    """'x1, x2' -> (x1, x2) or None when invalid."""
+    try:
+        a, b = map(float, str(v).split(','))
+        return (a, b)
+    except Exception:
+        return default
+
+
+_COERCE = {
+    "lower": _to_lower,
+    "str": _to_str,
+    "float": _to_float,
+    "optfloat": _to_opt_float,
+    "bool": _to_bool,
+    "tick": _to_tick,
+    "limits": _to_limits,
+}
+
+
+@dataclass(frozen=True)
+class OptionSpec:
+    """One command box key: coercion kind, default and redraw group."""
+    key: str
+    kind: str
+    default: object
+    group: str = "plot"      # 'style' keys feed rcParams, 'layout' keys the figure size
+
+
+# Single source of truth for scalar options (order = PlotOptions field order)
+SCHEMA = (
+    OptionSpec("normalize", "lower", "on"),
+    OptionSpec("normalizeref", "lower", "on"),
+    OptionSpec("refbase", "float", -1.0),
+    OptionSpec("refoffset", "float", 1.0),
+    OptionSpec("offset", "float", 2.0),
+    OptionSpec("refspan", "float", 0.95),
+    OptionSpec("refxjitter", "lower", "auto"),
+    OptionSpec("stackrefs", "lower", ""),
+    OptionSpec("colormap", "str", None),
+    OptionSpec("linewidth", "float", 1.5),
+    OptionSpec("legendlinewidth", "float", 2.0),
+    OptionSpec("reflinewidth", "float", 2.0),
+    OptionSpec("legendlinewidthref", "float", 2.0),
+    OptionSpec("legend", "bool", True),
+    OptionSpec("xunit", "lower", "2theta"),
+    OptionSpec("xlabel", "str", ""),
+    OptionSpec("ylabel", "str", "Intensity (a.u.)"),
+    OptionSpec("title", "str", ""),
+    OptionSpec("legendpos", "lower", "best"),
+    OptionSpec("legend_labelspacing", "float", 0.5),
+    OptionSpec("xlim", "limits", None),
+    OptionSpec("ylim", "limits", None),
+    OptionSpec("xticks", "bool", True),
+    OptionSpec("yticks", "bool", True),
+    OptionSpec("xtick_major", "tick", "auto"),
+    OptionSpec("ytick_major", "tick", "auto"),
+    OptionSpec("xtick_minor", "tick", "off"),
+    OptionSpec("ytick_minor", "tick", "off"),
+    OptionSpec("square_width", "optfloat", 1.0),
+    OptionSpec("data_bg", "str", "white"),
+    OptionSpec("background_overlay", "bool", False),
+    OptionSpec("default_size", "float", 10.0, "style"),
+    OptionSpec("label_size", "float", 12.0, "style"),
+    OptionSpec("title_size", "float", 12.0, "style"),
+    OptionSpec("tick_size", "float", 10.0, "style"),
+    OptionSpec("legend_size", "float", 10.0, "style"),
+    OptionSpec("font", "str", "serif", "style"),
+    OptionSpec("square_color", "str", "black", "style"),
+    OptionSpec("textcolor", "str", "black", "style"),
+    OptionSpec("figsize", "lower", "", "layout"),
+    OptionSpec("figsize_cm", "str", "", "layout"),
+    OptionSpec("axes_size_cm", "str", "", "layout"),
+    OptionSpec("margins_cm", "str", "", "layout"),
+    OptionSpec("panels", "lower", "", "layout"),
+    OptionSpec("panel_gap_cm", "str", "", "layout"),
+    OptionSpec("export_dpi", "float", 300.0, "export"),
+    OptionSpec("export_formats", "lower", "", "export"),
+    OptionSpec("export_tiled", "lower", "auto", "export"),
+    OptionSpec("project_float32", "bool", False, "export"),
+    OptionSpec("data_float32", "bool", False, "memory"),
+    OptionSpec("follow_pattern", "str", "*.xy", "follow"),
+    OptionSpec("follow_keep", "float", 50.0, "follow"),
+    OptionSpec("fit_range", "limits", None, "fit"),
+    OptionSpec("fit_peaks", "float", 1.0, "fit"),
+    OptionSpec("fit_model", "lower", "pv", "fit"),
+)
+SPECS = {spec.key: spec for spec in SCHEMA}
+STYLE_KEYS = frozenset(s.key for s in SCHEMA if s.group == "style")
+LAYOUT_KEYS = frozenset(s.key for s in SCHEMA if s.group == "layout")
+
+# colorN / nameN / lineN / refcolorN / refnameN
+INDEXED_PREFIXES = ("color", "name", "line", "refcolor", "refname")
+_INDEXED_RE = re.compile(r"^(refcolor|refname|color|name|line)(\d+)$")
+
+
+@dataclass(frozen=True)
+class PlotOptions:
+    """Typed scalar options. Supports options["key"] for older call sites."""
+    normalize: str = "on"
+    normalizeref: str = "on"
+    refbase: float = -1.0
+    refoffset: float = 1.0
+    offset: float = 2.0
+    refspan: float = 0.95
+    refxjitter: str = "auto"
+    stackrefs: str = ""
+    colormap: object = None
+    linewidth: float = 1.5
+    legendlinewidth: float = 2.0
+    reflinewidth: float = 2.0
+    legendlinewidthref: float = 2.0
+    legend: bool = True
+    xunit: str = "2theta"
+    xlabel: str = ""
+    ylabel: str = "Intensity (a.u.)"
+    title: str = ""
+    legendpos: str = "best"
+    legend_labelspacing: float = 0.5
+    xlim: object = None
+    ylim: object = None
+    xticks: bool = True
+    yticks: bool = True
+    xtick_major: object = "auto"
+    ytick_major: object = "auto"
+    xtick_minor: object = "off"
+    ytick_minor: object = "off"
+    square_width: float = 1.0
+    data_bg: str = "white"
+    background_overlay: bool = False
+    default_size: float = 10.0
+    label_size: float = 12.0
+    title_size: float = 12.0
+    tick_size: float = 10.0
+    legend_size: float = 10.0
+    font: str = "serif"
+    square_color: str = "black"
+    textcolor: str = "black"
+    figsize: str = ""
+    figsize_cm: str = ""
+    axes_size_cm: str = ""
+    margins_cm: str = ""
+    panels: str = ""
+    panel_gap_cm: str = ""
+    export_dpi: float = 300.0
+    export_formats: str = ""
+    export_tiled: str = "auto"
+    project_float32: bool = False
+    data_float32: bool = False
+    follow_pattern: str = "*.xy"
+    follow_keep: float = 50.0
+    fit_range: object = None
+    fit_peaks: float = 1.0
+    fit_model: str = "pv"
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def _indexed(values: dict):
+    """{1: 'red', 3: 'blue'} -> ('red', None, 'blue') (index 0 = curve 1)."""
+    if not values:
+        return ()
+    out = [None] * max(values)
+    for i, v in values.items():
+        if i >= 1:
+            out[i - 1] = v
+    return tuple(out)
+
+
+def _at(seq, i, default):
+    """Value for 0-based curve index i, or default when unset."""
+    if i < len(seq) and seq[i] is not None:
+        return seq[i]
+    return default
+
+
+@dataclass(frozen=True)
+class CompiledCommands:
+    """
+    Result of compiling the command box: hashable, safe to use as a cache key.
+    `items` keeps every raw 'key = value' pair (keys lowercased, last wins).
+    """
+    items: tuple
+    options: PlotOptions
+    colors: tuple = ()
+    names: tuple = ()
+    line_styles: tuple = ()
+    ref_colors: tuple = ()
+    ref_names: tuple = ()
+    stages: tuple = ()          # processing stages of every curve
+    curve_stages: tuple = ()    # per-curve stages (shiftN = ..., ...), None = `stages`
+    ref_stages: tuple = ()      # x conversion of the references (xunit)
+    ref_curve_stages: tuple = ()
+
+    def __post_init__(self):
+        # Lookup table for raw keys; not a field, so it stays out of hash/eq
+        object.__setattr__(self, "_raw", dict(self.items))
+
+    # ---- dict-like access to raw commands (legacy call sites) ----
+    @property
+    def commands(self):
+        return MappingProxyType(self._raw)
+
+    def get(self, key, default=None):
+        return self._raw.get(key, default)
+
+    def __contains__(self, key):
+        return key in self._raw
+
+    # ---- per-curve lookups (0-based index) ----
+    def color(self, i, default=None):
+        return _at(self.colors, i, default)
+
+    def name(self, i, default=None):
+        return _at(self.names, i, default)
+
+    def line_style(self, i, default="solid"):
+        return _at(self.line_styles, i, default)
+
+    def ref_color(self, i, default=None):
+        return _at(self.ref_colors, i, default)
+
+    def ref_name(self, i, default=None):
+        return _at(self.ref_names, i, default)
+
+    def pipeline(self, i):
+        """Processing stages of data curve i."""
+        return _at(self.curve_stages, i, self.stages)
+
+    def ref_pipeline(self, i):
+        """Stages of reference i (its x conversion)."""
+        return _at(self.ref_curve_stages, i, self.ref_stages)
+
+    # ---- change detection ----
+    def diff(self, other):
+        """Return the set of raw keys whose value differs from `other` (None = everything)."""
+        if other is None:
+            return frozenset(k for k, _ in self.items)
+        if other is self:
+            return frozenset()
+        mine, theirs = self._raw, other._raw
+        keys = set(mine) | set(theirs)
+        return frozenset(k for k in keys if mine.get(k) != theirs.get(k))
+
+    def style_changed(self, other):
+        """True if any option feeding rcParams (fonts, sizes, colors) changed."""
+        return bool(self.diff(other) & STYLE_KEYS)
+
+
+def _compile_items(items, offset_between):
+    """Build CompiledCommands from (key, value) pairs (keys already lowercased)."""
+    raw = {}
+    indexed = {p: {} for p in INDEXED_PREFIXES}
+    for key, value in items:
+        raw[key] = value
+        m = _INDEXED_RE.match(key)
+        if m:
+            indexed[m.group(1)][int(m.group(2))] = value
+
+    values = {}
+    for spec in SCHEMA:
+        default = offset_between if spec.key == "offset" else spec.default
+        if spec.key in raw:
+            values[spec.key] = _COERCE[spec.kind](raw[spec.key], default)
+        elif spec.kind == "bool":
+            values[spec.key] = bool(default)
+        else:
+            values[spec.key] = default
+
+    options = PlotOptions(**values)
+    stages, curve_stages, ref_stages, ref_curve_stages = compile_pipelines(raw, options)
+    return CompiledCommands(
+        items=tuple(raw.items()),
+        options=options,
+        colors=_indexed(indexed["color"]),
+        names=_indexed(indexed["name"]),
+        line_styles=_indexed(indexed["line"]),
+        ref_colors=_indexed(indexed["refcolor"]),
+        ref_names=_indexed(indexed["refname"]),
+        stages=stages,
+        curve_stages=_indexed({i + 1: st for i, st in curve_stages.items()}),
+        ref_stages=ref_stages,
+        ref_curve_stages=_indexed({i + 1: st for i, st in ref_curve_stages.items()}),
+    )
+
+
+def _parse_items(text):
+    items = []
+    for line in text.strip().split("\n"):
+        if '=' in line:
+            key, value = line.split('=', 1)
+            items.append((key.strip().lower(), value.strip()))
+    return items
+
+
+@lru_cache(maxsize=32)
+def _compile_text(text, offset_between):
+    return _compile_items(_parse_items(text), offset_between)
+
+
+def compile_commands(text, offset_between=2.0):
+    """
+    Single-pass parse of the command box text (memoized on the text).
+    With 'preset = name', the preset's lines come first and the text's
+    own lines override them.
+    """
+    cc = _compile_text(text, offset_between)
+    name = cc.get("preset")
+    base = preset_text(name) if name else None
+    if not base:
+        return cc
+    return _compile_text(base + "\n" + text, offset_between)
+
+
+@lru_cache(maxsize=32)
+def _compile_frozen(frozen_items, offset_between):
+    return _compile_items(frozen_items, offset_between)
+
+
+def compile_mapping(commands, offset_between=2.0):
+    """Compile an already-parsed command dict (or pass a CompiledCommands through)."""
+    if isinstance(commands, CompiledCommands):
+        return commands
+    items = tuple((str(k).lower(), v) for k, v in (commands or {}).items())
+    name = dict(items).get("preset")
+    base = preset_text(name) if name else None
+    if base:
+        items = tuple(_parse_items(base)) + items
+    try:
+        return _compile_frozen(items, offset_between)
+    except TypeError:   # unhashable values: compile without memoizing
+        return _compile_items(items, offset_between)
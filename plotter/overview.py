@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Overview + detail navigation for long patterns.
+
+OverviewNavigator adds a small axes under the main plot with every curve
+heavily decimated and a draggable SpanSelector that drives the main
+axes' xlim. While dragging, the figure without the main axes is kept as a
+bitmap and only the main axes is redrawn and blitted; the main curves are
+sliced to the window by a ViewSlicer, so scrubbing stays smooth.
+"""
+
+from contextlib import contextmanager
+
+from matplotlib.widgets import SpanSelector
+
+from .view import minmax_decimate
+
+
+class OverviewNavigator:
+    """
+    nav = OverviewNavigator(fig, ax).attach(curves)   # after draw_plot
+    nav.detach()                                      # before the next plot
+
+    height: overview height as a fraction of the main axes height
+    gap:    space left for the main x tick labels / xlabel (same unit)
+    """
+    def __init__(self, fig, ax, height=0.2, gap=0.2, points=600):
+        self.fig = fig
+        self.ax = ax
+        self.height = float(height)
+        self.gap = float(gap)
+        self.points = int(points)
+        self.ov = None
+        self.span = None
+        self._main_pos = None
+        self._bg = None
+        self._cids = []
+        self._ax_cid = None
+        self._syncing = False
+
+    @property
+    def active(self):
+        return self.ov is not None
+
+    # ---------- layout ----------
+    def _layout(self):
+        pos = self.ax.get_position()
+        self._main_pos = pos
+        h_ov = pos.height * self.height
+        h_gap = pos.height * self.gap
+        self.ax.set_position([pos.x0, pos.y0 + h_ov + h_gap, pos.width, pos.height - h_ov - h_gap])
+        return [pos.x0, pos.y0, pos.width, h_ov]
+
+    def _unlayout(self):
+        if self._main_pos is not None:
+            self.ax.set_position(self._main_pos)
+            self._main_pos = None
+
+    # ---------- wiring ----------
+    def attach(self, curves):
+        """Build the overview from the (full-resolution) lines in `curves`."""
+        self.detach()
+        self.ov = self.fig.add_axes(self._layout())
+        self.ov.set_yticks([])
+        self.ov.tick_params(axis="x", labelsize="x-small", length=2)
+        for _, line in curves:
+            if line is None:
+                continue
+            x = line.get_xdata(orig=True)
+            y = line.get_ydata(orig=True)
+            x, y = minmax_decimate(x, y, self.points // 2) if len(x) > self.points else (x, y)
+            self.ov.plot(x, y, color=line.get_color(), linewidth=0.6)
+        # Reference sticks are not repeated here: the overview is for finding regions
+        self.ov.set_xlim(self.ax.get_xlim())
+        self.ov.autoscale(enable=True, axis="y")
+        self.ov.margins(y=0.05)
+
+        self.span = SpanSelector(self.ov, self._on_select, "horizontal", useblit=True,
+                                 interactive=True, drag_from_anywhere=True,
+                                 onmove_callback=self._on_move,
+                                 props=dict(alpha=0.25, facecolor="tab:blue"))
+        self._ax_cid = self.ax.callbacks.connect("xlim_changed", self._on_main_xlim)
+        canvas = self.fig.canvas
+        self._cids = [canvas.mpl_connect("resize_event", self._invalidate),
+                      canvas.mpl_connect("button_release_event", self._on_release)]
+        self._show_extents()
+        return self
+
+    def detach(self):
+        """Remove the overview and give the main axes its full area back."""
+        for cid in self._cids:
+            try:
+                self.fig.canvas.mpl_disconnect(cid)
+            except Exception:
+                pass
+        self._cids = []
+        if self._ax_cid is not None:
+            try:
+                self.ax.callbacks.disconnect(self._ax_cid)
+            except Exception:
+                pass
+            self._ax_cid = None
+        if self.span is not None:
+            try:
+                self.span.disconnect_events()
+            except Exception:
+                pass
+            self.span = None
+        if self.ov is not None:
+            try:
+                self.ov.remove()
+            except Exception:
+                pass
+            self.ov = None
+        self._unlayout()
+        self._bg = None
+
+    @contextmanager
+    def hidden(self):
+        """Export the figure as if there were no overview."""
+        if self.ov is None:
+            yield
+            return
+        pos = self.ax.get_position()
+        self.ov.set_visible(False)
+        self.ax.set_position(self._main_pos)
+        try:
+            yield
+        finally:
+            self.ax.set_position(pos)
+            self.ov.set_visible(True)
+
+    # ---------- interaction ----------
+    def _show_extents(self):
+        if self.span is None:
+            return
+        lo, hi = sorted(self.ax.get_xlim())
+        self._syncing = True
+        try:
+            self.span.extents = (lo, hi)
+        finally:
+            self._syncing = False
+
+    def _on_main_xlim(self, ax):
+        """Toolbar zoom/pan on the main axes moves the span too."""
+        if not self._syncing:
+            self._show_extents()
+
+    def _invalidate(self, event=None):
+        self._bg = None
+
+    def _grab_background(self):
+        """Bitmap of everything but the main axes (overview included)."""
+        canvas = self.fig.canvas
+        hide = [self.ax] + list(self.span.artists)
+        for a in hide:
+            a.set_visible(False)
+        try:
+            canvas.draw()
+            self._bg = canvas.copy_from_bbox(self.fig.bbox)
+        finally:
+            for a in hide:
+                a.set_visible(True)
+
+    def _set_xlim(self, vmin, vmax):
+        if vmax <= vmin:
+            return False
+        self._syncing = True
+        try:
+            self.ax.set_xlim(vmin, vmax)   # the ViewSlicer re-slices on xlim_changed
+        finally:
+            self._syncing = False
+        return True
+
+    def _on_move(self, vmin, vmax):
+        if not self._set_xlim(vmin, vmax):
+            return
+        canvas = self.fig.canvas
+        if not hasattr(canvas, "copy_from_bbox"):
+            canvas.draw_idle()
+            return
+        if self._bg is None:
+            self._grab_background()
+        canvas.restore_region(self._bg)
+        self.fig.draw_artist(self.ax)
+        for a in self.span.artists:
+            self.ov.draw_artist(a)
+        canvas.blit(self.fig.bbox)
+
+    def _on_select(self, vmin, vmax):
+        self._set_xlim(vmin, vmax)
+
+    def _on_release(self, event):
+        if event.inaxes is self.ov:
+            # Full redraw once the drag ends (tick labels outside the axes, etc.)
+            self.fig.canvas.draw_idle()
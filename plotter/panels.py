@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-panel figures (subplot grid).
+
+Commands:
+    panels = 2,2          rows, columns (panels are numbered row by row)
+    panel1 = 1-3          data files (1-based, as in the Data list) in panel 1
+    panelref2 = 1,2       reference files in panel 2 ('none' = no references)
+    p2.title = (b)        any option for one panel only: p<N>.<key> = value
+    panel_gap_cm = 1.5,1.5  space between panels when axes_size_cm is used
+
+Without panelN lines the data files are split in order over the panels;
+without panelrefN lines every panel shows every reference. colorN/nameN/
+lineN (and shiftN, smoothN, ...) keep referring to the file's number in
+the Data list.
+
+PanelFigure remembers what each panel was drawn from (files, their
+signatures on disk, the panel's compiled options, names), so a change to
+one panel's options or files redraws only that panel; all panels read
+through the same DatasetCache.
+"""
+
+import re
+from collections import namedtuple
+from dataclasses import replace
+
+from .commands import panel_grid
+from .options import compile_mapping
+from .render import draw_plot, apply_physical_size_from_cm
+from .cache import default_cache, file_signature
+
+
+PanelSpec = namedtuple("PanelSpec", "number files refs data_index ref_index commands")
+
+_PANEL_KEY = re.compile(r"^p(\d+)\.(.+)$")
+_ASSIGN_KEY = re.compile(r"^(panelref|panel)(\d+)$")
+
+
+def parse_index_list(text, count):
+    """'1,3-5' -> [0, 2, 3, 4] (0-based, limited to `count` items); 'none' -> []."""
+    out = []
+    txt = str(text).strip().lower()
+    if txt in ("", "none", "off"):
+        return out
+    for part in re.split(r"[,; ]+", txt):
+        if not part:
+            continue
+        try:
+            if "-" in part:
+                a, b = part.split("-", 1)
+                rng = range(int(a), int(b) + 1)
+            else:
+                rng = (int(part),)
+        except ValueError:
+            continue
+        out.extend(i - 1 for i in rng if 1 <= i <= count and i - 1 not in out)
+    return out
+
+
+def _split(count, parts):
+    """Contiguous chunks of range(count) over `parts` panels."""
+    size = -(-count // parts) if count else 0
+    return [list(range(p * size, min(count, (p + 1) * size))) for p in range(parts)]
+
+
+def layout_panels(files, references, commands, offset_between=2.0):
+    """
+    Split files/references over the grid and compile each panel's options.
+    Returns (rows, cols) and a list of PanelSpec (one per panel).
+    """
+    cc = compile_mapping(commands, offset_between)
+    rows, cols = panel_grid(cc) or (1, 1)
+    n = rows * cols
+
+    data_assign, ref_assign, overrides, base = {}, {}, {}, []
+    for key, value in cc.items:
+        m = _PANEL_KEY.match(key)
+        if m:
+            overrides.setdefault(int(m.group(1)), []).append((m.group(2), value))
+            continue
+        m = _ASSIGN_KEY.match(key)
+        if m:
+            target = ref_assign if m.group(1) == "panelref" else data_assign
+            target[int(m.group(2))] = value
+            continue
+        base.append((key, value))
+
+    default_data = _split(len(files), n)
+    all_refs = list(range(len(references)))
+
+    panels = []
+    for k in range(1, n + 1):
+        if data_assign:
+            di = parse_index_list(data_assign.get(k, ""), len(files))
+        else:
+            di = default_data[k - 1]
+        if ref_assign:
+            ri = parse_index_list(ref_assign.get(k, ""), len(references))
+        else:
+            ri = list(all_refs)
+
+        pcc = compile_mapping(dict(base + overrides.get(k, [])), offset_between)
+        # Per-file settings follow the file's number in the full list
+        pcc = replace(pcc,
+                      colors=tuple(pcc.color(i) for i in di),
+                      names=tuple(pcc.name(i) for i in di),
+                      line_styles=tuple(pcc.line_style(i, None) for i in di),
+                      curve_stages=tuple(pcc.pipeline(i) for i in di),
+                      ref_curve_stages=tuple(pcc.ref_pipeline(i) for i in ri),
+                      ref_colors=tuple(pcc.ref_color(i) for i in ri),
+                      ref_names=tuple(pcc.ref_name(i) for i in ri))
+        panels.append(PanelSpec(k, tuple(files[i] for i in di), tuple(references[i] for i in ri),
+                                tuple(di), tuple(ri), pcc))
+    return (rows, cols), panels
+
+
+def _signatures(paths):
+    out = []
+    for p in paths:
+        try:
+            out.append(file_signature(p))
+        except OSError:
+            out.append(None)
+    return tuple(out)
+
+
+class PanelFigure:
+    """
+    Owns the panel axes of a Figure and redraws only the panels whose
+    inputs changed since the last draw().
+    """
+    def __init__(self, fig):
+        self.fig = fig
+        self.grid = None
+        self.axes = []
+        self.curves = []         # per panel: [(path, Line2D or None)]
+        self._keys = []
+
+    @property
+    def active(self):
+        return self.grid is not None
+
+    def reset(self):
+        """Remove the panel axes (back to an empty figure)."""
+        for ax in self.axes:
+            try:
+                ax.remove()
+            except Exception:
+                pass
+        self.grid, self.axes, self.curves, self._keys = None, [], [], []
+
+    def _build(self, grid):
+        self.reset()
+        for ax in list(self.fig.axes):
+            ax.remove()
+        rows, cols = grid
+        self.axes = [self.fig.add_subplot(rows, cols, i + 1) for i in range(rows * cols)]
+        self.curves = [[] for _ in self.axes]
+        self._keys = [None] * len(self.axes)
+        self.grid = grid
+
+    def apply_size(self, commands):
+        """cm sizing for the whole grid (see apply_physical_size_from_cm)."""
+        return apply_physical_size_from_cm(self.fig, commands)
+
+    def draw(self, files, references, commands, custom_names=None, custom_ref_names=None,
+             offset_between=2.0, default_color='black', on_error=None, cache=None, force=False):
+        """
+        Draw every panel whose files, file contents, options or names
+        changed (all of them when `force`). Returns the redrawn panel numbers.
+        """
+        grid, panels = layout_panels(files, references, commands, offset_between)
+        if grid != self.grid:
+            self._build(grid)
+        cache = cache if cache is not None else default_cache
+        custom_names = custom_names or {}
+        custom_ref_names = custom_ref_names or {}
+
+        redrawn = []
+        for i, spec in enumerate(panels):
+            pcc = spec.commands
+            key = (spec.files, spec.refs, _signatures(spec.files + spec.refs), pcc.options,
+                   pcc.colors, pcc.names, pcc.line_styles, pcc.curve_stages,
+                   pcc.ref_curve_stages, pcc.ref_colors, pcc.ref_names,
+                   tuple(custom_names.get(f) for f in spec.files),
+                   tuple(custom_ref_names.get(f) for f in spec.refs), default_color)
+            if not force and key == self._keys[i]:
+                continue
+            draw_plot(self.axes[i], list(spec.files), list(spec.refs), spec.commands,
+                      custom_names=custom_names, custom_ref_names=custom_ref_names,
+                      offset_between=offset_between, default_color=default_color,
+                      on_error=on_error, cache=cache, curves=self.curves[i])
+            self._keys[i] = key
+            redrawn.append(spec.number)
+        return redrawn
@@ -0,0 +1,462 @@
+# -*- coding: utf-8 -*-
+"""
+Peak fitting over a series of patterns.
+
+One x region, N peaks (Gaussian, Lorentzian or pseudo-Voigt) on a linear
+background, fitted in every data file:
+
+    fit = SeriesFit(files, region=(28, 33), peaks=2, model="pv").run()
+    write_csv("peaks.csv", fit.results)
+
+The model and its Jacobian are evaluated analytically and vectorized
+over all peaks; the fit itself is a small Levenberg-Marquardt. Files are
+read here, through the app's cache (pinned bundles, data_float32), and
+their arrays sent in contiguous chunks of CHUNK files to a process pool;
+inside a chunk each fit starts from the previous file's result (in-situ
+series change slowly), so most fits converge in a few iterations. The
+first file of every chunk is fitted here, in sequence, each starting from
+the first file of the chunk before; its result seeds the rest of its
+chunk. The chunks do not depend on the number of workers, so neither do
+the results. A warm start that ends in a negative area, a peak outside
+the region or a worse χ² than the plain initial guess is refitted from
+that guess.
+
+Commands: fit_range = 28,33 (default: a range dragged on the plot),
+fit_peaks = 2, fit_model = gauss / lorentz / pv.
+"""
+
+import os
+import csv
+import time
+import threading
+from collections import namedtuple, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .cache import default_cache
+from .pipeline import process_curve
+
+
+MODELS = ("gauss", "lorentz", "pv")
+_ALIASES = {"gaussian": "gauss", "g": "gauss", "lorentzian": "lorentz", "l": "lorentz",
+            "pseudo-voigt": "pv", "pseudovoigt": "pv", "voigt": "pv"}
+
+_A = 4.0 * np.log(2.0)
+_KG = np.sqrt(_A / np.pi)       # Gaussian of unit area and FWHM w: _KG / w * exp(-_A u^2)
+_KL = 2.0 / np.pi               # Lorentzian of unit area and FWHM w: _KL / w / (1 + 4 u^2)
+
+CHUNK = 32                      # files per chunk (sent to one worker)
+
+PeakResult = namedtuple("PeakResult", "center fwhm area height eta center_err fwhm_err area_err")
+FitResult = namedtuple("FitResult", "path peaks background redchi2 iterations error")
+
+
+def model_name(value):
+    v = str(value or "pv").strip().lower()
+    v = _ALIASES.get(v, v)
+    if v not in MODELS:
+        raise ValueError(f"Unknown peak model {value!r} (use gauss, lorentz or pv)")
+    return v
+
+
+# -------------------- model --------------------
+def _per_peak(model):
+    return 4 if model == "pv" else 3
+
+
+def evaluate(x, p, model, npeaks, jacobian=False):
+    """
+    Model value (and Jacobian) at x for parameters
+    p = [center, fwhm, area, (eta)] * npeaks + [b0, b1]
+    (background b0 + b1 * (x - x_mid)).
+    """
+    k = _per_peak(model)
+    pk = p[:k * npeaks].reshape(npeaks, k)
+    c, w, a = pk[:, 0:1], np.abs(pk[:, 1:2]) + 1e-12, pk[:, 2:3]
+    xm = 0.5 * (x[0] + x[-1])
+    u = (x[None, :] - c) / w                          # (npeaks, m)
+
+    g = l = None
+    if model in ("gauss", "pv"):
+        g = _KG / w * np.exp(-_A * u * u)             # unit-area shape
+    if model in ("lorentz", "pv"):
+        d = 1.0 + 4.0 * u * u
+        l = _KL / (w * d)
+    if model == "gauss":
+        shape = g
+    elif model == "lorentz":
+        shape = l
+    else:
+        eta = np.clip(pk[:, 3:4], 0.0, 1.0)
+        shape = eta * l + (1.0 - eta) * g
+    f = (a * shape).sum(axis=0) + p[-2] + p[-1] * (x - xm)
+    if not jacobian:
+        return f
+
+    J = np.empty((len(x), len(p)))
+    if g is not None:
+        g_dc = g * 2.0 * _A * u / w
+        g_dw = g / w * (2.0 * _A * u * u - 1.0)
+    if l is not None:
+        l_dc = l * 8.0 * u / (w * d)
+        l_dw = l / w * (8.0 * u * u / d - 1.0)
+    if model == "gauss":
+        dc, dw = g_dc, g_dw
+    elif model == "lorentz":
+        dc, dw = l_dc, l_dw
+    else:
+        dc = eta * l_dc + (1.0 - eta) * g_dc
+        dw = eta * l_dw + (1.0 - eta) * g_dw
+        J[:, 3:k * npeaks:k] = (a * (l - g)).T
+    J[:, 0:k * npeaks:k] = (a * dc).T
+    J[:, 1:k * npeaks:k] = (a * dw * np.sign(pk[:, 1:2])).T
+    J[:, 2:k * npeaks:k] = shape.T
+    J[:, -2] = 1.0
+    J[:, -1] = x - xm
+    return f, J
+
+
+def levenberg_marquardt(x, y, p0, model, npeaks, max_iter=200, tol=1e-9):
+    """Least-squares fit of `evaluate`; returns (p, cost, iterations, J)."""
+    p = np.array(p0, dtype=float)
+    k = _per_peak(model)
+    f, J = evaluate(x, p, model, npeaks, jacobian=True)
+    r = y - f
+    cost = r @ r
+    lam = 1e-3
+    it = 0
+    for it in range(1, max_iter + 1):
+        JtJ = J.T @ J
+        g = J.T @ r
+        diag = np.diag(JtJ).copy()
+        diag[diag == 0] = 1.0
+        while True:
+            try:
+                A = JtJ + lam * np.diag(diag)
+                step = np.linalg.solve(A, g)
+                if model == "pv":
+                    # eta held at a bound it is pushed against: solve for the others only
+                    e = np.arange(3, k * npeaks, k)
+                    pinned = e[((p[e] <= 0.0) & (step[e] < 0)) | ((p[e] >= 1.0) & (step[e] > 0))]
+                    if len(pinned):
+                        A[pinned, :] = 0.0
+                        A[:, pinned] = 0.0
+                        A[pinned, pinned] = 1.0
+                        gp = g.copy()
+                        gp[pinned] = 0.0
+                        step = np.linalg.solve(A, gp)
+            except np.linalg.LinAlgError:
+                step = None
+            if step is not None:
+                trial = p + step
+                if model == "pv":
+                    trial[3:k * npeaks:k] = np.clip(trial[3:k * npeaks:k], 0.0, 1.0)
+                f_t = evaluate(x, trial, model, npeaks)
+                r_t = y - f_t
+                cost_t = r_t @ r_t
+                if np.isfinite(cost_t) and cost_t <= cost:
+                    break
+            lam *= 4.0
+            if lam > 1e12:
+                return p, cost, it, J
+        moved = np.max(np.abs(trial - p) / (np.abs(p) + 1e-12))
+        converged = cost - cost_t <= tol * max(cost, 1e-300) or moved < 1e-9
+        p, cost = trial, cost_t
+        f, J = evaluate(x, p, model, npeaks, jacobian=True)
+        r = y - f
+        lam = max(lam / 3.0, 1e-12)
+        if converged:
+            break
+    return p, cost, it, J
+
+
+# -------------------- starting values --------------------
+def initial_guess(x, y, npeaks, model):
+    """Background through the region's ends, peaks at the highest local maxima."""
+    m = len(x)
+    edge = max(1, m // 20)
+    x0, x1 = x[:edge].mean(), x[-edge:].mean()
+    y0, y1 = np.median(y[:edge]), np.median(y[-edge:])
+    slope = (y1 - y0) / ((x1 - x0) or 1.0)
+    xm = 0.5 * (x[0] + x[-1])
+    b0 = y0 + slope * (xm - x0)
+    net = y - (b0 + slope * (x - xm))
+
+    if m >= 5:
+        sm = np.convolve(net, np.full(5, 0.2), mode="same")
+    else:
+        sm = net
+    interior = np.flatnonzero((sm[1:-1] >= sm[:-2]) & (sm[1:-1] > sm[2:])) + 1
+    order = interior[np.argsort(sm[interior])[::-1]] if len(interior) else np.array([int(np.argmax(sm))])
+    centers = list(order[:npeaks])
+    span = x[-1] - x[0]
+    while len(centers) < npeaks:            # fewer maxima than peaks: spread the rest
+        centers.append(int(np.searchsorted(x, x[0] + span * (len(centers) + 1) / (npeaks + 1))))
+    centers = sorted(min(int(c), m - 1) for c in centers)
+
+    p = []
+    for ci in centers:
+        height = max(sm[ci], 1e-12)
+        above = np.flatnonzero(sm >= height / 2.0)
+        left = above[above <= ci]
+        right = above[above >= ci]
+        w = (x[right.max()] - x[left.min()]) if len(left) and len(right) else span / (4 * npeaks)
+        w = min(max(w, abs(x[1] - x[0]) * 2 if m > 1 else 1e-3), span / npeaks)
+        area = height * w * 1.0645          # Gaussian area / (height * FWHM)
+        p += [x[ci], w, area] + ([0.5] if model == "pv" else [])
+    return np.array(p + [b0, slope])
+
+
+# -------------------- one pattern --------------------
+def _heights(pk, model):
+    w, a = np.abs(pk[:, 1]), pk[:, 2]
+    if model == "gauss":
+        return a * _KG / w
+    if model == "lorentz":
+        return a * _KL / w
+    eta = np.clip(pk[:, 3], 0.0, 1.0)
+    return a * (eta * _KL + (1.0 - eta) * _KG) / w
+
+
+def _sound(p, cost, model, npeaks, lo, hi):
+    """True if a fit is usable as a result and as the next warm start."""
+    k = _per_peak(model)
+    pk = p[:k * npeaks].reshape(npeaks, k)
+    return bool(np.isfinite(cost) and np.all(np.isfinite(p)) and np.all(pk[:, 2] > 0)
+                and np.all((pk[:, 0] >= lo) & (pk[:, 0] <= hi)))
+
+
+def fit_pattern(x, y, region, npeaks=1, model="pv", p0=None):
+    """
+    Fit one pattern in `region` (lo, hi). Returns (FitResult without path,
+    parameter vector for a warm start, or None if the fit is not sound).
+    """
+    model = model_name(model)
+    lo, hi = sorted(region)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    keep = (x >= lo) & (x <= hi) & np.isfinite(y)
+    xs, ys = x[keep], y[keep]
+    k = _per_peak(model)
+    nparams = k * npeaks + 2
+    if len(xs) <= nparams:
+        raise ValueError(f"only {len(xs)} points in {lo:g}-{hi:g}")
+    order = np.argsort(xs, kind="stable")
+    xs, ys = xs[order], ys[order]
+
+    guess = initial_guess(xs, ys, npeaks, model)
+    if p0 is not None and len(p0) == nparams:
+        p, cost, iterations, J = levenberg_marquardt(xs, ys, np.asarray(p0, dtype=float),
+                                                     model, npeaks)
+        r = ys - evaluate(xs, guess, model, npeaks)
+        if not _sound(p, cost, model, npeaks, lo, hi) or cost > r @ r:
+            p0 = None               # the previous file led astray: start over from the guess
+    if p0 is None or len(p0) != nparams:
+        p, cost, iterations, J = levenberg_marquardt(xs, ys, guess, model, npeaks)
+    dof = max(1, len(xs) - nparams)
+    redchi2 = cost / dof
+    try:
+        cov = np.linalg.inv(J.T @ J) * redchi2
+        err = np.sqrt(np.clip(np.diag(cov), 0.0, None))
+    except np.linalg.LinAlgError:
+        err = np.full(nparams, np.nan)
+
+    pk = p[:k * npeaks].reshape(npeaks, k)
+    ek = err[:k * npeaks].reshape(npeaks, k)
+    heights = _heights(pk, model)
+    order = np.argsort(pk[:, 0])
+    peaks = tuple(PeakResult(float(pk[i, 0]), float(abs(pk[i, 1])), float(pk[i, 2]),
+                             float(heights[i]),
+                             float(np.clip(pk[i, 3], 0, 1)) if model == "pv" else
+                             (0.0 if model == "gauss" else 1.0),
+                             float(ek[i, 0]), float(ek[i, 1]), float(ek[i, 2]))
+                  for i in order)
+    result = FitResult(None, peaks, (float(p[-2]), float(p[-1])), float(redchi2), iterations, None)
+    return result, (p if _sound(p, cost, model, npeaks, lo, hi) else None)
+
+
+def _fit_chunk(items, region, npeaks, model, stages, p0=None):
+    """
+    Worker: fit consecutive files, each starting from the previous sound
+    result (the first from `p0`). items: (path, (x, y)) or (path, error
+    message) when it could not be read. Returns (FitResults, parameters of
+    the last file or None).
+    """
+    out = []
+    for path, data in items:
+        try:
+            if isinstance(data, str):
+                raise OSError(data)
+            x, y = process_curve(*data, stages)
+            res, p0 = fit_pattern(x, y, region, npeaks, model, p0)
+            out.append(res._replace(path=path))
+        except Exception as e:
+            out.append(FitResult(path, (), (), float("nan"), 0, str(e) or type(e).__name__))
+            p0 = None
+    return out, p0
+
+
+# -------------------- series --------------------
+class SeriesFit:
+    """
+    Fit the same region in many files (process pool; workers=0: here).
+    start() runs it in a background thread; done/count/results can be
+    polled and cancel() stops the chunks not started yet.
+    stages: processing stages applied before fitting, per file (list) or
+    the same for all (tuple of stages). Files are read through `cache`
+    (default_cache when None), so the workers see what the plot shows.
+    """
+    def __init__(self, files, region, peaks=1, model="pv", stages=(), workers=None, chunk=None,
+                 cache=None):
+        self.files = list(files)
+        self.region = tuple(sorted(map(float, region)))
+        self.peaks = max(1, int(peaks))
+        self.model = model_name(model)
+        self.stages = stages if isinstance(stages, list) else [stages] * len(self.files)
+        self.workers = (os.cpu_count() or 1) if workers is None else max(0, int(workers))
+        self.chunk = chunk
+        self.cache = default_cache if cache is None else cache
+        self.results = []
+        self.seconds = 0.0
+        self._done = threading.Event()
+        self._cancel = threading.Event()
+        self._thread = None
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def count(self):
+        return len(self.results)
+
+    @property
+    def failures(self):
+        return [r for r in self.results if r.error]
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="plotter-peakfit", daemon=True)
+            self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def cancel(self):
+        self._cancel.set()
+
+    def _chunks(self):
+        n = len(self.files)
+        size = max(1, int(self.chunk or CHUNK))
+        # a chunk runs the same stages for all its files
+        bounds = []
+        for start in range(0, n, size):
+            stop = min(n, start + size)
+            k = start
+            while k < stop:
+                j = k
+                while j < stop and self.stages[j] == self.stages[k]:
+                    j += 1
+                bounds.append((k, j))
+                k = j
+        return [(self.files[a:b], self.region, self.peaks, self.model, self.stages[a])
+                for a, b in bounds]
+
+    def _load(self, paths):
+        """(path, (x, y)) items of a chunk, or (path, error message)."""
+        items = []
+        for path in paths:
+            try:
+                ds = self.cache.load_data(path)
+                items.append((path, (ds[0], ds[1])))
+            except Exception as e:
+                items.append((path, str(e) or type(e).__name__))
+        return items
+
+    def _seeded(self, chunks):
+        """
+        Per chunk: (its first file's result, the rest of its items, seed).
+        The first files are fitted here in sequence, each starting from the
+        one before (same stages), as the chunks are consumed.
+        """
+        seed, prev = None, None
+        for paths, region, peaks, model, stages in chunks:
+            items = self._load(paths)
+            head, p = _fit_chunk(items[:1], region, peaks, model, stages,
+                                 seed if stages == prev else None)
+            seed, prev = p, stages
+            yield head, (items[1:], region, peaks, model, stages, p)
+
+    def run(self):
+        """Fit every file (blocking); returns the FitResults in file order."""
+        t0 = time.perf_counter()
+        try:
+            chunks = self._chunks()
+            if self.workers == 0 or len(chunks) < 2:
+                for head, args in self._seeded(chunks):
+                    self.results.extend(head)
+                    self.results.extend(_fit_chunk(*args)[0])
+                    if self._cancel.is_set():
+                        break
+            else:
+                workers = min(self.workers, len(chunks))
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    # seed and read the next chunks while the workers fit;
+                    # at most 2 chunks per worker in flight
+                    queued = deque()
+                    for head, args in self._seeded(chunks):
+                        if self._cancel.is_set():
+                            break
+                        queued.append((head, pool.submit(_fit_chunk, *args)))
+                        if len(queued) >= 2 * workers:
+                            head, fut = queued.popleft()
+                            self.results.extend(head + fut.result()[0])
+                    while queued and not self._cancel.is_set():
+                        head, fut = queued.popleft()
+                        self.results.extend(head + fut.result()[0])
+                    pool.shutdown(wait=False, cancel_futures=True)
+        finally:
+            self.seconds = time.perf_counter() - t0
+            self._done.set()
+        return self.results
+
+
+# -------------------- results table --------------------
+CSV_COLUMNS = ("file", "peak", "position", "position_err", "fwhm", "fwhm_err", "area", "area_err",
+               "height", "eta", "background", "background_slope", "redchi2", "iterations", "error")
+
+
+def results_table(results):
+    """One row per file and peak (dicts with CSV_COLUMNS keys)."""
+    rows = []
+    for r in results:
+        base = {"file": os.path.basename(r.path or ""), "redchi2": r.redchi2,
+                "iterations": r.iterations, "error": r.error or ""}
+        if r.background:
+            base["background"], base["background_slope"] = r.background
+        if not r.peaks:
+            rows.append(base)
+            continue
+        for i, pk in enumerate(r.peaks, 1):
+            row = dict(base, peak=i, position=pk.center, position_err=pk.center_err,
+                       fwhm=pk.fwhm, fwhm_err=pk.fwhm_err, area=pk.area, area_err=pk.area_err,
+                       height=pk.height, eta=pk.eta)
+            rows.append(row)
+    return rows
+
+
+def write_csv(path, results, delimiter=","):
+    """Write the results table; returns the number of rows."""
+    rows = results_table(results)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=CSV_COLUMNS, delimiter=delimiter, restval="")
+        w.writeheader()
+        for row in rows:
+            w.writerow({k: (f"{v:.8g}" if isinstance(v, float) else v) for k, v in row.items()})
+    return len(rows)
@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+"""
+Processing pipeline between reading a data file and plotting it.
+
+Commands (every stage is optional; 'off' disables it):
+    crop = 10,80          keep x in [10, 80] ('crop = xlim' uses xlim)
+    background = asls:1e5,0.01   subtract a background (linear, min, poly:N, asls,
+                          arpls, snip, rollingball; see background.py)
+    background_overlay = on      draw the curve before subtraction with the
+                          background dashed on it (to check the fit)
+    smooth = 7            moving average over 7 points; sg:11,3 = Savitzky-Golay
+    shift = 0.05          add to x (e.g. zero-shift correction)
+    scale = 1.5           multiply y
+    process = crop, background, smooth, shift, scale    stage order (this one by default)
+
+Every stage can be set for one curve by adding its number (as colorN):
+'shift2 = -0.02', 'smooth3 = off'. 'xunit = q' / 'xunit = d' converts x
+last (units.py).
+
+Stages are vectorized NumPy operations. The output of every stage is
+kept in a bounded memo keyed by (content of the input arrays, stages up
+to this one), so changing only the last stage recomputes only that stage
+for each curve, and turning a stage back on is free. Iterative background
+fits of many curves run in worker processes (process_curves).
+"""
+
+import os
+import re
+import zlib
+import weakref
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, BrokenExecutor
+
+import numpy as np
+
+from .background import parse_background, estimate_background
+from .units import transform, parse_xunit, parse_wavelength, DEFAULT_WAVELENGTH
+
+
+# -------------------- stages --------------------
+def _parse_limits(value, options):
+    v = str(value).strip().lower()
+    if v == "xlim":
+        return tuple(options.xlim) if options.xlim else None
+    try:
+        a, b = map(float, v.split(","))
+        return (min(a, b), max(a, b))
+    except Exception:
+        return None
+
+
+def _parse_float(value, options):
+    try:
+        return float(str(value).strip().replace(",", "."))
+    except Exception:
+        return None
+
+
+def _parse_background(value, options):
+    return parse_background(value)
+
+
+def _parse_smooth(value, options):
+    v = str(value).strip().lower().replace(" ", "")
+    m = re.match(r"^sg:(\d+),(\d+)$", v)
+    if m:
+        window, order = int(m.group(1)) | 1, int(m.group(2))
+        return ("sg", window, order) if window > order else None
+    try:
+        window = int(float(v))
+    except ValueError:
+        return None
+    return ("mean", window) if window > 1 else None
+
+
+def crop(x, y, limits):
+    lo, hi = limits
+    if len(x) > 1 and np.all(x[1:] >= x[:-1]):
+        i0, i1 = np.searchsorted(x, lo, side="left"), np.searchsorted(x, hi, side="right")
+        return x[i0:i1], y[i0:i1]
+    keep = (x >= lo) & (x <= hi)
+    return x[keep], y[keep]
+
+
+def subtract_background(x, y, params):
+    return x, y - estimate_background(x, y, params)
+
+
+def _savgol_coeffs(window, order):
+    half = window // 2
+    a = np.vander(np.arange(-half, half + 1, dtype=float), order + 1, increasing=True)
+    return np.linalg.pinv(a)[0]
+
+
+def smooth(x, y, params):
+    window = min(params[1], len(y) - (1 - len(y) % 2)) | 1
+    if window < 3:
+        return x, y
+    if params[0] == "sg":
+        order = min(params[2], window - 1)
+        kernel = _savgol_coeffs(window, order)[::-1]
+    else:
+        kernel = np.full(window, 1.0 / window)
+    half = window // 2
+    padded = np.concatenate((np.full(half, y[0]), y, np.full(half, y[-1])))
+    return x, np.convolve(padded, kernel, mode="valid")
+
+
+def shift(x, y, dx):
+    return x + dx, y
+
+
+def scale(x, y, factor):
+    return x, y * factor
+
+
+# name -> (parse(value, options) -> hashable params or None, apply(x, y, params) -> (x, y))
+STAGES = OrderedDict([
+    ("crop", (_parse_limits, crop)),
+    ("background", (_parse_background, subtract_background)),
+    ("smooth", (_parse_smooth, smooth)),
+    ("shift", (_parse_float, shift)),
+    ("scale", (_parse_float, scale)),
+    # Not set directly: added last from xunit / wavelength (see compile_pipelines)
+    ("xunit", (None, transform)),
+])
+DEFAULT_ORDER = ("crop", "background", "smooth", "shift", "scale")
+_OFF = ("", "off", "none", "no")
+
+
+def _stage_order(value):
+    names = [t for t in re.split(r"[,;\s>]+", str(value or "").strip().lower()) if t]
+    order = [n for n in names if n in DEFAULT_ORDER]
+    return tuple(dict.fromkeys(order)) or DEFAULT_ORDER
+
+
+def compile_pipelines(raw, options):
+    """
+    Build the processing stages from the raw command dict.
+    Returns (global stages, {0-based curve index: stages},
+             reference stages, {0-based reference index: stages});
+    stages are tuples of (name, params), hashable and in execution order.
+    With 'xunit = q' or 'xunit = d', every curve ends with its x conversion
+    (wavelength / wavelengthN; refwavelength / refwavelengthN for references).
+    """
+    order = _stage_order(raw.get("process"))
+    index_re = re.compile(r"^(%s)(\d+)$" % "|".join(map(re.escape, DEFAULT_ORDER)))
+
+    def _stages(values):
+        out = []
+        for name in order:
+            value = values.get(name)
+            if value is None or str(value).strip().lower() in _OFF:
+                continue
+            params = STAGES[name][0](value, options)
+            if params is not None and params != 0 and not (name == "scale" and params == 1):
+                out.append((name, params))
+        return tuple(out)
+
+    base = {name: raw[name] for name in DEFAULT_ORDER if name in raw}
+    per_curve = {}
+    wavelengths, ref_wavelengths = {}, {}
+    for key, value in raw.items():
+        m = index_re.match(key)
+        if m and int(m.group(2)) >= 1:
+            per_curve.setdefault(int(m.group(2)) - 1, {})[m.group(1)] = value
+            continue
+        m = re.match(r"^(ref)?wavelength(\d+)$", key)
+        if m and int(m.group(2)) >= 1:
+            (ref_wavelengths if m.group(1) else wavelengths)[int(m.group(2)) - 1] = value
+
+    stages = _stages(base)
+    overrides = {i: _stages({**base, **values}) for i, values in per_curve.items()}
+    ref_stages, ref_overrides = (), {}
+
+    unit = parse_xunit(raw.get("xunit"))
+    if unit not in (None, "2theta"):
+        wl = parse_wavelength(raw.get("wavelength"), DEFAULT_WAVELENGTH)
+        ref_wl = parse_wavelength(raw.get("refwavelength"), wl)
+        for i in wavelengths:
+            overrides.setdefault(i, stages)
+        overrides = {i: st + (("xunit", (unit, parse_wavelength(wavelengths.get(i), wl))),)
+                     for i, st in overrides.items()}
+        stages = stages + (("xunit", (unit, wl)),)
+        ref_stages = (("xunit", (unit, ref_wl)),)
+        ref_overrides = {i: (("xunit", (unit, parse_wavelength(v, ref_wl))),)
+                         for i, v in ref_wavelengths.items()}
+    return stages, overrides, ref_stages, ref_overrides
+
+
+# -------------------- memoized execution --------------------
+class PipelineCache:
+    """
+    Bounded memo of stage outputs: (input key, stages so far) -> (x, y).
+    The input key is a checksum of the arrays, computed once per array
+    object (the DatasetCache hands out the same read-only arrays until the
+    file changes).
+    """
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = int(max_bytes)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._ids = {}                  # (id(x), id(y)) -> (weakref x, weakref y, key)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def input_key(self, x, y):
+        ident = (id(x), id(y))          # several files may share one x grid
+        entry = self._ids.get(ident)
+        if entry is not None and entry[0]() is x and entry[1]() is y:
+            return entry[2]
+        xa, ya = np.ascontiguousarray(x), np.ascontiguousarray(y)
+        key = (len(xa), xa.dtype.str, ya.dtype.str, zlib.crc32(xa), zlib.crc32(ya))
+        try:
+            ids = self._ids
+            ref = weakref.ref(y, lambda _r, k=ident: ids.pop(k, None))
+            ids[ident] = (weakref.ref(x), ref, key)
+        except TypeError:               # not weak-referenceable (e.g. a list)
+            pass
+        return key
+
+    def _get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def _put(self, key, value):
+        size = value[0].nbytes + value[1].nbytes
+        if size > self.max_bytes:
+            return
+        for a in value:
+            a.setflags(write=False)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[0].nbytes + old[1].nbytes
+            self._entries[key] = value
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, (ox, oy) = self._entries.popitem(last=False)
+                self._bytes -= ox.nbytes + oy.nbytes
+
+    def cached(self, x, y, stages):
+        """True if the full result of `stages` is memoized (nothing to compute)."""
+        return not stages or self._get((self.input_key(x, y), stages)) is not None
+
+    def resume(self, x, y, stages):
+        """(input key, number of stages already memoized, their output)."""
+        base = self.input_key(x, y)
+        for k in range(len(stages), 0, -1):
+            hit = self._get((base, stages[:k]))
+            if hit is not None:
+                return base, k, hit
+        return base, 0, (x, y)
+
+    def store(self, base, stages, start, outputs):
+        """Memoize the outputs of stages[start:] (as returned by run_stages)."""
+        for k, out in enumerate(outputs, start + 1):
+            self._put((base, stages[:k]), out)
+
+    def run(self, x, y, stages):
+        """Apply `stages` to (x, y), reusing the longest memoized prefix."""
+        if not stages:
+            return x, y
+        base, start, cur = self.resume(x, y, stages)
+        if start == len(stages):
+            self.hits += 1
+            return cur
+        self.misses += 1
+        outputs = run_stages(cur[0], cur[1], stages[start:])
+        self.store(base, stages, start, outputs)
+        return outputs[-1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def run_stages(x, y, stages):
+    """Output of every stage in turn, [(x, y), ...] (no memo; also runs in worker processes)."""
+    cx, cy = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    outputs = []
+    for name, params in stages:
+        cx, cy = STAGES[name][1](cx, cy, params)
+        cx, cy = np.array(cx, dtype=float), np.array(cy, dtype=float)
+        outputs.append((cx, cy))
+    return outputs
+
+
+default_pipeline_cache = PipelineCache()
+
+
+def process_curve(x, y, stages, cache=None):
+    """Run a curve through its stages (memoized in `cache`, default: the shared one)."""
+    cache = cache if cache is not None else default_pipeline_cache
+    return cache.run(x, y, stages)
+
+
+def without_background(stages):
+    """The same stages minus the background subtraction (for the overlay)."""
+    return tuple(s for s in stages if s[0] != "background")
+
+
+# Backgrounds fitted iteratively (a banded solve per iteration, a Python
+# loop without SciPy): worth sending to other processes
+_SLOW_BACKGROUNDS = ("asls", "arpls")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=max(1, min(8, os.cpu_count() or 1)))
+        return _pool
+
+
+def _drop_executor():
+    global _pool
+    with _pool_lock:
+        _pool = None
+
+
+def _slow(stages):
+    return any(name == "background" and params and params[0] in _SLOW_BACKGROUNDS
+               for name, params in stages)
+
+
+def process_curves(jobs, cache=None, parallel=True):
+    """
+    Run many curves [(x, y, stages), ...] through their stages.
+    Curves whose iterative background fit (asls, arpls) is not memoized
+    yet are processed in a pool of worker processes, so 200 patterns use
+    every core; their results are memoized here as usual. Other stages are
+    vectorized and run in this process.
+    Returns one (x, y) per job, or the exception raised for that job.
+    """
+    cache = cache if cache is not None else default_pipeline_cache
+
+    def _one(job):
+        try:
+            return cache.run(*job)
+        except Exception as e:
+            return e
+
+    todo = []
+    if parallel and (os.cpu_count() or 1) > 1:
+        for k, (x, y, stages) in enumerate(jobs):
+            if stages and _slow(stages):
+                base, start, cur = cache.resume(x, y, stages)
+                if start < len(stages) and _slow(stages[start:]):
+                    todo.append((k, base, start, cur))
+    if len(todo) < 2:
+        return [_one(job) for job in jobs]
+
+    results = [None] * len(jobs)
+    pool = _executor()
+    futures = [pool.submit(run_stages, cur[0], cur[1], jobs[k][2][start:])
+               for k, base, start, cur in todo]
+    for (k, base, start, cur), fut in zip(todo, futures):
+        try:
+            outputs = fut.result()
+        except BrokenExecutor:
+            _drop_executor()        # a worker died: done here below, new pool next time
+            continue
+        except Exception as e:
+            results[k] = e
+            continue
+        cache.store(base, jobs[k][2], start, outputs)
+        cache.misses += 1
+        results[k] = outputs[-1]
+    for k, res in enumerate(results):
+        if res is None:             # memoized or quick: done here
+            results[k] = _one(jobs[k])
+    return results
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Named style presets.
+
+A preset is a block of command box lines ('key = value') saved under a
+name. 'preset = journal' in the command box applies the preset's lines
+first; the box's own lines override them. Presets are plain text files
+in PRESET_DIR (one per name), so they can be shared by copying the file.
+A few built-in presets are available even when the folder is empty.
+
+Preset texts are cached by file signature: switching presets or
+compiling the same command box again reads nothing from disk.
+"""
+
+import os
+import re
+
+
+PRESET_DIR = os.path.join(os.path.expanduser("~"), ".plotter", "presets")
+PRESET_EXT = ".txt"
+
+BUILTIN_PRESETS = {
+    "journal": (
+        "font = sans-serif\n"
+        "default_size = 8\n"
+        "label_size = 8\n"
+        "tick_size = 7\n"
+        "title_size = 8\n"
+        "legend_size = 7\n"
+        "linewidth = 0.8\n"
+        "square_width = 0.6\n"
+        "axes_size_cm = 7,5.5\n"
+        "margins_cm = 1.4,0.3,0.3,1.1\n"
+        "export_dpi = 600\n"
+    ),
+    "slides": (
+        "font = sans-serif\n"
+        "default_size = 16\n"
+        "label_size = 18\n"
+        "tick_size = 16\n"
+        "title_size = 20\n"
+        "legend_size = 14\n"
+        "linewidth = 2\n"
+        "reflinewidth = 3\n"
+        "square_width = 1.5\n"
+        "figsize_cm = 24,15\n"
+        "export_dpi = 200\n"
+    ),
+}
+
+_NAME_RE = re.compile(r"^[\w .\-]+$")
+_texts = {}      # path -> (signature, text)
+
+
+def _path(name, directory=None):
+    name = str(name).strip()
+    if not name or not _NAME_RE.match(name) or name.startswith("."):
+        raise ValueError(f"Invalid preset name: {name!r}")
+    return os.path.join(directory or PRESET_DIR, name + PRESET_EXT)
+
+
+def list_presets(directory=None):
+    """Names of the saved presets plus the built-in ones, sorted."""
+    names = set(BUILTIN_PRESETS)
+    try:
+        with os.scandir(directory or PRESET_DIR) as it:
+            names.update(e.name[:-len(PRESET_EXT)] for e in it
+                         if e.name.lower().endswith(PRESET_EXT) and e.is_file())
+    except OSError:
+        pass
+    return sorted(names, key=str.lower)
+
+
+def preset_text(name, directory=None):
+    """Command lines of a preset (a saved file wins over a built-in), or None."""
+    try:
+        path = _path(name, directory)
+    except ValueError:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        _texts.pop(path, None)
+        return BUILTIN_PRESETS.get(str(name).strip().lower())
+    sig = (st.st_mtime_ns, st.st_size)
+    entry = _texts.get(path)
+    if entry is None or entry[0] != sig:
+        with open(path, encoding="utf-8") as f:
+            entry = (sig, f.read())
+        _texts[path] = entry
+    return entry[1]
+
+
+def save_preset(name, text, directory=None):
+    """Write a preset file (the folder is created if needed); returns its path."""
+    path = _path(name, directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text.strip() + "\n")
+    return path
+
+
+def delete_preset(name, directory=None):
+    """Remove a saved preset (built-ins cannot be removed)."""
+    path = _path(name, directory)
+    _texts.pop(path, None)
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
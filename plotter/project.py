@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Self-contained project files (".plotz", project format v2).
+
+A bundle is a zip with the usual project JSON (project.json) plus one
+compressed .npy member per data/reference file holding the parsed
+arrays. Opening it is one sequential read of the zip: nothing is parsed
+again and nothing needs relinking, because the arrays are pinned in the
+DatasetCache under the files' original paths. A file listed both as data
+and as a reference is stored once per kind. The pins last until the cache
+drops them (DatasetCache.unpin; the app does so when another project is
+opened or a file changes on disk).
+
+    save_bundle("run12.plotz", project, float32=True)
+    project = load_bundle("run12.plotz")     # then build_figure(project["data_files"], ...)
+"""
+
+import io
+import json
+import zipfile
+
+import numpy as np
+
+from .cache import default_cache
+
+
+BUNDLE_EXT = ".plotz"
+BUNDLE_FORMAT = "plotter-bundle"
+BUNDLE_VERSION = 2
+_PROJECT_MEMBER = "project.json"
+
+
+def is_bundle(path):
+    """True if `path` is a project bundle (a zip), False for a JSON project."""
+    try:
+        return zipfile.is_zipfile(path)
+    except OSError:
+        return False
+
+
+def _npy_bytes(array):
+    buf = io.BytesIO()
+    np.save(buf, array, allow_pickle=False)
+    return buf.getvalue()
+
+
+def save_bundle(path, project, cache=None, float32=False, on_error=None):
+    """
+    Write `project` (the dict saved by 'Save Project') and the parsed
+    arrays of its data_files / ref_files into one zip.
+    float32 halves the size (about 7 significant digits are kept).
+    on_error(kind, path, exc) is called for files that cannot be read
+    (they are saved as paths only); when None the exception is raised.
+    Returns the number of files embedded.
+    """
+    cache = cache if cache is not None else default_cache
+    dtype = np.float32 if float32 else np.float64
+    snapshots = {}
+    members = []
+    kinds = (("data", "DATA", project.get("data_files", [])),
+             ("ref", "REF", project.get("ref_files", [])))
+    for kind, label, paths in kinds:
+        for p in paths:
+            name = f"{kind}:{p}"
+            if name in snapshots:
+                continue
+            try:
+                value = cache.get(p, kind)
+            except Exception as e:
+                if on_error is None:
+                    raise
+                on_error(label, p, e)
+                continue
+            member = f"arrays/{kind}{len(members):05d}.npy"
+            xy = np.vstack((np.asarray(value[0], dtype=dtype), np.asarray(value[1], dtype=dtype)))
+            snapshots[name] = {"kind": kind, "path": p, "member": member}
+            if kind == "ref":
+                snapshots[name]["is_peak_list"] = bool(value[2])
+            members.append((member, xy))
+
+    meta = dict(project)
+    meta.update({"format": BUNDLE_FORMAT, "version": BUNDLE_VERSION,
+                 "dtype": np.dtype(dtype).name, "snapshots": snapshots})
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=6) as zf:
+        zf.writestr(_PROJECT_MEMBER, json.dumps(meta, indent=2))
+        for member, xy in members:
+            zf.writestr(member, _npy_bytes(xy))
+    return len(members)
+
+
+def load_bundle(path, cache=None):
+    """
+    Read a bundle in one pass, pin its arrays in `cache` (default: the
+    shared cache) and return the project dict (same keys as a JSON project).
+    """
+    cache = cache if cache is not None else default_cache
+    arrays = {}
+    with zipfile.ZipFile(path) as zf:
+        meta = None
+        for info in zf.infolist():          # members are stored in write order
+            data = zf.read(info)
+            if info.filename == _PROJECT_MEMBER:
+                meta = json.loads(data.decode("utf-8"))
+            elif info.filename.endswith(".npy"):
+                arrays[info.filename] = np.load(io.BytesIO(data), allow_pickle=False)
+    if meta is None or meta.get("format") != BUNDLE_FORMAT:
+        raise ValueError(f"{path} is not a Plotter project bundle")
+
+    for name, snap in meta.get("snapshots", {}).items():
+        xy = arrays.get(snap.get("member"))
+        if xy is None:
+            continue
+        p = snap.get("path", name)          # first bundles were keyed by path only
+        if snap["kind"] == "ref":
+            cache.pin(p, "ref", (xy[0], xy[1], snap.get("is_peak_list", False)))
+        else:
+            cache.pin(p, "data", (xy[0], xy[1]))
+    return meta
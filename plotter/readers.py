@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+"""
+File readers for data patterns (.xy/.csv/.dat/.txt/.gr) and reference
+files (.csv/.xy/.txt/.xlsx peak lists).
+
+read_data_file / read_reference_file take the file's bytes as `raw` when
+the caller has already read them (DatasetCache hashes them), so the file
+is not read a second time; the path still decides the format.
+"""
+
+import os
+import threading
+from io import StringIO, BytesIO
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+# File dialog filters, shared by the GUI and the relink dialogs
+DATA_FILETYPES = [("Files", "*.xy *.csv *.dat *.txt *.gr")]
+REF_FILETYPES = [("Reference Files", "*.csv *.xy *.txt *.xlsx")]
+
+
+def _source(filepath, raw):
+    """What to hand a parser: the path, or a fresh file object on `raw` bytes."""
+    return filepath if raw is None else BytesIO(raw)
+
+
+def robust_read_csv(filepath, max_header_lines=5, raw=None):
+    """
+    Tries to read a reference file (csv, xy, xls) with unknown delimiter and variable header lines.
+    - Tries common delimiters.
+    - Tries to skip up to max_header_lines lines until data parses correctly.
+    - Supports CSV-like and Excel files.
+    Returns a DataFrame with at least two columns (angle, intensity).
+    """
+    ext = os.path.splitext(filepath)[1].lower()
+
+    # For Excel files (.xlsx: streaming reader, first sheet)
+    if ext == '.xlsx':
+        x, y = read_excel_reference(filepath, raw)
+        return pd.DataFrame({0: x, 1: y})
+    if ext == '.xls':
+        try:
+            df = pd.read_excel(_source(filepath, raw))
+            if df.shape[1] >= 2:
+                return df
+        except Exception as e:
+            raise ValueError(f"Cannot read Excel file: {e}")
+
+    # For text files
+    delimiters = [',', '\t', ';', ' ']
+
+    # Try skipping 0 to max_header_lines lines
+    for skip in range(max_header_lines + 1):
+        for delim in delimiters:
+            try:
+                df = pd.read_csv(_source(filepath, raw), delimiter=delim, skiprows=skip,
+                                 engine='python', header=None)
+                # Check at least 2 numeric columns in data
+                if df.shape[1] >= 2:
+                    # Check if first two columns are numeric (floats or ints)
+                    try:
+                        #df_check = df.iloc[:, :2].apply(pd.to_numeric)
+                        return df.iloc[:, :2].copy()  # Return first 2 columns only
+                    except:
+                        continue
+            except:
+                continue
+    raise ValueError(f"Cannot parse reference file {filepath} with common delimiters and header skips.")
+
+
+def read_gr_file(filepath, raw=None):
+    """
+    Custom reader for .gr files from PDFgetX3 which contain a config header.
+    It skips lines until it finds the data block (starting with #L ...).
+    """
+    if raw is not None:
+        lines = _decode(raw).splitlines(keepends=True)
+    else:
+        with open(filepath, 'r') as f:
+            lines = f.readlines()
+
+    # Find the line starting with '#L' which defines the data columns
+    for idx, line in enumerate(lines):
+        if line.strip().startswith("#L"):
+            data_start = idx + 1
+            break
+    else:
+        raise ValueError(f"Could not find '#L' header in {filepath}")
+
+    # Now parse the data from that point onward
+    data_str = ''.join(lines[data_start:])
+    df = pd.read_csv(StringIO(data_str), sep=r"\s+", header=None)
+
+    if df.shape[1] < 2:
+        raise ValueError(f"Data section in {filepath} does not have two columns.")
+
+    return df.iloc[:, :2].copy()
+
+
+def read_data_file(filepath, raw=None):
+    """Read a data pattern and return (x, y) arrays."""
+    ext = os.path.splitext(filepath)[1].lower()
+    if ext == '.csv':
+        df = robust_read_csv(filepath, raw=raw)
+        return df.iloc[:, 0].values, df.iloc[:, 1].values
+    if ext == '.gr':
+        df = read_gr_file(filepath, raw)
+        return df.iloc[:, 0].values, df.iloc[:, 1].values
+    data = np.loadtxt(_source(filepath, raw), comments="#", skiprows=1)
+    return data[:, 0], data[:, 1]
+
+
+# -------------------- reference tables --------------------
+# Header names (compared lower-case, spaces collapsed) of the angle and
+# intensity columns in exported peak tables; the first match wins.
+REF_X_COLUMNS = ("2theta (°)", "2theta(°)", "2theta")
+REF_Y_COLUMNS = ("i var", "i fix")
+
+_SNIFF_LINES = 20       # lines looked at to find the header, separator and decimal mark
+
+
+def _decode(raw):
+    """Text of a file read as bytes (UTF-8 with or without BOM, else Latin-1)."""
+    try:
+        return raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return raw.decode("latin-1")
+
+
+def _is_number(token):
+    try:
+        float(token.replace(",", "."))
+        return True
+    except ValueError:
+        return False
+
+
+def _split_fields(line, sep):
+    return line.split() if sep is None else [t.strip() for t in line.split(sep)]
+
+
+# Separators tried on the first data row, in order; None = whitespace
+_SEPARATORS = (";", "\t", ",", None)
+
+
+def _data_separator(text):
+    """Separator giving a numeric row for this line, or False when it is not a data row."""
+    for sep in _SEPARATORS:
+        if sep is not None and sep not in text:
+            continue
+        fields = [t for t in _split_fields(text, sep) if t]
+        numeric = sum(map(_is_number, fields))
+        # a comma may be the decimal mark: as separator every field must be a number
+        if numeric >= 2 and (sep != "," or numeric == len(fields)):
+            return sep
+    return False
+
+
+def sniff_table(lines):
+    """
+    Look at the first lines of a text table and return
+    (sep, decimal, header fields or None, number of lines before the data).
+    sep is None for whitespace-separated columns. The separator comes from
+    the first data row (';', tab and ',' before whitespace) and the header
+    row is split with the same separator.
+    """
+    header_line = None
+    for i, line in enumerate(lines[:_SNIFF_LINES]):
+        text = line.strip()
+        if not text or text.startswith("#"):
+            continue
+        sep = _data_separator(text)
+        if sep is False:
+            header_line = text
+            continue
+        decimal = "," if sep != "," and "," in text else "."
+        header = _split_fields(header_line, sep) if header_line is not None else None
+        return sep, decimal, header, i
+    raise ValueError("no numeric data rows found")
+
+
+def _norm(name):
+    return " ".join(str(name).lower().split())
+
+
+def pick_reference_columns(header):
+    """
+    (x column, y column) indices from a header row: '2Theta (°)' with
+    'I var' (else 'I fix', else the next column); (0, 1) without a header.
+    """
+    if not header:
+        return 0, 1
+    names = [_norm(h) for h in header]
+    xi = next((names.index(n) for n in REF_X_COLUMNS if n in names), None)
+    if xi is None:
+        return 0, 1
+    yi = next((names.index(n) for n in REF_Y_COLUMNS if n in names), None)
+    if yi is None:
+        yi = 1 if xi != 1 else 0
+    return xi, yi
+
+
+def read_reference_table(filepath, raw=None):
+    """
+    Fast path for text peak tables: the separator, the decimal mark and the
+    header row are detected from the first lines, then only the two needed
+    columns are parsed by pandas' C parser straight to float
+    (decimal=','), without converting the cells to Python strings.
+    Returns (x, y) float arrays.
+    """
+    if raw is None:
+        with open(filepath, "rb") as f:
+            raw = f.read()
+    text = _decode(raw)
+    sep, decimal, header, skip = sniff_table(text.split("\n", _SNIFF_LINES)[:_SNIFF_LINES])
+    xi, yi = pick_reference_columns(header)
+    kw = dict(sep=r"\s+" if sep is None else sep, decimal=decimal, header=None,
+              skiprows=skip, comment="#", usecols=sorted({xi, yi}), skip_blank_lines=True,
+              skipinitialspace=sep is not None)
+    try:
+        # round_trip: correctly rounded doubles (the same values np.loadtxt gives)
+        df = pd.read_csv(StringIO(text), engine="c", dtype=float, float_precision="round_trip", **kw)
+    except ValueError:
+        # Ragged or partly non-numeric rows: slower but tolerant
+        df = pd.read_csv(StringIO(text), engine="python", on_bad_lines="skip", **kw)
+        for col in df.columns:
+            if df[col].dtype == object:
+                df[col] = df[col].str.strip()
+                if decimal == ",":
+                    df[col] = df[col].str.replace(",", ".", regex=False)
+        df = df.apply(pd.to_numeric, errors="coerce").dropna()
+    x = df[xi].to_numpy(dtype=float)
+    y = df[yi].to_numpy(dtype=float)
+    return x, y
+
+
+# -------------------- Excel workbooks --------------------
+# 'book.xlsx::Phase B' = sheet 'Phase B' of book.xlsx (one reference per phase)
+SHEET_SEP = "::"
+_BOOKS = OrderedDict()      # path -> ((mtime_ns, size), [(sheet, x, y), ...])
+_MAX_BOOKS = 8
+_BOOKS_LOCK = threading.Lock()   # the phases of a book may be requested from several threads
+
+
+def split_sheet(path):
+    """'book.xlsx::Phase B' -> ('book.xlsx', 'Phase B'); other paths -> (path, None)."""
+    base, sep, sheet = str(path).partition(SHEET_SEP)
+    if sep and os.path.splitext(base)[1].lower() == ".xlsx":
+        return base, sheet
+    return path, None
+
+
+def reference_label(path):
+    """Default legend/list name: file name without extension ('book: Phase B' for a sheet)."""
+    base, sheet = split_sheet(path)
+    stem = os.path.splitext(os.path.basename(base))[0]
+    return f"{stem}: {sheet}" if sheet is not None else stem
+
+
+def _cell_float(v):
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        return float(v)
+    return float(str(v).strip().replace(",", "."))
+
+
+def _is_number_cell(v):
+    if v is None:
+        return False
+    try:
+        _cell_float(v)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def _read_sheet(ws):
+    """(x, y) of one worksheet: header row found in the first rows, then 2 columns streamed."""
+    header, data_row = None, None
+    for r, row in enumerate(ws.iter_rows(max_row=_SNIFF_LINES, values_only=True), 1):
+        if sum(map(_is_number_cell, row)) >= 2:
+            data_row = r
+            break
+        if any(v is not None for v in row):
+            header = ["" if v is None else str(v) for v in row]
+    if data_row is None:
+        raise ValueError(f"no numeric rows in sheet {ws.title!r}")
+    xi, yi = pick_reference_columns(header)
+    lo = min(xi, yi)
+    xs, ys = [], []
+    for row in ws.iter_rows(min_row=data_row, min_col=lo + 1, max_col=max(xi, yi) + 1,
+                            values_only=True):
+        try:
+            x, y = _cell_float(row[xi - lo]), _cell_float(row[yi - lo])
+        except (TypeError, ValueError, IndexError):
+            continue        # empty or text cells (notes under the table)
+        xs.append(x)
+        ys.append(y)
+    return np.array(xs, dtype=float), np.array(ys, dtype=float)
+
+
+def read_excel_phases(filepath, raw=None):
+    """
+    Every sheet of a workbook as [(sheet name, x, y), ...], in one open of
+    the file (read-only/streaming openpyxl: no styles, only the cell values
+    of the two needed columns). Sheets without a numeric table are skipped.
+    Results are kept per file signature, so each phase of the book is read
+    from memory after the first.
+    """
+    with _BOOKS_LOCK:
+        st = os.stat(filepath)
+        sig = (st.st_mtime_ns, st.st_size)
+        entry = _BOOKS.get(filepath)
+        if entry is not None and entry[0] == sig:
+            _BOOKS.move_to_end(filepath)
+            return entry[1]
+        phases = _read_workbook(filepath, raw)
+        _BOOKS[filepath] = (sig, phases)
+        while len(_BOOKS) > _MAX_BOOKS:
+            _BOOKS.popitem(last=False)
+        return phases
+
+
+def _read_workbook(filepath, raw=None):
+    from openpyxl import load_workbook
+    wb = load_workbook(_source(filepath, raw), read_only=True, data_only=True)
+    phases = []
+    try:
+        for ws in wb.worksheets:
+            try:
+                x, y = _read_sheet(ws)
+            except ValueError:
+                continue
+            phases.append((ws.title, x, y))
+    finally:
+        wb.close()          # read-only workbooks keep the file open until closed
+    if not phases:
+        raise ValueError(f"No sheet of {os.path.basename(filepath)} has a numeric table")
+    return phases
+
+
+def excel_sheet_paths(filepath):
+    """One reference path per phase sheet of a workbook ([filepath] if it has a single one)."""
+    phases = read_excel_phases(filepath)
+    if len(phases) == 1:
+        return [filepath]
+    return [f"{filepath}{SHEET_SEP}{name}" for name, _, _ in phases]
+
+
+def read_excel_reference(filepath, raw=None):
+    """(x, y) of a workbook's first sheet, or of the sheet named in 'book.xlsx::Sheet'."""
+    base, sheet = split_sheet(filepath)
+    phases = read_excel_phases(base, raw)
+    if sheet is None:
+        return phases[0][1], phases[0][2]
+    for name, x, y in phases:
+        if name == sheet:
+            return x, y
+    raise ValueError(f"No sheet {sheet!r} in {os.path.basename(base)}")
+
+
+def read_reference_file(filepath, raw=None):
+    """
+    Read a reference file and return (x, y, is_peak_list).
+    Table-like files (csv/xy/txt/dat/xlsx) are treated as peak lists
+    (one stick per row); other files go through np.loadtxt.
+    """
+    base, sheet = split_sheet(filepath)
+    ext = os.path.splitext(base)[1].lower()
+    if ext in [".csv", ".xy", ".txt", ".dat"]:
+        x, y = read_reference_table(filepath, raw)
+        return x, y, True
+    if ext == ".xlsx":
+        x, y = read_excel_reference(filepath, raw)
+        return x, y, True
+
+    data = np.loadtxt(_source(filepath, raw))
+    if data.ndim == 1:
+        return data, np.ones_like(data), True
+    return data[:, 0], data[:, 1], False
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+Relinking helpers for moved project folders.
+
+FileIndex walks a candidate root once with os.scandir in a background
+thread and keeps a basename -> paths map, so the relink dialogs can check
+hundreds of candidate paths without touching a (slow, network) disk on
+every keystroke. PathValidator answers "does this path exist?" from the
+indexes, from a memo, or asynchronously in a small thread pool.
+
+Workbook phases ('book.xlsx::Phase B') are checked and looked up by their
+workbook; with_sheet() puts the sheet back on the relinked path.
+"""
+
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .readers import SHEET_SEP, split_sheet
+
+
+def _key(path):
+    """Comparison key for paths (case-insensitive on Windows)."""
+    return os.path.normcase(os.path.normpath(path))
+
+
+def with_sheet(new_path, old_path):
+    """`new_path` with the sheet of `old_path` ('book.xlsx::Sheet'), unless it names one itself."""
+    sheet = split_sheet(old_path)[1]
+    if sheet and split_sheet(new_path)[1] is None:
+        return f"{new_path}{SHEET_SEP}{sheet}"
+    return new_path
+
+
+class FileIndex:
+    """
+    Background index of every file under `root`.
+    done/cancelled tell the state; count is updated while walking.
+    """
+    def __init__(self, root, max_files=500000):
+        self.root = os.path.normpath(root)
+        self.max_files = int(max_files)
+        self.by_name = {}           # normcase(basename) -> [path, ...]
+        self._paths = set()         # _key(path) of every file
+        self.count = 0
+        self.truncated = False
+        self.error = None
+        self.built_at = None
+        self._done = threading.Event()
+        self._cancel = threading.Event()
+        self._thread = None
+
+    # ---------- state ----------
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._walk, name="plotter-file-index", daemon=True)
+            self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def cancel(self):
+        self._cancel.set()
+
+    # ---------- walk ----------
+    def _walk(self):
+        try:
+            stack = [self.root]
+            while stack and not self._cancel.is_set():
+                d = stack.pop()
+                try:
+                    with os.scandir(d) as it:
+                        for entry in it:
+                            try:
+                                if entry.is_dir(follow_symlinks=False):
+                                    stack.append(entry.path)
+                                elif entry.is_file():
+                                    self._add(entry.path, entry.name)
+                            except OSError:
+                                continue
+                except OSError:
+                    continue
+                if self.count >= self.max_files:
+                    self.truncated = True
+                    break
+        except Exception as e:
+            self.error = e
+        finally:
+            self.built_at = time.monotonic()
+            self._done.set()
+
+    def _add(self, path, name):
+        self.by_name.setdefault(os.path.normcase(name), []).append(path)
+        self._paths.add(_key(path))
+        self.count += 1
+
+    # ---------- queries (valid once done) ----------
+    def covers(self, path):
+        """True if `path` lies under the indexed root and the walk is complete."""
+        if not self.done or self.cancelled or self.truncated:
+            return False
+        k, root = _key(path), _key(self.root)
+        return k == root or k.startswith(root.rstrip(os.sep) + os.sep)
+
+    def contains(self, path):
+        return _key(path) in self._paths
+
+    def find(self, basename):
+        """All indexed paths with this file name."""
+        return list(self.by_name.get(os.path.normcase(basename), ()))
+
+
+# -------------------- shared index cache --------------------
+_INDEXES = {}
+_INDEX_LOCK = threading.Lock()
+INDEX_TTL = 120.0       # seconds before a finished index is rebuilt
+
+
+def get_index(root, start=True):
+    """Return a (possibly already built) FileIndex for `root`, reused across dialogs."""
+    k = _key(root)
+    with _INDEX_LOCK:
+        idx = _INDEXES.get(k)
+        stale = idx is not None and idx.done and (
+            idx.cancelled or idx.error is not None or time.monotonic() - idx.built_at > INDEX_TTL)
+        if idx is None or stale:
+            idx = FileIndex(root)
+            _INDEXES[k] = idx
+    return idx.start() if start else idx
+
+
+class PathValidator:
+    """
+    Non-blocking existence checks for relink previews.
+
+    status(path) returns True/False when known, or None while a background
+    check is running (call again later, e.g. from Tk 'after').
+    """
+    def __init__(self, indexes=(), max_workers=4):
+        self.indexes = list(indexes)
+        self._memo = {}
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="plotter-exists")
+
+    def add_index(self, index):
+        if index not in self.indexes:
+            self.indexes.append(index)
+
+    def status(self, path):
+        if not path:
+            return False
+        path = split_sheet(path)[0]         # a sheet exists if its workbook does
+        for idx in self.indexes:
+            if idx.covers(path):
+                return idx.contains(path)
+        k = _key(path)
+        with self._lock:
+            if k in self._memo:
+                return self._memo[k]
+            if k not in self._futures:
+                self._futures[k] = self._pool.submit(self._check, k, path)
+        return None
+
+    def _check(self, k, path):
+        ok = os.path.exists(path)
+        with self._lock:
+            self._memo[k] = ok
+            self._futures.pop(k, None)
+        return ok
+
+    def exists(self, path):
+        """Blocking variant (used once at Apply time)."""
+        st = self.status(path)
+        if st is None:
+            path = split_sheet(path)[0]
+            st = self._check(_key(path), path)
+        return st
+
+    @property
+    def pending(self):
+        with self._lock:
+            return len(self._futures)
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _suffix_score(old_path, candidate):
+    """Number of trailing path components shared by two paths."""
+    a = _key(old_path).split(os.sep)
+    b = _key(candidate).split(os.sep)
+    n = 0
+    while n < min(len(a), len(b)) and a[-1 - n] == b[-1 - n]:
+        n += 1
+    return n
+
+
+def auto_relink(missing_rows, index):
+    """
+    Relink every missing row by file name in one pass over a built index.
+    When several files share the name, the one sharing the most trailing
+    folders with the old path wins; ties are left unresolved.
+    Returns (mapping [{'kind','old_path','new_path'}], unresolved rows).
+    """
+    mapping, unresolved = [], []
+    for row in missing_rows:
+        oldp = row["old_path"]
+        base = split_sheet(oldp)[0]
+        candidates = index.find(os.path.basename(base))
+        if not candidates:
+            unresolved.append(row)
+            continue
+        scored = sorted(((_suffix_score(base, c), c) for c in candidates), reverse=True)
+        if len(scored) > 1 and scored[0][0] == scored[1][0]:
+            unresolved.append(row)
+            continue
+        mapping.append({"kind": row["kind"], "old_path": oldp,
+                        "new_path": with_sheet(scored[0][1], oldp)})
+    return mapping, unresolved
@@ -0,0 +1,597 @@
+# -*- coding: utf-8 -*-
+"""
+Rendering: draw data and reference files on a Matplotlib Axes from a
+command dict. Works on any Figure (embedded Tk canvas or headless).
+"""
+
+import os
+import random
+import weakref
+from contextlib import nullcontext
+from functools import lru_cache
+from types import MappingProxyType
+
+import numpy as np
+import matplotlib as mpl
+from matplotlib.figure import Figure
+from matplotlib import ticker as mticker
+
+from .commands import (parse_pair_cm, parse_margins_cm, axes_size_is_square, cm_to_in,
+                       panel_grid)
+from .options import compile_commands, compile_mapping, PlotOptions, STYLE_KEYS
+from .cache import default_cache
+from .fonts import resolve_font
+from .pipeline import process_curve, process_curves, without_background
+from .units import parse_xunit, axis_label
+from .readers import reference_label
+
+
+def normalize(y):
+    """Scale y to [0, 1] (returned unchanged if flat)."""
+    y_min = np.min(y)
+    y_max = np.max(y)
+    if y_max - y_min == 0:
+        return y
+    return (y - y_min) / (y_max - y_min)
+
+
+def stack_y(y, i, n, options, like=None):
+    """
+    Normalize (if enabled) and shift curve i of n by the stacking offset.
+    With `like`, y is normalized with the range of `like` (a fitted
+    background drawn over its curve).
+    """
+    if options.normalize == "off":
+        y_norm = y
+    elif like is None:
+        y_norm = normalize(y)
+    else:
+        lo, hi = np.min(like), np.max(like)
+        y_norm = (y - lo) / (hi - lo) if hi > lo else y
+    return y_norm + (options.offset * (n - i - 1))
+
+
+# Data line -> dashed background line drawn over it (background_overlay)
+_BACKGROUND_LINES = weakref.WeakKeyDictionary()
+
+
+def _process_files(files, cc, cache, overlay=False, indices=None):
+    """
+    Load and process data files; the processing steps that are not
+    memoized yet (e.g. background fits) run in parallel.
+    Returns per file (x, y, background or None), or the exception raised.
+    With `overlay`, y is the curve before background subtraction.
+    `indices` are the files' curve numbers (per-curve stages), default 0..n-1.
+    """
+    slots, jobs = [], []
+    for k, path in enumerate(files):
+        try:
+            x, y = cache.load_data(path)
+        except Exception as e:
+            slots.append(e)
+            continue
+        stages = cc.pipeline(indices[k] if indices is not None else k)
+        raw = without_background(stages) if overlay else stages
+        slots.append((len(jobs), len(jobs) + 1 if raw != stages else None))
+        jobs.append((x, y, stages))
+        if raw != stages:
+            jobs.append((x, y, raw))
+
+    results = process_curves(jobs)
+    out = []
+    for slot in slots:
+        if isinstance(slot, Exception):
+            out.append(slot)
+            continue
+        res = results[slot[0]]
+        raw = results[slot[1]] if slot[1] is not None else None
+        if isinstance(res, Exception):
+            out.append(res)
+        elif raw is None or isinstance(raw, Exception) or len(raw[1]) != len(res[1]):
+            out.append((res[0], res[1], None))
+        else:
+            out.append((raw[0], raw[1], raw[1] - res[1]))
+    return out
+
+
+def get_distinct_colors(n):
+    colors = []
+    for _ in range(n):
+        r, g, b = [random.uniform(0.1, 0.9) for _ in range(3)]
+        colors.append((r, g, b))
+    return colors
+
+
+def style_rc(options):
+    """Return the rcParams dict matching the plotting options."""
+    return {
+        "xtick.major.width": 1,
+        "ytick.major.width": 1,
+        "pdf.fonttype": 42,
+        "ps.fonttype": 42,
+        "font.size": options["default_size"],
+        "axes.labelsize": options["label_size"],
+        "axes.titlesize": options["title_size"],
+        "xtick.labelsize": options["tick_size"],
+        "ytick.labelsize": options["tick_size"],
+        "legend.fontsize": options["legend_size"],
+        "font.family": options["font"],
+        "axes.labelcolor": options["textcolor"],
+        "axes.titlecolor": options["textcolor"],
+        "axes.edgecolor": options["square_color"],
+        "xtick.color": options["square_color"],
+        "ytick.color": options["square_color"],
+        "xtick.labelcolor": options["textcolor"],
+        "ytick.labelcolor": options["textcolor"],
+        "text.color": options["textcolor"],
+    }
+
+
+def _style_key(options):
+    return tuple((k, options[k]) for k in sorted(STYLE_KEYS))
+
+
+@lru_cache(maxsize=32)
+def _compiled_style(key):
+    rc = style_rc(dict(key))
+    rc["font.family"] = resolve_font(rc["font.family"])[0]
+    return MappingProxyType(rc)
+
+
+def compiled_style(options):
+    """
+    rcParams for `options` with the font resolved (a font that is not
+    installed is replaced by a generic family). Cached on the style options,
+    so switching between presets does not rebuild anything.
+    """
+    return _compiled_style(_style_key(options))
+
+
+def style_context(options):
+    """
+    Context manager applying the style of `options` (PlotOptions or a
+    command dict / CompiledCommands) while a figure is built or saved;
+    the global rcParams are restored afterwards.
+    """
+    if not isinstance(options, PlotOptions):
+        options = compile_mapping(options).options
+    return mpl.rc_context(dict(compiled_style(options)))
+
+
+_applied_style = None     # last style applied to the global rcParams
+
+
+def apply_plot_style(options, force=False):
+    """
+    Update the global rcParams for `options` (interactive figure), only if
+    the style changed since the last call (or `force`).
+    Returns True if rcParams were updated.
+    """
+    global _applied_style
+    key = _style_key(options)
+    if not force and key == _applied_style:
+        return False
+    mpl.rcParams.update(compiled_style(options))
+    _applied_style = key
+    return True
+
+
+def apply_physical_size_from_cm(fig, commands, rows=None, cols=None):
+    """
+    Apply physical sizing using centimeters.
+    Priority:
+      1) axes_size_cm (width,height) + margins_cm (L,R,T,B)  -> exact plotting area in cm
+      2) figsize_cm (W,H) total figure size in cm
+      3) figsize in inches (legacy)
+    With a panel grid (rows x cols, default from 'panels'), axes_size_cm is
+    the size of EACH panel and panel_gap_cm (w,h) the space between panels.
+    Returns True if a fixed size was applied (auto-fit must be OFF), else False.
+    """
+    if rows is None or cols is None:
+        rows, cols = panel_grid(commands) or (1, 1)
+    axes_cm = parse_pair_cm(commands, "axes_size_cm")
+    if axes_cm:
+        L_cm, R_cm, T_cm, B_cm = parse_margins_cm(commands)
+        ax_w_cm, ax_h_cm = axes_cm
+        gap_w_cm, gap_h_cm = parse_pair_cm(commands, "panel_gap_cm") or (1.5, 1.5)
+        fig_w_cm = cols * ax_w_cm + (cols - 1) * gap_w_cm + L_cm + R_cm
+        fig_h_cm = rows * ax_h_cm + (rows - 1) * gap_h_cm + T_cm + B_cm
+        fig.set_size_inches(cm_to_in(fig_w_cm), cm_to_in(fig_h_cm), forward=True)
+        # Convert margins in cm to figure fractions for subplots_adjust:
+        left   = L_cm / fig_w_cm
+        right  = 1.0 - (R_cm / fig_w_cm)
+        bottom = B_cm / fig_h_cm
+        top    = 1.0 - (T_cm / fig_h_cm)
+        # wspace/hspace are fractions of the average panel width/height
+        fig.subplots_adjust(left=left, right=right, top=top, bottom=bottom,
+                            wspace=gap_w_cm / ax_w_cm, hspace=gap_h_cm / ax_h_cm)
+        return True
+
+    fig_cm = parse_pair_cm(commands, "figsize_cm")
+    if fig_cm:
+        fig.set_size_inches(cm_to_in(fig_cm[0]), cm_to_in(fig_cm[1]), forward=True)
+        return True
+
+    raw_fs = commands.get("figsize", "").strip().lower()
+    if raw_fs and raw_fs != "auto":
+        try:
+            txt = raw_fs.replace(";", ",").replace(" ", ",")
+            w_in, h_in = map(float, txt.split(",")[:2])
+            fig.set_size_inches(w_in, h_in, forward=True)
+            return True
+        except:
+            pass
+
+    return False
+
+
+def _apply_major(axis, val):
+    if val == "off":
+        axis.set_major_locator(mticker.NullLocator())
+    elif val == "auto":
+        axis.set_major_locator(mticker.AutoLocator())
+    else:  # numeric
+        axis.set_major_locator(mticker.MultipleLocator(val))
+
+
+def _apply_minor(axis, val):
+    if val == "off":
+        axis.set_minor_locator(mticker.NullLocator())
+        axis.set_minor_formatter(mticker.NullFormatter())
+    elif val == "auto":
+        axis.set_minor_locator(mticker.AutoMinorLocator())
+        axis.set_minor_formatter(mticker.NullFormatter())
+    else:
+        axis.set_minor_locator(mticker.MultipleLocator(val))
+        axis.set_minor_formatter(mticker.NullFormatter())
+
+
+def draw_plot(ax, files, references, commands, custom_names=None, custom_ref_names=None,
+              line_styles=None, offset_between=2.0, default_color='black', on_error=None,
+              cache=None, curves=None):
+    """
+    Clear `ax` and draw all data and reference files according to `commands`
+    (a command dict or a CompiledCommands).
+
+    on_error(kind, path, exc) is called for each file that fails to load
+    ('DATA' or 'REF'); when None the exception is raised.
+    `line_styles` ({'line1': 'dashed'}) overrides the compiled lineN styles.
+    Files are read through `cache` (default: the shared DatasetCache) and
+    run through their processing stages (crop, background, ...; pipeline.py).
+    If `curves` is a list, it is filled with one (path, Line2D or None)
+    per data file, for later in-place updates (update_data_curves).
+    Global rcParams are NOT touched here (see style_context / apply_plot_style).
+    """
+    cc = compile_mapping(commands, offset_between)
+    cache = cache if cache is not None else default_cache
+    if curves is not None:
+        curves.clear()
+    options = cc.options
+    custom_names = custom_names or {}
+    custom_ref_names = custom_ref_names or {}
+
+    def _fail(kind, path, exc):
+        if on_error is None:
+            raise exc
+        on_error(kind, path, exc)
+
+    ax.clear()
+
+    # --- Apply axes border ("square") color to spines ---
+    # Use direct spine styling because rcParams won't retroactively recolor existing axes.
+    for sp in ax.spines.values():
+        sp.set_edgecolor(options.square_color)   # set border color
+
+    # Enforce square plotting area only when axes_size_cm is square.
+    if axes_size_is_square(commands):
+        ax.set_box_aspect(1)           # force exact square plotting area
+    else:
+        try:
+            ax.set_box_aspect(None)    # release any previous square lock
+        except Exception:
+            pass
+
+    # Axes background
+    if options.data_bg.lower() in ("transparent", "none"):
+        ax.set_facecolor("none")
+    else:
+        ax.set_facecolor(options.data_bg)
+
+    n = len(files)
+
+    pattern_handles, pattern_labels = [], []
+    ref_handles, ref_labels = [], []
+
+    if not options.yticks:
+        ax.set_yticks([])
+    if not options.xticks:
+        ax.set_xticks([])
+
+    # Colors for data curves
+    if options.colormap:
+        try:
+            cmap = mpl.colormaps[options.colormap]
+            col_colors = [cmap(i / max(1, len(files) - 1)) for i in range(len(files))]
+        except Exception:
+            col_colors = [default_color] * len(files)
+    else:
+        col_colors = [default_color] * len(files)
+
+    # === Plot DATA files ===
+    processed = _process_files(files, cc, cache, options.background_overlay)
+    for i, file_path in enumerate(files):
+        try:
+            if isinstance(processed[i], Exception):
+                raise processed[i]
+            r, intensity, bg = processed[i]
+            shifted = stack_y(intensity, i, n, options)
+
+            base_name = os.path.splitext(os.path.basename(file_path))[0]
+            custom_label = cc.name(i, custom_names.get(file_path, base_name))
+
+            color = cc.color(i, col_colors[i])
+            linewidth = options.linewidth
+            legend_lw = options.legendlinewidth
+            if line_styles is not None:
+                linestyle = line_styles.get(f"line{i+1}", "solid")
+            else:
+                linestyle = cc.line_style(i)
+
+            line, = ax.plot(r, shifted, label=custom_label, color=color,
+                            linewidth=linewidth, linestyle=linestyle)
+            if bg is not None:
+                _BACKGROUND_LINES[line], = ax.plot(
+                    r, stack_y(bg, i, n, options, like=intensity), color=color,
+                    linewidth=max(0.5, linewidth * 0.8), linestyle="--", label="_background")
+            if curves is not None:
+                curves.append((file_path, line))
+
+            # invisible legend line (pattern) for consistent legend thickness
+            legend_line, = ax.plot([], [], color=color, label=custom_label,
+                                   linewidth=legend_lw, linestyle=linestyle)
+            pattern_handles.append(legend_line)
+            pattern_labels.append(custom_label)
+
+        except Exception as e:
+            if curves is not None and len(curves) == i:
+                curves.append((file_path, None))
+            _fail("DATA", file_path, e)
+            continue
+
+    # === Plot REFERENCE files ===
+    ref_color_list = get_distinct_colors(len(references))
+    for idx, ref_path in enumerate(references):
+        try:
+            color = cc.ref_color(idx, ref_color_list[idx])
+            x, y, is_peak_list = cache.load_reference(ref_path)
+            ref_stages = cc.ref_pipeline(idx)
+            if ref_stages:      # sticks in the display unit (xunit), memoized
+                x, y = process_curve(x, y, ref_stages)
+
+            y_norm   = y if options.normalizeref == "off" else normalize(y)
+            base_ref = options.refbase
+            step_ref = options.refoffset
+            if options.stackrefs in ("off", "no", "false"):   # legacy switch
+                step_ref = 0.0
+            base_y = base_ref - idx * step_ref
+            span_factor = options.refspan
+            direction = 1.0 if step_ref >= 0 else -1.0
+            span = (abs(step_ref) * span_factor) if step_ref != 0 else 1.0
+            jitter_cmd = options.refxjitter or "auto"
+            if jitter_cmd == "auto":
+                try:
+                    xmin, xmax = ax.get_xlim()
+                    xjitter = 0.003 * (xmax - xmin)
+                except Exception:
+                    xjitter = 0.5
+            else:
+                try:
+                    xjitter = float(jitter_cmd.replace(",", "."))
+                except Exception:
+                    xjitter = 0.0
+            x_shift = (idx - (len(references) - 1) / 2.0) * xjitter
+
+            if is_peak_list:
+                seen = set()
+                y_max = float(y.max()) if len(y) else 1.0
+                for px, py in zip(x, y):
+                    py_norm = (py / y_max)
+                    if py_norm > 0:
+                        k = round(float(px), 3)
+                        if k not in seen:
+                            height = py_norm * span
+                            ax.vlines(px + x_shift, base_y, base_y + direction * height,
+                                      color=color, linewidth=options.reflinewidth)
+                            seen.add(k)
+            else:
+                # Continuous reference pattern: one stick per local maximum
+                try:
+                    from scipy.signal import find_peaks
+                    peaks, _ = find_peaks(y_norm)
+                except Exception:
+                    peaks = [i for i in range(1, len(y_norm)-1) if y_norm[i] > y_norm[i-1] and y_norm[i] > y_norm[i+1]]
+                for p in peaks:
+                    height = y_norm[p] * span
+                    ax.vlines(x[p] + x_shift, base_y, base_y + direction * height,
+                              color=color, linewidth=options.reflinewidth)
+
+            # -- Reference legend --
+            base_ref_name = reference_label(ref_path)
+            label = cc.ref_name(idx, custom_ref_names.get(ref_path, base_ref_name))
+            ref_line, = ax.plot([], [], color=color, label=label, linewidth=options.legendlinewidthref)
+            ref_handles.append(ref_line)
+            ref_labels.append(label)
+
+        except Exception as e:
+            _fail("REF", ref_path, e)
+            continue
+
+    # Labels / title
+    xunit = parse_xunit(options.xunit)
+    if xunit in ("q", "d") and (not options.xlabel or "°" in options.xlabel):
+        ax.set_xlabel(axis_label(xunit))    # the 2θ label would be wrong
+    else:
+        ax.set_xlabel(options.xlabel)
+    ax.set_ylabel(options.ylabel)
+    ax.set_title(options.title)
+
+    # Legend
+    handles = pattern_handles + ref_handles
+    labels = pattern_labels + ref_labels
+    if options.legend and handles:   # an empty panel has nothing to list
+        if options.legendpos == "outside":
+            legend = ax.legend(
+                handles=handles, labels=labels,
+                loc='upper left', bbox_to_anchor=(1.05, 1),
+                borderaxespad=0., frameon=False,
+                labelspacing=options.legend_labelspacing
+            )
+        else:
+            legend = ax.legend(
+                handles=handles, labels=labels,
+                loc=options.legendpos, frameon=False,
+                labelspacing=options.legend_labelspacing
+            )
+        for text in legend.get_texts():
+            text.set_color(options.textcolor)
+
+    # Limits
+    if options.xlim:
+        ax.set_xlim(*options.xlim)
+    if options.ylim:
+        ax.set_ylim(*options.ylim)
+
+    # --- Tick system (major/minor unified) ---
+    _apply_major(ax.xaxis, options.xtick_major)
+    _apply_major(ax.yaxis, options.ytick_major)
+    _apply_minor(ax.xaxis, options.xtick_minor)
+    _apply_minor(ax.yaxis, options.ytick_minor)
+
+    # --- Tick mark style (major/minor) ---
+    # Use the same color as square_color; minor are shorter and slightly thinner.
+    ax.tick_params(axis='both', which='major',
+                   color=options.square_color,
+                   width=options.square_width,
+                   length=6)
+
+    ax.tick_params(axis='both', which='minor',
+                   color=options.square_color,
+                   width=max(0.8, options.square_width * 0.8),
+                   length=3)
+    return options
+
+
+def update_data_curves(ax, curves, changed, commands, offset_between=2.0,
+                       on_error=None, cache=None):
+    """
+    Reload the data files in `changed` and update their existing lines in
+    place (no clear/redraw of the axes). `curves` comes from draw_plot.
+    Returns the number of curves updated; the caller redraws the canvas.
+    """
+    cc = compile_mapping(commands, offset_between)
+    options = cc.options
+    cache = cache if cache is not None else default_cache
+    changed = set(changed)
+    n = len(curves)
+    todo = [(i, path, line) for i, (path, line) in enumerate(curves)
+            if line is not None and path in changed]
+    processed = _process_files([path for _, path, _ in todo], cc, cache,
+                               options.background_overlay, indices=[i for i, _, _ in todo])
+    updated = 0
+    for (i, path, line), res in zip(todo, processed):
+        if isinstance(res, Exception):
+            if on_error is None:
+                raise res
+            on_error("DATA", path, res)
+            continue
+        x, y, bg = res
+        line.set_data(x, stack_y(y, i, n, options))
+        bg_line = _BACKGROUND_LINES.get(line)
+        if bg_line is not None:
+            if bg is not None:
+                bg_line.set_data(x, stack_y(bg, i, n, options, like=y))
+            else:
+                bg_line.set_data([], [])
+        updated += 1
+
+    if updated:
+        # relim() ignores collections: add the reference sticks back by hand
+        ax.relim()
+        for coll in ax.collections:
+            try:
+                ax.update_datalim(coll.get_datalim(ax.transData).get_points())
+            except Exception:
+                pass
+        ax.autoscale_view()
+    return updated
+
+
+def build_figure(files, references=(), commands=None, custom_names=None, custom_ref_names=None,
+                 command_text=None, on_error=None, cache=None):
+    """
+    Build a headless Figure (no pyplot, no Tk) from a command dict or text.
+
+    Either pass `commands` (already parsed dict) or `command_text` (the raw
+    command box content, which also carries the 'lineN' styles).
+    The style is applied only while building (style_context); the global
+    rcParams are left as they were. export_figure applies it again.
+    Files are read through `cache` (default: the shared DatasetCache).
+    """
+    if commands is None:
+        commands = compile_commands(command_text) if command_text is not None else {}
+    cc = compile_mapping(commands)
+    with style_context(cc.options):
+        return _build_figure(files, references, cc, custom_names, custom_ref_names, on_error, cache)
+
+
+def _build_figure(files, references, cc, custom_names, custom_ref_names, on_error, cache):
+    fig = Figure(figsize=(6, 4), dpi=100)
+    fig.patch.set_alpha(0)
+    from .panels import PanelFigure   # panels builds on this module
+    if panel_grid(cc):
+        panels = PanelFigure(fig)
+        panels.draw(list(files), list(references), cc,
+                    custom_names=custom_names, custom_ref_names=custom_ref_names,
+                    on_error=on_error, cache=cache)
+        panels.apply_size(cc)
+        return fig
+
+    ax = fig.add_subplot(111)
+    apply_physical_size_from_cm(fig, cc)
+    draw_plot(ax, list(files), list(references), cc,
+              custom_names=custom_names, custom_ref_names=custom_ref_names,
+              on_error=on_error, cache=cache)
+    return fig
+
+
+def export_dpi(commands, max_dpi=1200):
+    """DPI for raster exports from 'export_dpi', clamped to [72, max_dpi]."""
+    dpi = int(compile_mapping(commands).options.export_dpi)
+    return max(72, min(max_dpi, dpi))
+
+
+def export_figure(fig, file_path, commands=None, dpi=None, fmt=None):
+    """
+    Save `fig` preserving exact physical sizes (in cm).
+    The format follows the file extension (or `fmt`, e.g. for a BytesIO);
+    dpi is ignored by vector formats. Large PNG/TIFF images (or any with
+    'export_tiled = on') go through export.export_tiled.
+    """
+    commands = commands or {}
+    # Apply cm-based sizing for its side-effects; we don't need the return value here.
+    apply_physical_size_from_cm(fig, commands)
+    from .export import TILED_FORMATS, TILED_MAX_DPI, MAX_DPI, use_tiles, export_tiled
+    ext = (fmt or os.path.splitext(str(file_path))[1]).lower().lstrip(".")
+    if ext in TILED_FORMATS:
+        tile_dpi = dpi if dpi is not None else export_dpi(commands, TILED_MAX_DPI)
+        if use_tiles(fig, tile_dpi, commands):
+            # Very large bitmap: drawn and written strip by strip
+            return export_tiled(fig, file_path, commands, dpi=tile_dpi, fmt=ext)
+    if dpi is None:
+        dpi = export_dpi(commands, MAX_DPI)
+    # IMPORTANT: keep bbox_inches=None to preserve margins set in centimeters.
+    # Using 'tight' would alter margins and break the cm layout.
+    # Tick labels are created at draw time: draw them with the figure's style.
+    with style_context(commands) if commands else nullcontext():
+        fig.savefig(file_path, dpi=dpi, facecolor='white', bbox_inches=None, format=fmt)
+    return file_path
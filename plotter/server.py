@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+Local HTTP render service.
+
+Start it once and keep it running; every request then reuses the already
+imported matplotlib, the loaded fonts and the parsed files (DatasetCache),
+so a figure comes back in tens of milliseconds:
+
+    python -m plotter.server --port 8765 --workers 2
+
+POST /render with a JSON body, either a saved project
+
+    {"project": "C:/data/run12.json", "format": "pdf"}     (.json or .plotz)
+    {"project": {...content of a project file...}, "format": "svg"}
+
+or the command box text and the files
+
+    {"commands": "offset = 1\\nxlabel = 2θ", "data_files": ["a.xy", "b.xy"],
+     "ref_files": ["ref.csv"], "custom_names": {"a.xy": "sample A"},
+     "format": "png", "dpi": 200}
+
+The answer is the image (image/png, application/pdf, image/svg+xml).
+Files that could not be read are listed in the X-Plotter-Errors header.
+GET /health returns a small JSON status.
+
+The server reads the files named in the requests with the rights of the
+user running it: it listens on 127.0.0.1 only unless told otherwise.
+"""
+
+import io
+import os
+import json
+import time
+import threading
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .options import compile_commands
+from .render import build_figure, export_figure
+from .cache import DatasetCache, default_cache
+from .project import is_bundle, load_bundle
+
+
+CONTENT_TYPES = {
+    "png": "image/png",
+    "pdf": "application/pdf",
+    "svg": "image/svg+xml",
+}
+MAX_BODY = 10 * 1024 * 1024     # bytes of JSON accepted per request
+
+
+class RenderError(ValueError):
+    """Bad request (unknown format, unreadable project, ...)."""
+
+
+# -------------------- rendering (runs in the server or in a worker) --------------------
+def _load_project(project):
+    """(project dict, cache to read its files through)."""
+    if isinstance(project, str):
+        try:
+            if is_bundle(project):
+                # arrays pinned in a cache of this request only, gone with it
+                cache = DatasetCache()
+                return load_bundle(project, cache=cache), cache
+            with open(project) as f:
+                return json.load(f), default_cache
+        except Exception as e:
+            raise RenderError(f"Could not read project {project!r}: {e}")
+    if isinstance(project, dict):
+        return project, default_cache
+    raise RenderError("'project' must be a path or a project object")
+
+
+def render_request(payload):
+    """
+    Render one request payload (see module docstring).
+    Returns (image bytes, content type, [error strings]).
+    """
+    if "project" in payload:
+        spec, cache = _load_project(payload["project"])
+    else:
+        spec, cache = payload, default_cache
+    fmt = str(payload.get("format") or "png").lower().lstrip(".")
+    if fmt not in CONTENT_TYPES:
+        raise RenderError(f"Unknown format {fmt!r} (use one of {', '.join(CONTENT_TYPES)})")
+
+    text = spec.get("commands", "") or ""
+    cc = compile_commands(text)         # memoized: an unchanged command text is not re-parsed
+    errors = []
+
+    def _err(kind, path, exc):
+        errors.append(f"[{kind}] {os.path.basename(path)}: {exc}")
+
+    fig = build_figure(list(spec.get("data_files", [])), list(spec.get("ref_files", [])), cc,
+                       custom_names=spec.get("custom_names") or {},
+                       custom_ref_names=spec.get("custom_ref_names") or {},
+                       on_error=_err, cache=cache)
+    buf = io.BytesIO()
+    dpi = payload.get("dpi")
+    export_figure(fig, buf, cc, dpi=int(dpi) if dpi else None, fmt=fmt)
+    return buf.getvalue(), CONTENT_TYPES[fmt], errors
+
+
+def warm_up():
+    """Import/draw once so fonts and the text layout caches are loaded."""
+    try:
+        from matplotlib.figure import Figure
+        fig = Figure(figsize=(2, 2), dpi=50)
+        ax = fig.add_subplot(111)
+        ax.plot([0, 1], [0, 1], label="warm-up")
+        ax.set_xlabel("2θ (°)")
+        ax.legend()
+        fig.savefig(io.BytesIO(), format="png")
+    except Exception:
+        pass
+
+
+# -------------------- HTTP server --------------------
+class RenderService:
+    """
+    workers:     0 renders in the server process (one at a time, matplotlib's
+                 rcParams are global); N >= 1 uses N warm worker processes
+    max_pending: requests waiting beyond this are answered 503 (busy)
+    """
+    def __init__(self, host="127.0.0.1", port=8765, workers=0, max_pending=16):
+        self.workers = max(0, int(workers))
+        self._pool = (ProcessPoolExecutor(max_workers=self.workers, initializer=warm_up)
+                      if self.workers else None)
+        self._lock = threading.Lock()
+        self._counts = threading.Lock()     # served/failed, updated by the handler threads
+        self._slots = threading.BoundedSemaphore(max(1, int(max_pending)))
+        self.served = 0
+        self.failed = 0
+        self.started = time.time()
+        self.httpd = ThreadingHTTPServer((host, int(port)), self._handler_class())
+        self.httpd.daemon_threads = True
+        if self._pool is None:
+            warm_up()
+        else:
+            # Start every worker now (initializer = warm-up), not on the first request
+            for f in [self._pool.submit(time.sleep, 0) for _ in range(self.workers)]:
+                f.result()
+
+    @property
+    def address(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def render(self, payload):
+        if not self._slots.acquire(blocking=False):
+            return None
+        try:
+            if self._pool is not None:
+                return self._pool.submit(render_request, payload).result()
+            with self._lock:
+                return render_request(payload)
+        finally:
+            self._slots.release()
+
+    def count(self, ok):
+        """Count one answered request (called from the handler threads)."""
+        with self._counts:
+            if ok:
+                self.served += 1
+            else:
+                self.failed += 1
+
+    def status(self):
+        with self._counts:
+            served, failed = self.served, self.failed
+        return {
+            "workers": self.workers,
+            "served": served,
+            "failed": failed,
+            "uptime_s": round(time.time() - self.started, 1),
+            # In-process cache only (each worker process has its own)
+            "cached_files": len(default_cache),
+        }
+
+    def serve_forever(self):
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.close()
+
+    def close(self):
+        self.httpd.server_close()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _handler_class(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, fmt, *args):   # keep the console quiet
+                pass
+
+            def _send(self, code, body, ctype, headers=()):
+                self.send_response(code)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                for k, v in headers:
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_json(self, code, obj):
+                self._send(code, json.dumps(obj).encode("utf-8"), "application/json")
+
+            def do_GET(self):
+                if self.path.rstrip("/") == "/health":
+                    self._send_json(200, service.status())
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def do_POST(self):
+                if self.path.rstrip("/") != "/render":
+                    self._send_json(404, {"error": "not found"})
+                    return
+                try:
+                    size = int(self.headers.get("Content-Length", 0))
+                    if size <= 0 or size > MAX_BODY:
+                        raise RenderError("missing or too large request body")
+                    payload = json.loads(self.rfile.read(size).decode("utf-8"))
+                    if not isinstance(payload, dict):
+                        raise RenderError("the request body must be a JSON object")
+                    t0 = time.perf_counter()
+                    result = service.render(payload)
+                    if result is None:
+                        self._send_json(503, {"error": "busy, try again"})
+                        return
+                    body, ctype, errors = result
+                    headers = [("X-Render-Time-ms", f"{(time.perf_counter() - t0) * 1000:.1f}")]
+                    if errors:
+                        headers.append(("X-Plotter-Errors", json.dumps(errors, ensure_ascii=True)))
+                    service.count(True)
+                    self._send(200, body, ctype, headers)
+                except (RenderError, ValueError, KeyError) as e:
+                    service.count(False)
+                    self._send_json(400, {"error": str(e)})
+                except Exception as e:
+                    service.count(False)
+                    self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+
+        return Handler
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Plotter render service")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--workers", type=int, default=0,
+                    help="worker processes (0 = render in the server process)")
+    ap.add_argument("--max-pending", type=int, default=16,
+                    help="requests accepted at once before answering 503")
+    args = ap.parse_args(argv)
+    service = RenderService(args.host, args.port, args.workers, args.max_pending)
+    print(f"Plotter render service on {service.address} (Ctrl+C to stop)")
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Sparkline thumbnails for the Data / References lists.
+
+A thumbnail is a small PNG (64 x 16 px) of the decimated pattern (sticks
+for a peak list). Thumbnails are made in a background thread, only for
+the rows the GUI asks for (the visible ones), and kept on disk in
+THUMB_DIR under the file's content checksum: copies of a file and later
+sessions reuse them without reading the file again.
+
+    thumbs = Thumbnailer().start()
+    thumbs.request(path, "data")        # from the GUI, for visible rows
+    for path, kind, png in thumbs.take():   # polled with after()
+        ...
+"""
+
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+from .cache import file_signature, content_hash
+from .readers import read_data_file, read_reference_file, split_sheet
+from .view import minmax_decimate
+
+
+THUMB_DIR = os.path.join(os.path.expanduser("~"), ".plotter", "thumbs")
+THUMB_SIZE = (64, 16)
+_COLORS = {"data": (40, 40, 40), "ref": (0, 70, 160)}
+
+
+def sparkline(x, y, size=THUMB_SIZE, sticks=False, color=(40, 40, 40)):
+    """RGBA image (h, w, 4) of y(x): a line drawn column by column, or sticks from the bottom."""
+    w, h = size
+    img = np.zeros((h, w, 4), dtype=np.uint8)
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    ok = np.isfinite(x) & np.isfinite(y)
+    x, y = x[ok], y[ok]
+    if len(x) < 2 and not (sticks and len(x)):
+        return img
+    if not sticks:
+        order = np.argsort(x, kind="stable") if np.any(x[1:] < x[:-1]) else slice(None)
+        x, y = minmax_decimate(x[order], y[order], 2 * w)
+    ybase = min(0.0, y.min()) if sticks else y.min()     # sticks stand on zero
+    xspan = (x.max() - x.min()) or 1.0
+    yspan = (y.max() - ybase) or 1.0
+    cols = np.rint((x - x.min()) / xspan * (w - 1)).astype(int)
+    rows = (h - 1) - np.rint((y - ybase) / yspan * (h - 1)).astype(int)
+
+    lo = np.full(w, h, dtype=int)
+    hi = np.full(w, -1, dtype=int)
+    np.minimum.at(lo, cols, rows)
+    np.maximum.at(hi, cols, rows)
+    if sticks:
+        hi = np.where(hi >= 0, h - 1, hi)
+    else:
+        # Fill empty columns, then join each column to its neighbour (no gaps in the line)
+        filled = np.nonzero(hi >= 0)[0]
+        idx = np.arange(w)
+        lo = np.rint(np.interp(idx, filled, lo[filled])).astype(int)
+        hi = np.rint(np.interp(idx, filled, hi[filled])).astype(int)
+        mid = (lo + hi) // 2
+        lo[1:] = np.minimum(lo[1:], mid[:-1])
+        hi[1:] = np.maximum(hi[1:], mid[:-1])
+    r = np.arange(h)[:, None]
+    mask = (r >= lo[None, :]) & (r <= hi[None, :])
+    img[mask] = color + (255,)
+    return img
+
+
+def thumbnail_png(path, kind="data", size=THUMB_SIZE):
+    """PNG bytes of the thumbnail of a data or reference file."""
+    if kind == "ref":
+        x, y, sticks = read_reference_file(path)
+    else:
+        (x, y), sticks = read_data_file(path), False
+    buf = io.BytesIO()
+    Image.fromarray(sparkline(x, y, size, sticks, _COLORS.get(kind, _COLORS["data"])),
+                    "RGBA").save(buf, "PNG")
+    return buf.getvalue()
+
+
+class Thumbnailer:
+    """
+    Background thumbnail maker with a disk cache.
+    request() queues a file (the newest requests first), retain() drops
+    queued files that are no longer wanted (scrolled away), take() returns
+    the finished ones: (path, kind, png bytes or None if it failed).
+    """
+    def __init__(self, directory=THUMB_DIR, size=THUMB_SIZE):
+        self.directory = directory
+        self.size = tuple(size)
+        self._queue = OrderedDict()         # (path, kind) -> None, newest last
+        self._ready = []
+        self._busy = False
+        self._keys = {}                     # path -> (signature, content hash)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="plotter-thumbs", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    # ---------- GUI side ----------
+    def request(self, path, kind="data"):
+        with self._lock:
+            self._queue.pop((path, kind), None)
+            self._queue[(path, kind)] = None
+        self._wake.set()
+
+    def retain(self, wanted):
+        """Forget queued requests whose (path, kind) is not in `wanted`."""
+        wanted = set(wanted)
+        with self._lock:
+            for key in [k for k in self._queue if k not in wanted]:
+                del self._queue[key]
+
+    @property
+    def pending(self):
+        """True while thumbnails are queued, being made or not taken yet."""
+        return bool(self._queue) or self._busy or bool(self._ready)
+
+    def take(self):
+        with self._lock:
+            ready, self._ready = self._ready, []
+        return ready
+
+    # ---------- worker ----------
+    def _file_name(self, path, kind):
+        sig = file_signature(path)
+        entry = self._keys.get(path)
+        if entry is None or entry[0] != sig:
+            entry = (sig, content_hash(path))
+            self._keys[path] = entry
+        length, crc = entry[1]
+        # the extension picks the reader: same bytes, other reader, other thumbnail
+        ext = os.path.splitext(split_sheet(path)[0])[1].lower().lstrip(".")
+        w, h = self.size
+        return os.path.join(self.directory, f"{kind}-{ext}-{length:x}-{crc:08x}-{w}x{h}.png")
+
+    def _make(self, path, kind):
+        name = self._file_name(path, kind)
+        try:
+            with open(name, "rb") as f:
+                return f.read()
+        except OSError:
+            pass
+        png = thumbnail_png(path, kind, self.size)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = f"{name}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(png)
+            os.replace(tmp, name)       # never a half-written thumbnail for another session
+        except OSError:
+            pass                        # read-only home: thumbnails are just not kept
+        return png
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait()
+            while not self._stop.is_set():
+                with self._lock:
+                    if not self._queue:
+                        self._wake.clear()
+                        break
+                    (path, kind), _ = self._queue.popitem(last=True)
+                    self._busy = True
+                try:
+                    png = self._make(path, kind)
+                except Exception:
+                    png = None
+                with self._lock:
+                    self._ready.append((path, kind, png))
+                    self._busy = False
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+x-axis units: 2θ (degrees), Q (Å⁻¹) and d-spacing (Å).
+
+    Q = 4π sin(θ) / λ        d = λ / (2 sin θ) = 2π / Q
+
+Files are read in 2θ; every data file and reference has a wavelength
+(wavelength / wavelengthN, refwavelength / refwavelengthN, Å or an anode
+name), and 'xunit = q' or 'xunit = d' shows everything in that unit.
+The conversion is the last processing stage (see pipeline.py), so the
+converted arrays are memoized and switching units back and forth only
+looks them up.
+"""
+
+import re
+
+import numpy as np
+
+
+XUNITS = ("2theta", "q", "d")
+_UNIT_ALIASES = {"2th": "2theta", "tth": "2theta", "2θ": "2theta", "deg": "2theta",
+                 "angle": "2theta", "q": "q", "d": "d", "dspacing": "d", "d-spacing": "d"}
+
+# Kα wavelengths in Å (Kα1 for 'cu', 'mo', ...; weighted Kα1/Kα2 mean for '...ka')
+WAVELENGTHS = {
+    "cu": 1.5406, "cuka1": 1.5406, "cuka": 1.5418,
+    "mo": 0.70930, "moka1": 0.70930, "moka": 0.71073,
+    "co": 1.78897, "coka1": 1.78897, "coka": 1.79026,
+    "fe": 1.93604, "feka1": 1.93604, "feka": 1.93735,
+    "cr": 2.28970, "crka1": 2.28970, "crka": 2.29100,
+    "ag": 0.55941, "agka1": 0.55941, "agka": 0.56087,
+}
+DEFAULT_WAVELENGTH = WAVELENGTHS["cu"]
+
+AXIS_LABELS = {"2theta": "2θ (°)", "q": "Q (Å⁻¹)", "d": "d (Å)"}
+
+
+def parse_xunit(value):
+    """'Q' / '2theta' / 'd-spacing' -> 'q' / '2theta' / 'd' (None if unknown)."""
+    v = str(value or "").strip().lower().replace(" ", "")
+    v = _UNIT_ALIASES.get(v, v)
+    return v if v in XUNITS else None
+
+
+def parse_wavelength(value, default=None):
+    """Wavelength in Å from a number ('0.7093', '0,7093') or an anode ('Mo', 'Cu Kα')."""
+    if value is None:
+        return default
+    v = re.sub(r"[\s_\-]", "", str(value).strip().lower()).replace("α", "a")
+    if v in WAVELENGTHS:
+        return WAVELENGTHS[v]
+    try:
+        wl = float(v.replace(",", "."))
+    except ValueError:
+        return default
+    return wl if wl > 0 else default
+
+
+def convert_x(x, unit, wavelength=DEFAULT_WAVELENGTH):
+    """2θ values (degrees) -> `unit` (vectorized; impossible values become nan)."""
+    x = np.asarray(x, dtype=float)
+    if unit == "2theta":
+        return x
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = np.sin(np.radians(x) / 2.0)
+        s = np.where((x > 0) & (x < 180), s, np.nan)
+        if unit == "q":
+            return 4.0 * np.pi * s / wavelength
+        if unit == "d":
+            return wavelength / (2.0 * s)
+    raise ValueError(f"Unknown x unit {unit!r} (use 2theta, q or d)")
+
+
+def to_two_theta(values, unit, wavelength=DEFAULT_WAVELENGTH):
+    """Inverse of convert_x: Q or d -> 2θ in degrees."""
+    v = np.asarray(values, dtype=float)
+    if unit == "2theta":
+        return v
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = v * wavelength / (4.0 * np.pi) if unit == "q" else wavelength / (2.0 * v)
+        return np.degrees(2.0 * np.arcsin(np.where((s >= 0) & (s <= 1), s, np.nan)))
+
+
+def transform(x, y, params):
+    """
+    Pipeline stage ('xunit', (unit, wavelength)): convert x, drop points
+    without a value in the new unit, keep x increasing (d reverses the order).
+    """
+    unit, wavelength = params
+    nx = convert_x(x, unit, wavelength)
+    ok = np.isfinite(nx)
+    if not ok.all():
+        nx, y = nx[ok], np.asarray(y)[ok]
+    if unit == "d":
+        nx, y = nx[::-1], np.asarray(y)[::-1]
+    return nx, y
+
+
+def axis_label(unit):
+    return AXIS_LABELS.get(unit, "")
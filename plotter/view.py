@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+View-aware rendering for interactive zoom/pan.
+
+ViewSlicer keeps the full (sorted) arrays of every data curve and, each
+time the x limits change, hands Matplotlib only the points inside the
+visible window (found by binary search), min/max-decimated to the axes
+width in pixels. Recently visited windows are cached, so toolbar
+back/forward/home redraw without slicing again.
+"""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+
+def minmax_decimate(x, y, buckets):
+    """
+    Keep the min and max of y in each of `buckets` index chunks (plus the
+    end points), so peaks survive at screen resolution. x must be sorted.
+    """
+    n = len(x)
+    if buckets < 1 or n <= 2 * buckets:
+        return x, y
+    k = -(-n // buckets)
+    m = n // k * k
+    rows = y[:m].reshape(-1, k)
+    base = np.arange(0, m, k)
+    with np.errstate(invalid="ignore"):
+        keep = np.concatenate((base + np.argmin(rows, axis=1), base + np.argmax(rows, axis=1),
+                               np.arange(m, n), [0, n - 1]))
+    idx = np.unique(keep)
+    return x[idx], y[idx]
+
+
+def window(x, lo, hi):
+    """Index range [i0, i1) of sorted x covering [lo, hi] plus one point each side."""
+    i0 = max(0, int(np.searchsorted(x, lo, side="left")) - 1)
+    i1 = min(len(x), int(np.searchsorted(x, hi, side="right")) + 1)
+    return i0, i1
+
+
+class ViewSlicer:
+    """
+    Attach to an Axes after draw_plot:
+
+        slicer.attach(ax, curves)     # curves from draw_plot(..., curves=[])
+
+    oversample: points kept per pixel column (x2 for min and max)
+    max_views:  number of recent x windows kept ready
+    """
+    def __init__(self, oversample=1, max_views=16):
+        self.oversample = max(1, int(oversample))
+        self.max_views = int(max_views)
+        self.ax = None
+        self._cid = None
+        self._full = []          # [(line, x, y)] with x ascending
+        self._views = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # ---------- wiring ----------
+    def attach(self, ax, curves=None):
+        """Take the current data of the curves' lines as the full-resolution data."""
+        self.detach()
+        self.ax = ax
+        lines = [ln for _, ln in curves if ln is not None] if curves is not None else ax.get_lines()
+        for line in lines:
+            x = np.asarray(line.get_xdata(orig=True), dtype=float)
+            y = np.asarray(line.get_ydata(orig=True), dtype=float)
+            if len(x) < 2 or len(x) != len(y):
+                continue
+            d = np.diff(x)
+            if np.all(d >= 0):
+                self._full.append((line, x, y))
+            elif np.all(d <= 0):
+                # Same polyline drawn backwards; searchsorted needs ascending x
+                self._full.append((line, x[::-1], y[::-1]))
+            # Unsorted x (loops, scatter-like data) is left untouched
+        self._cid = ax.callbacks.connect("xlim_changed", self._on_xlim)
+        self.refresh()
+        return self
+
+    def detach(self):
+        """Put full data back and stop following the axes."""
+        self.restore()
+        if self.ax is not None and self._cid is not None:
+            try:
+                self.ax.callbacks.disconnect(self._cid)
+            except Exception:
+                pass
+        self.ax, self._cid = None, None
+        self._full = []
+        self._views.clear()
+
+    def restore(self):
+        """Give every line its full data (before relim/autoscale or export)."""
+        for line, x, y in self._full:
+            line.set_data(x, y)
+
+    @contextmanager
+    def full_data(self):
+        """Temporarily draw at full resolution (e.g. while saving a file)."""
+        self.restore()
+        try:
+            yield
+        finally:
+            self.refresh()
+
+    # ---------- slicing ----------
+    def _on_xlim(self, ax):
+        self.refresh()
+
+    def _key(self):
+        lo, hi = sorted(self.ax.get_xlim())
+        px = int(self.ax.bbox.width) or 1
+        return (round(lo, 12), round(hi, 12), px)
+
+    def refresh(self):
+        """Slice every curve to the current x window (cached per window)."""
+        if self.ax is None or not self._full:
+            return
+        key = self._key()
+        data = self._views.get(key)
+        if data is not None:
+            self._views.move_to_end(key)
+            self.hits += 1
+        else:
+            self.misses += 1
+            lo, hi, px = key
+            buckets = px * self.oversample
+            data = []
+            for _, x, y in self._full:
+                i0, i1 = window(x, lo, hi)
+                data.append(minmax_decimate(x[i0:i1], y[i0:i1], buckets))
+            self._views[key] = data
+            while len(self._views) > self.max_views:
+                self._views.popitem(last=False)
+        for (line, _, _), (xs, ys) in zip(self._full, data):
+            line.set_data(xs, ys)
+
+    def __len__(self):
+        return len(self._full)
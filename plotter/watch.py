@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Stat-polling file watcher for live reload.
+
+poll() is cheap: one os.stat per watched file (a few ms for 1000 files)
+and one os.scandir per watched directory, only when the directory itself
+changed. Changes are batched until nothing moved for `settle` seconds,
+so files still being written by the instrument are reported once.
+"""
+
+import os
+import time
+import fnmatch
+from collections import namedtuple
+
+
+# Default patterns for directory watching (same types as the Load dialog)
+DATA_PATTERNS = ("*.xy", "*.csv", "*.dat", "*.txt", "*.gr")
+
+WatchBatch = namedtuple("WatchBatch", "changed added removed")
+
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def matches(name, patterns):
+    """Case-insensitive glob match of a file name against several patterns."""
+    low = name.lower()
+    return any(fnmatch.fnmatchcase(low, p.lower()) for p in patterns)
+
+
+class FileWatcher:
+    """
+    Watch a set of files and, optionally, directories for new files.
+
+    settle:  seconds without new changes before a batch is released
+    rescan:  force a directory listing at least this often (coarse mtime on
+             network shares / FAT may hide fast successive creations)
+    """
+    def __init__(self, paths=(), settle=0.5, rescan=5.0):
+        self.settle = float(settle)
+        self.rescan = float(rescan)
+        self._known = {}         # path -> signature (None = missing), stat'ed every poll
+        self._seen = set()       # every file already found in a watched directory
+        self._dirs = {}          # dir -> [patterns, dir signature, last scan time, track]
+        self._pending = {"changed": set(), "added": set(), "removed": set()}
+        self._last_change = None
+        self.set_files(paths)
+
+    # ---------- configuration ----------
+    def set_files(self, paths):
+        """
+        Replace the explicit watch list. New paths are stat'ed silently
+        (no event); files found through watched directories are kept.
+        """
+        wanted = set(paths)
+        for p in wanted:
+            if p not in self._known:
+                self._known[p] = _signature(p)
+        for p in list(self._known):
+            if p not in wanted and not self._in_watched_dir(p):
+                del self._known[p]
+
+    def add_directory(self, directory, patterns=DATA_PATTERNS, track=True):
+        """
+        Also report new files matching `patterns` that appear in `directory`.
+        track=False only reports new names: found files are not stat'ed on
+        later polls, so the cost stays flat for folders with thousands of files.
+        """
+        directory = os.path.normpath(directory)
+        self._dirs[directory] = [tuple(patterns), None, 0.0, bool(track)]
+        # Existing files are the baseline, not 'added'
+        for path, sig in self._scan(directory, patterns):
+            self._seen.add(path)
+            if track:
+                self._known.setdefault(path, sig)
+        self._dirs[directory][1] = _signature(directory)
+        self._dirs[directory][2] = time.monotonic()
+
+    def remove_directory(self, directory):
+        self._dirs.pop(os.path.normpath(directory), None)
+
+    @property
+    def directories(self):
+        return list(self._dirs)
+
+    def __len__(self):
+        return len(self._known)
+
+    # ---------- polling ----------
+    def poll(self, now=None):
+        """Check files/directories; return a WatchBatch once changes settled, else None."""
+        now = time.monotonic() if now is None else now
+        changed = False
+
+        for path, old in list(self._known.items()):
+            sig = _signature(path)
+            if sig == old:
+                continue
+            self._known[path] = sig
+            changed = True
+            if sig is None:
+                self._pending["removed"].add(path)
+                self._pending["changed"].discard(path)
+            elif path not in self._pending["added"]:
+                self._pending["changed"].add(path)
+                self._pending["removed"].discard(path)
+
+        for directory, state in self._dirs.items():
+            patterns, dir_sig, last_scan, track = state
+            cur = _signature(directory)
+            if cur == dir_sig and now - last_scan < self.rescan:
+                continue
+            state[1], state[2] = cur, now
+            for path, sig in self._scan(directory, patterns):
+                if path in self._seen or path in self._known:
+                    continue
+                self._seen.add(path)
+                if track:
+                    self._known[path] = sig
+                self._pending["added"].add(path)
+                changed = True
+
+        if changed:
+            self._last_change = now
+        if self._last_change is None or now - self._last_change < self.settle:
+            return None
+
+        batch = WatchBatch(
+            changed=tuple(sorted(self._pending["changed"])),
+            added=tuple(sorted(self._pending["added"])),
+            removed=tuple(sorted(self._pending["removed"])),
+        )
+        for s in self._pending.values():
+            s.clear()
+        self._last_change = None
+        if not (batch.changed or batch.added or batch.removed):
+            return None
+        return batch
+
+    # ---------- helpers ----------
+    def _scan(self, directory, patterns):
+        """Yield (path, signature) for matching regular files in `directory`."""
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if not matches(entry.name, patterns):
+                        continue
+                    try:
+                        if not entry.is_file():
+                            continue
+                        st = entry.stat()   # free on Windows (from the listing)
+                    except OSError:
+                        continue
+                    yield os.path.join(directory, entry.name), (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return
+
+    def _in_watched_dir(self, path):
+        state = self._dirs.get(os.path.dirname(os.path.normpath(path)))
+        return bool(state and state[3])